@@ -3,10 +3,10 @@ from logging.handlers import RotatingFileHandler, SMTPHandler
 import os
 import os.path as op
 from flask import Flask, redirect, url_for
-from flask_admin import Admin, AdminIndexView
+from flask_admin import Admin, AdminIndexView, expose
 from flask_admin.form import SecureForm
 from flask_admin.menu import MenuLink
-from flask_admin.contrib.fileadmin import FileAdmin
+from flask_admin.contrib.fileadmin import BaseFileAdmin, FileAdmin, LocalFileStorage
 from flask_admin.contrib.sqla import ModelView
 from flask_bootstrap import Bootstrap5
 from flask_ckeditor import CKEditor
@@ -15,6 +15,16 @@ from flask_mail import Mail
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from config import config
+from app.image_pipeline import ImagePipeline
+from app.last_seen import LastSeenBuffer
+from app.mail_queue import MailQueue
+from app.media_store import MediaStore
+from app.metrics import RequestMetrics
+from app.password_hasher import PasswordHasher
+from app.query_stats import QueryStats
+from app.renditions import RenditionCache
+from app.request_profiler import RequestProfiler
+from app.token_cache import TokenCache
 
 admin = Admin(name='EMB Admin', template_mode='bootstrap4')
 
@@ -37,19 +47,78 @@ class MyAdminIndexView(AdminIndexView):
         return redirect(url_for("auth_bp.login"))
 
 
+class LazyFileStorage(LocalFileStorage):
+    """Local storage of a directory that is created by its first write."""
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.separator = os.sep
+
+    def path_exists(self, path):
+        return path == self.base_path or super().path_exists(path)
+
+    def get_files(self, path, directory):
+        if not op.isdir(directory):
+            return []
+        return super().get_files(path, directory)
+
+
+class ProfileFileAdmin(BaseFileAdmin):
+    can_upload = False
+    can_mkdir = False
+    can_rename = False
+
+    def __init__(self, base_path, *args, **kwargs):
+        # the profiler creates the directory when it saves the first profile
+        super().__init__(*args, storage=LazyFileStorage(base_path), **kwargs)
+
+    def is_accessible(self):
+        return current_user.is_administrator()
+
+    def inaccessible_callback(self, name, **kwargs):
+        return redirect(url_for("auth_bp.login"))
+
+    @expose("/token/")
+    def token(self):
+        token = request_profiler.make_token(current_user)
+        usage = (f"{token}\n\nSend it as the X-EMB-Profile header or the _profile query argument, e.g.\n"
+                 f"curl -H 'X-EMB-Profile: {token}' https://<host>/post/\n")
+        return usage, 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+
 bootstrap = Bootstrap5()
 
 ckeditor = CKEditor()
 
 db = SQLAlchemy()
 
+image_pipeline = ImagePipeline()
+
 login_manager = LoginManager()
 login_manager.login_view = "auth_bp.login"
 
+last_seen_buffer = LastSeenBuffer()
+
 mail = Mail()
 
+mail_queue = MailQueue()
+
+media_store = MediaStore()
+
 moment = Moment()
 
+password_hasher = PasswordHasher()
+
+query_stats = QueryStats()
+
+rendition_cache = RenditionCache()
+
+request_metrics = RequestMetrics()
+
+request_profiler = RequestProfiler()
+
+token_cache = TokenCache()
+
 
 def create_app(config_name):
     app = Flask(__name__)
@@ -60,9 +129,19 @@ def create_app(config_name):
     bootstrap.init_app(app)
     ckeditor.init_app(app)
     db.init_app(app)
+    image_pipeline.init_app(app)
+    last_seen_buffer.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app)
+    mail_queue.init_app(app)
+    media_store.init_app(app)
     moment.init_app(app)
+    password_hasher.init_app(app)
+    query_stats.init_app(app)
+    rendition_cache.init_app(app)
+    request_metrics.init_app(app)
+    request_profiler.init_app(app)
+    token_cache.init_app(app)
 
     if app.config["SSL_REDIRECT"]:
         from flask_sslify import SSLify
@@ -80,8 +159,10 @@ def create_app(config_name):
         MyModelView(Post, db.session),
         MyModelView(Role, db.session),
         MyModelView(User, db.session),
-        FileAdmin(path, "/static/", name="Static Files")
+        FileAdmin(path, "/static/", name="Static Files"),
+        ProfileFileAdmin(app.config["EMB_PROFILE_DIR"], name="Request Profiles", endpoint="profiles")
     )
+    admin.add_link(MenuLink(name="Profiling Token", url="/admin/profiles/token/"))
     admin.add_link(MenuLink(name="Public Homepage", url="/"))
 
     from .api_v1 import api_v1_bp as api_v1_blueprint
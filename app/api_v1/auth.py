@@ -1,5 +1,6 @@
 from flask import g, jsonify
 from flask_httpauth import HTTPBasicAuth
+from app import db, token_cache
 from app.models.users_model import User
 from . import api_v1_bp
 from .errors import unauthorized, forbidden
@@ -12,7 +13,7 @@ def verify_password(email_or_token, password):
     if email_or_token == '':
         return False
     if password == '':
-        g.current_user = User.verify_auth_token(email_or_token)
+        g.current_user = verify_token(email_or_token)
         g.token_used = True
         return g.current_user is not None
     user = User.query.filter_by(email=email_or_token.lower()).first()
@@ -23,6 +24,32 @@ def verify_password(email_or_token, password):
     return user.verify_password(password)
 
 
+def verify_token(token):
+    user, stale = token_cache.get(token)
+    if stale:
+        # another worker may have revoked the token since it was checked
+        auth_version = db.session.query(User.auth_version).filter_by(id=user.id).scalar()
+        if auth_version != user.auth_version:
+            token_cache.invalidate(user.id)
+            return None
+        token_cache.checked(token)
+    elif user is None:
+        data = User.decode_auth_token(token)
+        if data is None:
+            return None
+        user_id, expires_at, auth_version = data
+        user = User.query.get(user_id)
+        if user is None or user.auth_version != auth_version:
+            return None
+        # detach the user and its role so the cached copies outlive this session
+        role = user.role
+        db.session.expunge(user)
+        if role is not None:
+            db.session.expunge(role)
+        token_cache.set(token, user, expires_at)
+    return db.session.merge(user, load=False)
+
+
 @auth.error_handler
 def auth_error():
     return unauthorized('Invalid credentials')
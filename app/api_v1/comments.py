@@ -1,14 +1,24 @@
 from flask import jsonify, request, g, url_for, current_app
 from app import db
+from app.decorators import query_budget
 from app.models.comments_model import Comment
 from app.models.roles_model import Permission
 from app.models.posts_model import Post
 from . import api_v1_bp
 from .decorators import permission_required
+from .pagination import paginate_by_cursor
+from .serializers import comments_to_json
 
 
 @api_v1_bp.route('/comments/')
+@query_budget(2)
 def get_comments():
+    keyset = paginate_by_cursor(Comment.query, Comment.timestamp, Comment.id, 'api_v1_bp.get_comments',
+                                current_app.config['EMB_COMMENTS_PER_PAGE'])
+    if keyset is not None:
+        comments, prev, next_page = keyset
+        return jsonify({'comments': comments_to_json(comments), 'prev': prev, 'next': next_page})
+
     page = request.args.get('page', 1, type=int)
     pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(
         page,
@@ -25,7 +35,7 @@ def get_comments():
         next_page = url_for('api_v1_bp.get_comments', page=page+1)
 
     return jsonify({
-        'comments': [comment.to_json() for comment in comments],
+        'comments': comments_to_json(comments),
         'prev': prev,
         'next': next_page,
         'count': pagination.total,
@@ -33,14 +43,22 @@ def get_comments():
 
 
 @api_v1_bp.route('/comments/<int:id>')
+@query_budget(1)
 def get_comment(id):
     comment = Comment.query.get_or_404(id)
     return jsonify(comment.to_json())
 
 
 @api_v1_bp.route('/posts/<int:id>/comments/')
+@query_budget(3)
 def get_post_comments(id):
     post = Post.query.get_or_404(id)
+    keyset = paginate_by_cursor(post.comments, Comment.timestamp, Comment.id, 'api_v1_bp.get_post_comments',
+                                current_app.config['EMB_COMMENTS_PER_PAGE'], descending=False, id=id)
+    if keyset is not None:
+        comments, prev, next_page = keyset
+        return jsonify({'comments': comments_to_json(comments), 'prev': prev, 'next': next_page})
+
     page = request.args.get('page', 1, type=int)
     pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(
         page,
@@ -55,7 +73,7 @@ def get_post_comments(id):
     if pagination.has_next:
         next_page = url_for('api_v1_bp.get_post_comments', id=id, page=page+1)
     return jsonify({
-        'comments': [comment.to_json() for comment in comments],
+        'comments': comments_to_json(comments),
         'prev': prev,
         'next': next_page,
         'count': pagination.total,
@@ -1,5 +1,5 @@
 from flask import jsonify
-from app.exceptions import ValidationError
+from app.exceptions import HashingOverloadError, ValidationError
 from . import api_v1_bp
 
 
@@ -21,6 +21,17 @@ def forbidden(message):
     return response
 
 
+def service_unavailable(message):
+    response = jsonify({'error': 'service unavailable', 'message': message})
+    response.status_code = 503
+    return response
+
+
+@api_v1_bp.errorhandler(HashingOverloadError)
+def hashing_overload_error(e):
+    return service_unavailable(e.args[0])
+
+
 @api_v1_bp.errorhandler(ValidationError)
 def validation_error(e):
     return bad_request(e.args[0])
@@ -0,0 +1,100 @@
+import base64
+from datetime import datetime
+
+from flask import request, url_for
+from sqlalchemy import and_, or_
+
+from app.exceptions import ValidationError
+
+
+def encode_cursor(direction, timestamp, id):
+    raw = f"{direction}|{timestamp.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        direction, timestamp, id = base64.urlsafe_b64decode(padded).decode().split("|")
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(timestamp), int(id)
+    except ValueError:
+        raise ValidationError("Invalid cursor.")
+
+
+class KeysetPagination:
+    """One page of a query walked by (timestamp, id) instead of OFFSET.
+
+    No total count is computed, so every page costs the same index range scan.
+    """
+
+    def __init__(self, query, timestamp_column, id_column, cursor, per_page, descending=True):
+        self.per_page = per_page
+        self._timestamp_key = timestamp_column.key
+        self._id_key = id_column.key
+
+        direction = "next"
+        if cursor:
+            direction, timestamp, id = decode_cursor(cursor)
+        # walking backwards flips both the comparison and the sort order
+        walk_down = descending == (direction == "next")
+
+        if cursor:
+            if walk_down:
+                query = query.filter(or_(timestamp_column < timestamp,
+                                         and_(timestamp_column == timestamp, id_column < id)))
+            else:
+                query = query.filter(or_(timestamp_column > timestamp,
+                                         and_(timestamp_column == timestamp, id_column > id)))
+        if walk_down:
+            query = query.order_by(None).order_by(timestamp_column.desc(), id_column.desc())
+        else:
+            query = query.order_by(None).order_by(timestamp_column.asc(), id_column.asc())
+
+        items = query.limit(per_page + 1).all()
+        has_more = len(items) > per_page
+        items = items[:per_page]
+        if direction == "prev":
+            items.reverse()
+            self.has_prev = has_more
+            self.has_next = True
+        else:
+            self.has_prev = bool(cursor)
+            self.has_next = has_more
+        self.items = items
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.items:
+            return None
+        return self._cursor("next", self.items[-1])
+
+    @property
+    def prev_cursor(self):
+        if not self.has_prev or not self.items:
+            return None
+        return self._cursor("prev", self.items[0])
+
+    def _cursor(self, direction, item):
+        return encode_cursor(direction, getattr(item, self._timestamp_key), getattr(item, self._id_key))
+
+
+def paginate_by_cursor(query, timestamp_column, id_column, endpoint, per_page, descending=True, **values):
+    """Page query by the request's ?cursor= argument.
+
+    Returns None when the request has no cursor, otherwise the page's items
+    and the URLs of the previous and next pages, built for endpoint with the
+    view arguments in values.
+    """
+    cursor = request.args.get("cursor", type=str)
+    if cursor is None:
+        return None
+    pagination = KeysetPagination(query, timestamp_column, id_column, cursor, per_page, descending)
+    prev = None
+    if pagination.prev_cursor is not None:
+        prev = url_for(endpoint, cursor=pagination.prev_cursor, **values)
+    next_page = None
+    if pagination.next_cursor is not None:
+        next_page = url_for(endpoint, cursor=pagination.next_cursor, **values)
+    return pagination.items, prev, next_page
@@ -1,15 +1,25 @@
 from flask import jsonify, request, g, url_for, current_app
 from app import db
+from app.decorators import query_budget
 from app.models.roles_model import Permission
 from app.models.posts_model import Post
 
 from . import api_v1_bp
 from .decorators import permission_required
 from .errors import forbidden
+from .pagination import paginate_by_cursor
+from .serializers import posts_to_json
 
 
 @api_v1_bp.route('/posts/')
+@query_budget(2)
 def get_posts():
+    keyset = paginate_by_cursor(Post.query, Post.timestamp, Post.id, 'api_v1_bp.get_posts',
+                                current_app.config['EMB_POSTS_PER_PAGE'])
+    if keyset is not None:
+        posts, prev, next_page = keyset
+        return jsonify({'posts': posts_to_json(posts), 'prev': prev, 'next': next_page})
+
     page = request.args.get('page', 1, type=int)
     pagination = Post.query.paginate(
         page,
@@ -26,7 +36,7 @@ def get_posts():
         next_page = url_for('api_v1_bp.get_posts', page=page+1)
 
     return jsonify({
-        'posts': [post.to_json() for post in posts],
+        'posts': posts_to_json(posts),
         'prev': prev,
         'next': next_page,
         'count': pagination.total,
@@ -34,6 +44,7 @@ def get_posts():
 
 
 @api_v1_bp.route('/posts/<int:id>/')
+@query_budget(1)
 def get_post(id):
     post = Post.query.get_or_404(id)
     return jsonify(post.to_json())
@@ -0,0 +1,53 @@
+from flask import url_for
+
+# ids no row has, built into a url and replaced with a format field
+_PLACEHOLDER_IDS = (2147483647, 2147483646)
+
+
+def url_template(endpoint):
+    """Return endpoint's url as a str.format() template with an {id} field.
+
+    Returns None when the url cannot be templated, e.g. when the placeholder's
+    digits also occur elsewhere in it; the template is checked against
+    url_for with a second id.
+    """
+    placeholder, check = _PLACEHOLDER_IDS
+    url = url_for(endpoint, id=placeholder).replace("{", "{{").replace("}", "}}")
+    if url.count(str(placeholder)) != 1:
+        return None
+    template = url.replace(str(placeholder), "{id}")
+    if template.format(id=check) != url_for(endpoint, id=check):
+        return None
+    return template
+
+
+class UrlTemplates:
+    """Stands in for url_for in the models' to_json(), building each
+    endpoint's url once and formatting the row ids into it."""
+
+    def __init__(self):
+        self._templates = {}
+
+    def __call__(self, endpoint, id):
+        if endpoint not in self._templates:
+            self._templates[endpoint] = url_template(endpoint)
+        template = self._templates[endpoint]
+        if template is None:
+            return url_for(endpoint, id=id)
+        return template.format(id=id)
+
+
+def posts_to_json(posts):
+    """Serialize a page of posts with Post.to_json.
+
+    Each url is built once per page, and nothing beyond the post rows
+    themselves is read, so a page costs no queries of its own.
+    """
+    urls = UrlTemplates()
+    return [post.to_json(url_for=urls) for post in posts]
+
+
+def comments_to_json(comments):
+    """Serialize a page of comments with Comment.to_json, see posts_to_json."""
+    urls = UrlTemplates()
+    return [comment.to_json(url_for=urls) for comment in comments]
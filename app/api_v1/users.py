@@ -1,18 +1,29 @@
 from flask import jsonify, request, current_app, url_for
 from . import api_v1_bp
+from .pagination import paginate_by_cursor
+from .serializers import posts_to_json
+from app.decorators import query_budget
 from app.models.posts_model import Post
 from app.models.users_model import User
 
 
 @api_v1_bp.route('/users/<int:id>/')
+@query_budget(1)
 def get_user(id):
     user = User.query.get_or_404(id)
     return jsonify(user.to_json())
 
 
 @api_v1_bp.route('/users/<int:id>/posts/')
+@query_budget(3)
 def get_user_posts(id):
     user = User.query.get_or_404(id)
+    keyset = paginate_by_cursor(user.posts, Post.timestamp, Post.id, 'api_v1_bp.get_user_posts',
+                                current_app.config['EMB_POSTS_PER_PAGE'], id=id)
+    if keyset is not None:
+        posts, prev, next_page = keyset
+        return jsonify({'posts': posts_to_json(posts), 'prev': prev, 'next': next_page})
+
     page = request.args.get('page', 1, type=int)
     pagination = user.posts.order_by(Post.timestamp.desc()).paginate(
         page,
@@ -29,7 +40,7 @@ def get_user_posts(id):
         next_page = url_for('api_v1_bp.get_user_posts', id=id, page=page+1)
 
     return jsonify({
-        'posts': [post.to_json() for post in posts],
+        'posts': posts_to_json(posts),
         'prev': prev,
         'next': next_page,
         'count': pagination.total
@@ -37,10 +48,18 @@ def get_user_posts(id):
 
 
 @api_v1_bp.route('/users/<int:id>/timeline/')
+@query_budget(4)
 def get_user_followed_posts(id):
     user = User.query.get_or_404(id)
+    query, timestamp, post_id = user.followed_timeline()
+    keyset = paginate_by_cursor(query, timestamp, post_id, 'api_v1_bp.get_user_followed_posts',
+                                current_app.config['EMB_POSTS_PER_PAGE'], id=id)
+    if keyset is not None:
+        posts, prev, next_page = keyset
+        return jsonify({'posts': posts_to_json(posts), 'prev': prev, 'next': next_page})
+
     page = request.args.get('page', 1, type=int)
-    pagination = user.followed_posts.order_by(Post.timestamp.desc()).paginate(
+    pagination = user.followed_posts.paginate(
         page,
         per_page=current_app.config['EMB_POSTS_PER_PAGE'],
         error_out=False,
@@ -55,7 +74,7 @@ def get_user_followed_posts(id):
         next_page = url_for('api_v1_bp.get_user_followed_posts', id=id, page=page+1)
 
     return jsonify({
-        'posts': [post.to_json() for post in posts],
+        'posts': posts_to_json(posts),
         'prev': prev,
         'next': next_page,
         'count': pagination.total
@@ -1,12 +1,6 @@
-from threading import Thread
 from flask import current_app, render_template
 from flask_mail import Message
-from .. import mail
-
-
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+from .. import mail_queue
 
 
 def send_email(to, subject, template, **kwargs):
@@ -15,7 +9,7 @@ def send_email(to, subject, template, **kwargs):
                   sender=app.config['EMB_MAIL_SENDER'], recipients=[to])
     msg.body = render_template(template + '.txt', **kwargs)
     msg.html = render_template(template + '.html', subject=subject, **kwargs)
-    Thread(target=send_async_email, args=(app, msg)).start()
+    mail_queue.send(msg)
 
 
 def send_password_reset_email(user):
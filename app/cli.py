@@ -1,3 +1,4 @@
+import glob
 import os
 import sys
 
@@ -51,6 +52,72 @@ def register(app):
                                           profile_dir=profile_dir)
         app.run(debug=False)
 
+    @app.cli.command()
+    def recount():
+        """Recompute the denormalized post, comment and follow counters
+        and switch authors between timeline fan-out modes."""
+        from app.models.users_model import User
+        User.recount()
+        User.update_fanout_modes()
+
+    @app.cli.command("media-gc")
+    def media_gc():
+        """Delete stored images that nothing references anymore."""
+        from app.models.media_model import MediaBlob
+        removed = MediaBlob.collect_garbage()
+        print(f"Removed {removed} unreferenced images.")
+
+    @app.cli.command()
+    @click.option("--users", default=1000, help="Number of users to create.")
+    @click.option("--posts", default=10000, help="Number of posts to create.")
+    @click.option("--comments", default=30000, help="Number of comments to create.")
+    @click.option("--follows", default=20, help="Average number of users each user follows.")
+    @click.option("--seed", default=0, help="Random seed, the same seed creates the same data.")
+    @click.option("--batch-size", default=10000, help="Rows per INSERT batch.")
+    @click.option("--password", default="password", help="Password of every created user.")
+    def seed(users, posts, comments, follows, seed, batch_size, password):
+        """Fill the database with synthetic users, posts, comments and follows."""
+        from app.fake import bulk_seed
+        bulk_seed(users=users, posts=posts, comments=comments, follows=follows, seed=seed,
+                  batch_size=batch_size, password=password)
+
+    @app.cli.command("query-report")
+    @click.option("--limit", default=20, help="Number of statements to list.")
+    @click.option("--sort", type=click.Choice(["total", "mean", "max", "count"]), default="total",
+                  help="Order statements by this figure.")
+    @click.option("--samples/--no-samples", default=False, help="Show the captured slow and sampled queries.")
+    @click.option("--plans/--no-plans", default=False, help="Show the captured query plans.")
+    @click.option("--reset", is_flag=True, help="Delete the collected statistics afterwards.")
+    def query_report(limit, sort, samples, plans, reset):
+        """Show the slowest SQL statements recorded by the running app."""
+        from app.query_stats import QueryStats
+        directory = app.config["EMB_QUERY_STATS_DIR"]
+        if directory is None:
+            raise click.ClickException("EMB_QUERY_STATS_DIR is not set, no statistics are recorded")
+        queries = QueryStats.load(directory)
+        for stats in queries.values():
+            stats["mean"] = stats["total"] / stats["count"]
+        ranked = sorted(queries.items(), key=lambda item: item[1][sort], reverse=True)[:limit]
+
+        print(f"{'count':>9} {'total s':>10} {'mean ms':>9} {'max ms':>9}  statement")
+        for statement, stats in ranked:
+            print(f"{stats['count']:>9} {stats['total']:>10.3f} {stats['mean'] * 1000:>9.2f} "
+                  f"{stats['max'] * 1000:>9.2f}  {statement[:200]}")
+            plan = stats.get("plan")
+            if plan and plan["full_scans"]:
+                print(f"{'':>41}FULL SCAN of {', '.join(plan['full_scans'])}")
+            if plans and plan:
+                for line in plan["plan"].splitlines():
+                    print(f"{'':>41}| {line}")
+            if samples:
+                for sample in sorted(stats["samples"], key=lambda s: s["duration"], reverse=True):
+                    print(f"{'':>41}{'slow' if sample['slow'] else 'sampled'} {sample['duration'] * 1000:.2f} ms "
+                          f"at {sample['context']} ({sample['endpoint']}) {sample['parameters'][:200]}")
+
+        if reset:
+            for path in glob.glob(os.path.join(directory, "*.json")):
+                os.remove(path)
+
     @app.cli.command()
     def deploy():
         """Run development tasks."""
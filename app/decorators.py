@@ -1,6 +1,7 @@
 from functools import wraps
-from flask import abort
+from flask import abort, current_app, g, request
 from flask_login import current_user
+from .exceptions import QueryBudgetExceeded
 from .models.roles_model import Permission
 
 
@@ -17,3 +18,28 @@ def permission_required(permission):
 
 def admin_required(f):
     return permission_required(Permission.ADMIN)(f)
+
+
+def query_budget(queries):
+    """Declare that the view issues at most `queries` SQL statements.
+
+    The statements of the view body and the templates it renders are counted,
+    not those of before_request handlers such as loading the user. Going over
+    budget raises QueryBudgetExceeded when EMB_QUERY_BUDGET_RAISE is set, as
+    in the tests, and logs a warning otherwise.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            start = g.get("db_query_count", 0)
+            rv = f(*args, **kwargs)
+            count = g.get("db_query_count", 0) - start
+            if count > queries:
+                message = f"{request.endpoint} issued {count} queries, its budget is {queries}"
+                if current_app.config["EMB_QUERY_BUDGET_RAISE"]:
+                    raise QueryBudgetExceeded(message)
+                current_app.logger.warning(message)
+            return rv
+        decorated_function.query_budget = queries
+        return decorated_function
+    return decorator
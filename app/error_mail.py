@@ -0,0 +1,169 @@
+import atexit
+import logging
+import os
+import traceback
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, SMTPHandler
+from queue import Full, Queue
+from threading import Timer
+from time import monotonic
+
+
+def fingerprint(record):
+    """Identify records caused by the same fault.
+
+    Records with a traceback are grouped by exception type and the code
+    locations of the traceback, so that the varying parts of the message (the
+    request path, ids) do not split a fault into many groups. Others are
+    grouped by where they were logged and their unformatted message.
+    """
+    if record.exc_info and record.exc_info[0] is not None:
+        exc_type, _, tb = record.exc_info
+        frames = tuple((frame.filename, frame.lineno, frame.name) for frame in traceback.extract_tb(tb))
+        return exc_type.__module__, exc_type.__qualname__, frames
+    return record.name, record.pathname, record.lineno, str(record.msg)
+
+
+class ErrorMailHandler(SMTPHandler):
+    """SMTPHandler that lets a record override the mail subject."""
+
+    def getSubject(self, record):
+        return getattr(record, "mail_subject", self.subject)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the logging thread.
+
+    Records are fingerprinted before QueueHandler.prepare() folds the
+    traceback into the message, and dropped while the queue is full. The
+    listener is started with the first record so that pre-forking servers run
+    it in each worker.
+    """
+
+    def __init__(self, queue, listener):
+        super().__init__(queue)
+        self.listener = listener
+        self.dropped = 0
+        self._pid = None
+
+    def prepare(self, record):
+        fp = fingerprint(record)
+        record = super().prepare(record)
+        record.fingerprint = fp
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            with self.lock:
+                if self._pid != os.getpid():
+                    self.listener.start()
+                    self._pid = os.getpid()
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class DigestHandler(logging.Handler):
+    """Forwards the first record of each fault and batches its repeats.
+
+    A fault's first record is handed to the target right away. Identical
+    records in the following `window` seconds are counted and sent as one
+    digest record when the window closes.
+    """
+
+    def __init__(self, target, window, subject, dropped=lambda: 0):
+        super().__init__()
+        self.target = target
+        self.window = window
+        self.subject = subject
+        self.dropped = dropped
+        self._dropped_reported = 0
+        self._quiet_until = {}
+        self._repeats = {}
+        self._timer = None
+
+    def emit(self, record):
+        key = getattr(record, "fingerprint", None) or fingerprint(record)
+        now = monotonic()
+        if self._quiet_until.get(key, 0) <= now:
+            self._quiet_until[key] = now + self.window
+            self.target.handle(record)
+            return
+
+        repeat = self._repeats.get(key)
+        if repeat is None:
+            self._repeats[key] = [1, record, record]
+        else:
+            repeat[0] += 1
+            repeat[2] = record
+        if self._timer is None:
+            self._timer = Timer(self.window, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            repeats, self._repeats = self._repeats, {}
+            now = monotonic()
+            self._quiet_until = {key: until for key, until in self._quiet_until.items() if until > now}
+            dropped = self.dropped() - self._dropped_reported
+            self._dropped_reported += dropped
+        finally:
+            self.release()
+        if repeats or dropped:
+            self.target.handle(self._digest(repeats.values(), dropped))
+
+    def close(self):
+        self.flush()
+        super().close()
+
+    def _digest(self, repeats, dropped):
+        total = sum(count for count, _, _ in repeats)
+        lines = [f"{total} repeated errors in the last {self.window} seconds."]
+        if dropped:
+            lines.append(f"{dropped} more errors were dropped because the error mail queue was full.")
+        for count, first, last in sorted(repeats, key=lambda repeat: -repeat[0]):
+            lines += [
+                "",
+                "-" * 72,
+                f"{count} x {first.levelname} in {first.name}, "
+                f"{datetime.fromtimestamp(first.created):%H:%M:%S} - {datetime.fromtimestamp(last.created):%H:%M:%S}",
+                "",
+                last.getMessage(),
+            ]
+        record = logging.makeLogRecord({
+            "name": __name__,
+            "levelno": logging.ERROR,
+            "levelname": "ERROR",
+            "msg": "\n".join(lines),
+        })
+        record.mail_subject = f"{self.subject} digest ({total} errors)"
+        return record
+
+
+def install_error_mail(app, mail_handler, window, queue_size):
+    """Send app.logger errors through mail_handler without blocking requests.
+
+    Errors are put on a bounded queue and mailed from a listener thread with
+    repeats of the same fault batched into digests every `window` seconds.
+    """
+    queue = Queue(queue_size)
+    digest_handler = DigestHandler(mail_handler, window, mail_handler.subject)
+    listener = QueueListener(queue, digest_handler)
+    queue_handler = DroppingQueueHandler(queue, listener)
+    queue_handler.setLevel(mail_handler.level)
+    digest_handler.dropped = lambda: queue_handler.dropped
+    app.logger.addHandler(queue_handler)
+
+    def stop():
+        if queue_handler._pid == os.getpid():
+            listener.stop()
+        digest_handler.close()
+
+    atexit.register(stop)
+    return listener
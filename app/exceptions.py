@@ -1,2 +1,10 @@
 class ValidationError(ValueError):
     pass
+
+
+class HashingOverloadError(RuntimeError):
+    pass
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
@@ -1,11 +1,20 @@
-from random import randrange
+from datetime import datetime, timedelta
+from random import Random, randrange
+from time import monotonic
+
 from sqlalchemy.exc import IntegrityError
 from faker import Faker
 from app import db
-from app.models.posts_model import Post
+from app.models.posts_model import DEFAULT_IMAGE_VARIANTS, Post
 from app.models.users_model import User
 
 
+# a domain of the project rather than a real mail provider, so seeded accounts
+# never reach anyone; reserved domains such as example.com fail the Email()
+# validator of the login form
+SEED_EMAIL_DOMAIN = "emb.dev"
+
+
 def users(count=100):
     fake = Faker()
     i = 0
@@ -43,3 +52,153 @@ def posts(count=100):
         )
         db.session.add(post)
     db.session.commit()
+
+
+def _power_law_cum_weights(n, exponent, rng):
+    """Cumulative Zipf weights over n ids in random order, for rng.choices()."""
+    ranks = list(range(1, n + 1))
+    rng.shuffle(ranks)
+    cum_weights, total = [], 0.0
+    for rank in ranks:
+        total += rank ** -exponent
+        cum_weights.append(total)
+    return cum_weights
+
+
+def bulk_seed(users=1000, posts=10000, comments=30000, follows=20, seed=0, batch_size=10000,
+              password="password", end=datetime(2022, 5, 1), days=3 * 365, progress=print):
+    """Insert synthetic users, posts, comments and follows with batched core inserts.
+
+    Post authorship and follower counts follow power laws, so a few users
+    write most posts and have most followers. follows is the average number
+    of users each user follows. Every user gets the password `password`,
+    hashed once. The same seed produces the same rows on an empty database.
+    ORM events do not fire for core inserts, so the counters and timelines
+    are rebuilt at the end.
+    """
+    from app import password_hasher
+    from app.models.comments_model import Comment
+    from app.models.follows_model import Follow
+    from app.models.roles_model import Role
+    from app.models.timeline_model import TimelineEntry
+    from app.sanitizer import comment_sanitizer, make_excerpt, post_sanitizer
+
+    rng = Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    start = end - timedelta(days=days)
+    span = int((end - start).total_seconds())
+
+    def insert(table, rows):
+        started = monotonic()
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                db.session.execute(table.insert(), batch)
+                db.session.commit()
+                count += len(batch)
+                batch = []
+        if batch:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            count += len(batch)
+        progress(f"Inserted {count} rows into {table.name} in {monotonic() - started:.1f}s")
+
+    def next_id(model):
+        return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+    # a pool of generated texts, sanitized once, so rows cost no Faker or bleach calls
+    titles = [fake.sentence(nb_words=8)[:128] for _ in range(500)]
+    raw_bodies = ["".join(f"<p>{fake.paragraph(nb_sentences=6)}</p>\n" for _ in range(rng.randint(2, 8)))
+                  for _ in range(200)]
+    bodies = post_sanitizer.clean_many(raw_bodies)
+    excerpts = [make_excerpt(body) for body in bodies]
+    raw_comments = [f"<p>{fake.sentence(nb_words=rng.randint(4, 30))}</p>" for _ in range(500)]
+    comment_bodies = comment_sanitizer.clean_many(raw_comments)
+    names = [(fake.user_name(), fake.name(), fake.city()) for _ in range(1000)]
+    about = [fake.text(max_nb_chars=200) for _ in range(200)]
+
+    role_id = Role.query.filter_by(default=True).first().id
+    password_hash = password_hasher.hash(password)
+    first_user, first_post, first_comment = next_id(User), next_id(Post), next_id(Comment)
+    user_ids = range(first_user, first_user + users)
+
+    def user_rows():
+        for i in user_ids:
+            username, name, city = names[i % len(names)]
+            member_since = start + timedelta(seconds=rng.randrange(span))
+            yield {
+                "id": i, "username": f"{username}{i}", "name": name, "email": f"{username}{i}@{SEED_EMAIL_DOMAIN}",
+                "confirmed": True, "password_hash": password_hash, "location": city,
+                "about_me": about[i % len(about)], "member_since": member_since,
+                "last_seen": member_since + timedelta(seconds=rng.randrange(int((end - member_since).total_seconds()) + 1)),
+                "premium_account": rng.random() < 0.1, "role_id": role_id,
+                "profile_image": "default_profile_image.jpg",
+                "post_count": 0, "follower_count": 0, "followed_count": 0, "fanout_on_read": False,
+                "fanout_on_read_followed_count": 0,
+            }
+
+    insert(User.__table__, user_rows())
+
+    popularity = _power_law_cum_weights(users, 1.0, rng)
+
+    def follow_rows():
+        for follower in user_ids:
+            # out-degrees are heavy tailed too, with the requested mean
+            degree = min(users - 1, int(rng.paretovariate(2.0) * follows / 2))
+            followed = {user_ids[i] for i in rng.choices(range(users), cum_weights=popularity, k=degree)}
+            followed.discard(follower)
+            for user_id in sorted(followed):
+                yield {"follower_id": follower, "followed_id": user_id,
+                       "timestamp": start + timedelta(seconds=rng.randrange(span))}
+
+    insert(Follow.__table__, follow_rows())
+
+    activity = _power_law_cum_weights(users, 1.0, rng)
+    post_times = []
+
+    def post_rows():
+        for i in range(first_post, first_post + posts):
+            body = rng.randrange(len(bodies))
+            offset = rng.randrange(span)
+            post_times.append(offset)
+            yield {
+                "id": i, "title": titles[rng.randrange(len(titles))], "raw_body": raw_bodies[body],
+                "body": bodies[body], "excerpt": excerpts[body], "timestamp": start + timedelta(seconds=offset),
+                "author_id": user_ids[rng.choices(range(users), cum_weights=activity)[0]],
+                "image": "default_post_image.jpg", "image_variants": DEFAULT_IMAGE_VARIANTS, "comment_count": 0,
+            }
+
+    insert(Post.__table__, post_rows())
+
+    def comment_rows():
+        for i in range(first_comment, first_comment + comments):
+            post = rng.randrange(posts)
+            body = rng.randrange(len(comment_bodies))
+            offset = post_times[post] + rng.randrange(max(1, span - post_times[post]))
+            yield {
+                "id": i, "raw_body": raw_comments[body], "body": comment_bodies[body],
+                "timestamp": start + timedelta(seconds=offset), "disabled": rng.random() < 0.005,
+                "author_id": rng.choice(user_ids), "post_id": first_post + post,
+            }
+
+    if posts:
+        insert(Comment.__table__, comment_rows())
+
+    started = monotonic()
+    User.recount()
+    User.update_fanout_modes()
+    # fan the new posts out to their authors and, unless fanned out on read, their followers
+    timeline = TimelineEntry.__table__
+    columns = ["user_id", "post_id", "author_id", "timestamp"]
+    db.session.execute(timeline.insert().from_select(
+        columns, db.select(Post.author_id, Post.id, Post.author_id, Post.timestamp).where(Post.id >= first_post)))
+    db.session.execute(timeline.insert().from_select(
+        columns, db.select(Follow.follower_id, Post.id, Post.author_id, Post.timestamp)
+        .join(Follow, Follow.followed_id == Post.author_id)
+        .join(User, User.id == Post.author_id)
+        .where(Post.id >= first_post, User.fanout_on_read.is_(False), Follow.follower_id != Post.author_id)))
+    db.session.commit()
+    progress(f"Rebuilt counters and timelines in {monotonic() - started:.1f}s")
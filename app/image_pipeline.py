@@ -0,0 +1,60 @@
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from flask import current_app
+
+
+class ImagePipeline:
+    """Processes uploaded images in background threads.
+
+    submit() stores the raw upload under the instance folder and returns
+    immediately. A worker then calls the task with the stored file's path and
+    removes the file afterwards. With EMB_IMAGE_WORKERS set to 0 tasks run
+    inline in the request.
+    """
+
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EMB_IMAGE_WORKERS", 2)
+        app.config.setdefault("EMB_IMAGE_UPLOAD_DIR", os.path.join(app.instance_path, "pending-images"))
+        app.extensions["image_pipeline"] = self
+
+    def submit(self, upload, task, *args):
+        upload_dir = current_app.config["EMB_IMAGE_UPLOAD_DIR"]
+        os.makedirs(upload_dir, exist_ok=True)
+        source_path = os.path.join(upload_dir, uuid.uuid4().hex)
+        upload.save(source_path)
+
+        if current_app.config["EMB_IMAGE_WORKERS"] == 0:
+            self._run(task, source_path, *args)
+            return
+        app = current_app._get_current_object()
+        self._get_executor().submit(self._run_in_app, app, task, source_path, *args)
+
+    def _run_in_app(self, app, task, source_path, *args):
+        with app.app_context():
+            self._run(task, source_path, *args)
+
+    def _run(self, task, source_path, *args):
+        try:
+            task(source_path, *args)
+        except Exception:
+            current_app.logger.exception("Image processing failed")
+        finally:
+            os.remove(source_path)
+
+    def _get_executor(self):
+        # created lazily so that pre-forking servers start the threads in each worker
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=current_app.config["EMB_IMAGE_WORKERS"],
+                    thread_name_prefix="image-pipeline")
+            return self._executor
@@ -0,0 +1,111 @@
+import atexit
+from datetime import datetime
+from threading import Lock, Timer
+from time import monotonic
+from weakref import WeakKeyDictionary
+
+from flask import current_app
+from sqlalchemy import bindparam
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+class _Batch:
+    """The pings one app has not written yet."""
+
+    def __init__(self):
+        self.pending = {}
+        self.first_ping = None
+        self.timer = None
+
+
+class LastSeenBuffer:
+    """Coalesces User.ping() calls and writes them in one bulk UPDATE.
+
+    Pings are kept in memory per user id and flushed once the oldest one is
+    EMB_LAST_SEEN_PRECISION seconds old, by a timer when no later ping comes,
+    once EMB_LAST_SEEN_BUFFER_SIZE users are pending, and when the worker
+    exits. A failed flush is logged and its pings are kept for the next one.
+    Every app has its own batch.
+    """
+
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self._batches = WeakKeyDictionary()
+        self._exit_hook = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EMB_LAST_SEEN_PRECISION", 60)
+        app.config.setdefault("EMB_LAST_SEEN_BUFFER_SIZE", 500)
+        app.extensions["last_seen_buffer"] = self
+        with self._lock:
+            self._batches[app] = _Batch()
+            if not self._exit_hook:
+                self._exit_hook = True
+                atexit.register(self._flush_at_exit)
+
+    def ping(self, user):
+        now = datetime.utcnow()
+        app = current_app._get_current_object()
+        precision = app.config["EMB_LAST_SEEN_PRECISION"]
+        # show the new value without making the session write it
+        set_committed_value(user, "last_seen", now)
+        with self._lock:
+            batch = self._batches[app]
+            batch.pending[user.id] = now
+            if batch.first_ping is None:
+                batch.first_ping = monotonic()
+                self._schedule(app, batch, precision)
+            due = monotonic() - batch.first_ping >= precision or \
+                len(batch.pending) >= app.config["EMB_LAST_SEEN_BUFFER_SIZE"]
+        if due:
+            self.flush()
+
+    def flush(self):
+        app = current_app._get_current_object()
+        with self._lock:
+            batch = self._batches[app]
+            if batch.timer is not None:
+                batch.timer.cancel()
+                batch.timer = None
+            pending, batch.pending = batch.pending, {}
+            batch.first_ping = None
+        if not pending:
+            return
+
+        from app import db
+        users = db.metadata.tables["users"]
+        statement = users.update() \
+            .where(users.c.id == bindparam("user_id")) \
+            .values(last_seen=bindparam("seen"))
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(statement, [{"user_id": id, "seen": seen} for id, seen in pending.items()])
+        except Exception:
+            app.logger.exception("Could not write last_seen of %d users, retrying with the next flush.",
+                                 len(pending))
+            with self._lock:
+                for id, seen in pending.items():
+                    # keep pings that arrived during the flush
+                    batch.pending.setdefault(id, seen)
+                if batch.first_ping is None:
+                    batch.first_ping = monotonic()
+                    self._schedule(app, batch, app.config["EMB_LAST_SEEN_PRECISION"])
+
+    def _schedule(self, app, batch, delay):
+        # flushes the batch of a worker that gets no more requests
+        if batch.timer is None and delay > 0:
+            batch.timer = Timer(delay, self._flush_in_context, (app,))
+            batch.timer.daemon = True
+            batch.timer.start()
+
+    def _flush_in_context(self, app):
+        with app.app_context():
+            self.flush()
+
+    def _flush_at_exit(self):
+        with self._lock:
+            apps = [app for app, batch in self._batches.items() if batch.pending]
+        for app in apps:
+            self._flush_in_context(app)
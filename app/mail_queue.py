@@ -0,0 +1,187 @@
+import atexit
+import smtplib
+from contextlib import ExitStack
+from queue import Empty, Full, Queue
+from threading import Lock, Thread, Timer
+from time import monotonic
+
+from flask import current_app
+
+
+class _Outgoing:
+    __slots__ = ("message", "attempts")
+
+    def __init__(self, message):
+        self.message = message
+        self.attempts = 0
+
+
+class MailQueue:
+    """Bounded outbound mail queue drained by a small pool of SMTP workers.
+
+    send() only enqueues the message. Each worker keeps one mail.connect()
+    connection open while messages keep arriving, sending up to
+    EMB_MAIL_BATCH_SIZE of them over it before reconnecting, and closes it
+    after EMB_MAIL_IDLE_TIMEOUT seconds without mail. Failed deliveries are
+    retried with exponential backoff. When the queue holds EMB_MAIL_QUEUE_SIZE
+    messages send() drops the message right away, counting it in stats(), so
+    a stuck SMTP server never holds up a request. With EMB_MAIL_WORKERS set to
+    0 mail is sent inline.
+    """
+
+    # the server refused the message itself, sending it again will not help
+    PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, AssertionError)
+
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self._queue = None
+        self._workers = []
+        self._retrying = 0
+        self._counts = {"sent": 0, "retried": 0, "failed": 0, "dropped": 0, "connections": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EMB_MAIL_WORKERS", 2)
+        app.config.setdefault("EMB_MAIL_QUEUE_SIZE", 1000)
+        app.config.setdefault("EMB_MAIL_BATCH_SIZE", 100)
+        app.config.setdefault("EMB_MAIL_IDLE_TIMEOUT", 5.0)
+        app.config.setdefault("EMB_MAIL_MAX_RETRIES", 5)
+        app.config.setdefault("EMB_MAIL_RETRY_BACKOFF", 2.0)
+        app.extensions["mail_queue"] = self
+        atexit.register(self.join, 10)
+
+    @property
+    def depth(self):
+        """Messages waiting to be sent, including those backing off before a retry."""
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return queued + self._retrying
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        capacity = self._queue.maxsize if self._queue is not None else current_app.config["EMB_MAIL_QUEUE_SIZE"]
+        return dict(counts, depth=self.depth, capacity=capacity, workers=len(self._workers))
+
+    def send(self, message):
+        """Queue message for delivery, returning False if it had to be dropped."""
+        config = current_app.config
+        if config["EMB_MAIL_WORKERS"] == 0:
+            from app import mail
+            mail.send(message)
+            self._count("sent")
+            return True
+
+        self._start_workers()
+        try:
+            self._queue.put_nowait(_Outgoing(message))
+        except Full:
+            self._count("dropped")
+            current_app.logger.error("Mail queue is full (%d messages), dropped mail to %s",
+                                     self.depth, ", ".join(message.recipients))
+            return False
+        return True
+
+    def join(self, timeout=None):
+        """Wait until the queue is drained and no retry is pending, returning
+        False on timeout."""
+        if self._queue is None:
+            return True
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _start_workers(self):
+        # started lazily so that pre-forking servers start the threads in each worker
+        with self._lock:
+            if self._workers:
+                return
+            app = current_app._get_current_object()
+            self._queue = Queue(maxsize=app.config["EMB_MAIL_QUEUE_SIZE"])
+            for i in range(app.config["EMB_MAIL_WORKERS"]):
+                worker = Thread(target=self._work, args=(app,), name=f"mail-queue-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self, app):
+        with app.app_context():
+            while True:
+                self._send_batch(self._queue.get())
+
+    def _send_batch(self, item):
+        from app import mail
+        config = current_app.config
+        stack = None
+        try:
+            for sent in range(1, config["EMB_MAIL_BATCH_SIZE"] + 1):
+                try:
+                    if stack is None:
+                        stack = ExitStack()
+                        connection = stack.enter_context(mail.connect())
+                        self._count("connections")
+                    connection.send(item.message)
+                    self._count("sent")
+                    self._queue.task_done()
+                except Exception as e:
+                    # a retried message stays unfinished until it is requeued
+                    if not self._failed(item, e):
+                        self._queue.task_done()
+                    # the connection may be unusable, open a fresh one
+                    stack = self._close(stack)
+
+                if sent == config["EMB_MAIL_BATCH_SIZE"]:
+                    break
+                try:
+                    item = self._queue.get(timeout=config["EMB_MAIL_IDLE_TIMEOUT"])
+                except Empty:
+                    break
+        finally:
+            self._close(stack)
+
+    def _close(self, stack):
+        if stack is not None:
+            try:
+                stack.close()
+            except (smtplib.SMTPException, OSError):
+                pass
+        return None
+
+    def _failed(self, item, error):
+        """Schedule a retry of item, returning False if it was given up."""
+        recipients = ", ".join(item.message.recipients)
+        item.attempts += 1
+        if isinstance(error, self.PERMANENT_ERRORS) or item.attempts > current_app.config["EMB_MAIL_MAX_RETRIES"]:
+            self._count("failed")
+            current_app.logger.error("Giving up on mail to %s after %d attempts", recipients, item.attempts,
+                                     exc_info=error)
+            return False
+
+        self._count("retried")
+        delay = current_app.config["EMB_MAIL_RETRY_BACKOFF"] * 2 ** (item.attempts - 1)
+        current_app.logger.warning("Sending mail to %s failed (%s), retrying in %.1fs", recipients, error, delay)
+        with self._lock:
+            self._retrying += 1
+        retry = Timer(delay, self._requeue, (current_app._get_current_object(), item))
+        retry.daemon = True
+        retry.start()
+        return True
+
+    def _requeue(self, app, item):
+        with self._lock:
+            self._retrying -= 1
+        try:
+            self._queue.put_nowait(item)
+        except Full:
+            self._count("dropped")
+            app.logger.error("Mail queue is full, dropped retry of mail to %s", ", ".join(item.message.recipients))
+        # after the put, so that join() never sees the queue drained in between
+        self._queue.task_done()
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
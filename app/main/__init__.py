@@ -3,3 +3,8 @@ from flask import Blueprint
 main_bp = Blueprint("main_bp", __name__)
 
 from . import routes, errors
+from app.media_store import image_url
+from app.renditions import rendition_url
+
+main_bp.add_app_template_global(image_url)
+main_bp.add_app_template_global(rendition_url)
@@ -1,4 +1,6 @@
 from flask import render_template, request, jsonify
+from werkzeug.exceptions import ServiceUnavailable
+from app.exceptions import HashingOverloadError
 from . import main_bp
 
 
@@ -27,3 +29,17 @@ def internal_server_error(e):
         response.status_code = 500
         return response
     return render_template('main/errors.html', error_message=e), 500
+
+
+@main_bp.app_errorhandler(503)
+def service_unavailable(e):
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        response = jsonify({"error": "service unavailable"})
+        response.status_code = 503
+        return response
+    return render_template('main/errors.html', error_message=e), 503
+
+
+@main_bp.app_errorhandler(HashingOverloadError)
+def hashing_overload_error(e):
+    return service_unavailable(ServiceUnavailable("The server is busy. Please try again in a moment."))
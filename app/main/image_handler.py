@@ -1,24 +1,52 @@
-import os
+import io
 
 from PIL import Image, ImageOps
-from flask import current_app
 
+from app import db, image_pipeline, media_store
+from app.models.users_model import User
 
-def change_profile_image(image_upload, username):
-    # filename = img_upload.filename
-    storage_filename = str(username) + "_profile_image.jpg"
-    print(current_app.root_path)
-    filepath = os.path.join(current_app.root_path,
-                            r"static/main/images/profile-images", storage_filename)
+DEFAULT_PROFILE_IMAGE = "default_profile_image.jpg"
+PROCESSING_PROFILE_IMAGE = "processing_profile_image.jpg"
 
-    img = Image.open(image_upload)
 
-    max_size = max(img.size)
-    if max_size > 400:
-        max_size = 400
-    output_size = (max_size, max_size)
+def render_rendition(source_path, target_path, size, fmt):
+    width, height = size
+    img = Image.open(source_path)
+    if img.format == "JPEG":
+        # let the decoder downscale by 1/2, 1/4 or 1/8 instead of decoding every pixel
+        img.draft("RGB", (width, height))
+    img = ImageOps.fit(ImageOps.exif_transpose(img), (width, height), Image.LANCZOS)
+    if fmt == "webp":
+        img.save(target_path, "WEBP", quality=80)
+    else:
+        img.convert("RGB").save(target_path, "JPEG", quality=85, progressive=True)
 
-    img = ImageOps.fit(img, output_size, Image.ANTIALIAS)
-    img.save(filepath)
 
-    return storage_filename
+def change_profile_image(image_upload, user_id):
+    # the user shows PROCESSING_PROFILE_IMAGE until the pipeline has stored the image
+    image_pipeline.submit(image_upload, process_profile_image, user_id)
+
+
+def process_profile_image(source_path, user_id):
+    user = User.query.get(user_id)
+    if user is None:
+        return
+    try:
+        img = Image.open(source_path)
+
+        max_size = max(img.size)
+        if max_size > 400:
+            max_size = 400
+        output_size = (max_size, max_size)
+
+        img = ImageOps.fit(img, output_size, Image.ANTIALIAS)
+        data = io.BytesIO()
+        img.convert("RGB").save(data, "JPEG")
+
+        blob, created = media_store.put(data.getvalue(), "jpg")
+        user.profile_image = blob.key
+    except Exception:
+        user.profile_image = DEFAULT_PROFILE_IMAGE
+        raise
+    finally:
+        db.session.commit()
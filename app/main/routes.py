@@ -1,21 +1,89 @@
-from flask import current_app, render_template
-from flask_login import login_required
-from flask_sqlalchemy import get_debug_queries
+import hmac
+import os
+from ipaddress import ip_address
 
-from app.decorators import admin_required
+from PIL import Image, UnidentifiedImageError, features
+from flask import abort, current_app, render_template, request, send_file, send_from_directory
+from flask_login import current_user
+from werkzeug.security import safe_join
+
+from app import mail_queue, rendition_cache, request_metrics
+from app.main.image_handler import render_rendition
 
 from . import main_bp
 
 
-@main_bp.after_app_request
-def after_request(response):
-    for query in get_debug_queries():
-        if query.duration >= current_app.config['EMB_SLOW_DB_QUERY_TIME']:
-            current_app.logger.warning(
-                f'Slow query: {query.statement}\nParameters: {query.parameters}\nDuration: {query.duration}s\nContext: {query.context}\n')
+@main_bp.route("/media/<path:key>")
+def media(key):
+    max_age = current_app.config["EMB_MEDIA_MAX_AGE"]
+    response = send_from_directory(current_app.config["EMB_MEDIA_ROOT"], key, max_age=max_age)
+    # keys are content hashes, so a url never changes content
+    response.headers["Cache-Control"] = f"public, max-age={max_age}, immutable"
+    return response
+
+
+# static folders holding images uploaded before the media store existed
+LEGACY_IMAGE_FOLDERS = ("post/post-images/", "user/profile-images/")
+
+
+@main_bp.route("/media/renditions/<size>.<fmt>/<path:source>")
+def rendition(size, fmt, source):
+    if size not in current_app.config["EMB_RENDITION_SIZES"]:
+        abort(404)
+    if fmt not in ("jpg", "webp") or fmt == "webp" and not features.check("webp"):
+        abort(404)
+
+    immutable = not source.startswith(LEGACY_IMAGE_FOLDERS)
+    if immutable:
+        source_path = safe_join(current_app.config["EMB_MEDIA_ROOT"], source)
+    else:
+        source_path = safe_join(os.path.join(current_app.root_path, "static"), source)
+    if source_path is None or not os.path.isfile(source_path):
+        abort(404)
+
+    width, height = (int(n) for n in size.split("x"))
+    try:
+        path = rendition_cache.get(source_path, (width, height), fmt, render_rendition)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        # not an image, or a truncated or corrupt one
+        current_app.logger.warning("Could not render %s", source_path, exc_info=True)
+        abort(415)
+    max_age = current_app.config["EMB_MEDIA_MAX_AGE"]
+    response = send_file(path, mimetype="image/webp" if fmt == "webp" else "image/jpeg", max_age=max_age)
+    if immutable:
+        response.headers["Cache-Control"] = f"public, max-age={max_age}, immutable"
     return response
 
 
+def metrics_scraper_allowed():
+    """True when the request carries EMB_METRICS_TOKEN as a bearer token or
+    comes from an address in EMB_METRICS_ALLOWED_IPS."""
+    token = current_app.config["EMB_METRICS_TOKEN"]
+    authorization = request.headers.get("Authorization", "")
+    if token and authorization.startswith("Bearer ") \
+            and hmac.compare_digest(authorization[len("Bearer "):].encode(), token.encode()):
+        return True
+    try:
+        address = ip_address(request.remote_addr or "")
+    except ValueError:
+        return False
+    return any(address in network for network in current_app.config["EMB_METRICS_ALLOWED_IPS"])
+
+
+@main_bp.route("/metrics")
+def metrics():
+    # scraped by Prometheus, which has no session, and viewed by administrators
+    if not (current_user.is_administrator() or metrics_scraper_allowed()):
+        abort(403)
+    mail = mail_queue.stats()
+    body = request_metrics.render(extra=[
+        ("emb_mail_queue_depth", "gauge", "Outgoing mails waiting to be sent.", mail["depth"]),
+        ("emb_mail_sent_total", "counter", "Mails handed to the SMTP server.", mail["sent"]),
+        ("emb_mail_failed_total", "counter", "Mails given up on or dropped.", mail["failed"] + mail["dropped"]),
+    ])
+    return body, 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
 @main_bp.route("/")
 @main_bp.route("/home/")
 def home():
@@ -0,0 +1,122 @@
+import glob
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+from hashlib import blake2b
+
+from flask import current_app, url_for
+from sqlalchemy.exc import IntegrityError
+
+_KEY_NAME = re.compile(r"[0-9a-f]{40}\.\w+")
+_TMP_PREFIX = ".upload-"
+
+
+def is_media_key(filename):
+    """Store keys are "<shard>/<hash>.<ext>", legacy static filenames have no slash."""
+    return filename is not None and "/" in filename
+
+
+def image_url(filename, folder):
+    """Url of an image column value, either a store key or a file in static/<folder>."""
+    if is_media_key(filename):
+        return url_for("main_bp.media", key=filename)
+    return url_for("static", filename=f"{folder}/{filename}")
+
+
+class MediaStore:
+    """Content-addressed image store.
+
+    Files are named by the BLAKE2b hash of their content and sharded by the
+    first two hex digits, so identical uploads are stored once and a key's
+    content never changes. Each file has a MediaBlob row whose refcount is kept
+    by the models that point at it; `flask media-gc` removes unreferenced files
+    and files left without a row by rolled back uploads, once they are
+    EMB_MEDIA_GC_GRACE seconds old.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EMB_MEDIA_ROOT", os.path.join(app.instance_path, "media"))
+        app.config.setdefault("EMB_MEDIA_MAX_AGE", 365 * 24 * 60 * 60)
+        app.config.setdefault("EMB_MEDIA_GC_GRACE", 3600)
+        app.extensions["media_store"] = self
+
+    def put(self, data, ext):
+        """Store data and return its (MediaBlob, created) pair.
+
+        The blob row is flushed so that refcount updates issued by the same
+        flush as the referencing row find it.
+        """
+        from app import db
+        from app.models.media_model import MediaBlob
+
+        digest = blake2b(data, digest_size=20).hexdigest()
+        key = f"{digest[:2]}/{digest}.{ext.lower()}"
+        path = self.path(key)
+        # A stored blob may be unreferenced. Refreshing its timestamp keeps
+        # collect_garbage() from deleting it before the new reference is
+        # committed, and matches no row if it already has.
+        reused = MediaBlob.query.filter_by(key=key) \
+            .update({MediaBlob.timestamp: datetime.utcnow()}, synchronize_session="evaluate")
+        self._write(path, data)
+        if reused:
+            return MediaBlob.query.get(key), False
+
+        blob = MediaBlob(key=key, size=len(data))
+        try:
+            with db.session.begin_nested():
+                db.session.add(blob)
+        except IntegrityError:
+            # stored concurrently by another worker
+            return MediaBlob.query.get(key), False
+        return blob, True
+
+    def _write(self, path, data):
+        if os.path.exists(path):
+            # restarts the grace period of a file left without a row
+            os.utime(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=_TMP_PREFIX)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def stale_files(self, max_age):
+        """Yield (shard, names) of the stored files last modified more than
+        max_age seconds ago, variants excluded, and delete the interrupted
+        writes that are as old."""
+        root = current_app.config["EMB_MEDIA_ROOT"]
+        if not os.path.isdir(root):
+            return
+        cutoff = time.time() - max_age
+        for shard in sorted(os.listdir(root)):
+            directory = os.path.join(root, shard)
+            if not os.path.isdir(directory):
+                continue
+            names = []
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if name.startswith(_TMP_PREFIX) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                elif _KEY_NAME.fullmatch(name) and os.path.getmtime(path) < cutoff:
+                    names.append(name)
+            if names:
+                yield shard, names
+
+    def path(self, key):
+        return os.path.join(current_app.config["EMB_MEDIA_ROOT"], key)
+
+    def remove(self, key):
+        """Delete the file stored under key along with its derived variants."""
+        stem, ext = os.path.splitext(self.path(key))
+        for path in [stem + ext] + glob.glob(glob.escape(stem) + "_*"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
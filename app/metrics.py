@@ -0,0 +1,182 @@
+from bisect import bisect_left
+from ipaddress import ip_network
+from threading import Lock, current_thread, local
+from time import perf_counter
+
+from flask import before_render_template, current_app, g, request, template_rendered
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = {
+    "emb_requests_total": ("counter", "Requests by endpoint and status code.", None),
+    "emb_request_duration_seconds": ("histogram", "Request latency by endpoint.", LATENCY_BUCKETS),
+    "emb_blueprint_request_duration_seconds": ("histogram", "Request latency by blueprint.", LATENCY_BUCKETS),
+    "emb_request_db_seconds": ("histogram", "Time spent in database queries per request.", LATENCY_BUCKETS),
+    "emb_request_db_queries_total": ("counter", "Database queries issued by endpoint.", None),
+    "emb_request_template_seconds": ("histogram", "Time spent rendering templates per request.", LATENCY_BUCKETS),
+    "emb_response_size_bytes": ("histogram", "Response body size by endpoint.", SIZE_BUCKETS),
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(pairs, **extra):
+    pairs = pairs + tuple(extra.items())
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class RequestMetrics:
+    """Request latency, DB time, template time and response size metrics.
+
+    Every thread records into its own shard without taking a lock; shards are
+    only summed when the metrics are rendered. Figures are per process, so
+    with several workers each scrape sees the worker that answered it.
+    With EMB_DB_STATS_HEADERS set, every response also reports its query count
+    and DB time in the X-EMB-DB-Queries and X-EMB-DB-Time headers.
+    Scrapers of /metrics authenticate with EMB_METRICS_TOKEN or by address,
+    see EMB_METRICS_ALLOWED_IPS, which init_app() turns into ip_network objects.
+    """
+
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self._local = local()
+        self._shards = []
+        self._retired = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EMB_DB_STATS_HEADERS", False)
+        app.config.setdefault("EMB_METRICS_TOKEN", None)
+        app.config.setdefault("EMB_METRICS_ALLOWED_IPS", [])
+        networks = []
+        for network in app.config["EMB_METRICS_ALLOWED_IPS"]:
+            try:
+                networks.append(ip_network(network))
+            except ValueError as e:
+                raise ValueError(f"Invalid EMB_METRICS_ALLOWED_IPS entry {network!r}: {e}") from None
+        app.config["EMB_METRICS_ALLOWED_IPS"] = networks
+        app.extensions["request_metrics"] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render_template, app)
+        template_rendered.connect(self._template_rendered, app)
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        shard = self._shard()
+        series = shard.get((name, labels))
+        if series is None:
+            # a count per bucket, +Inf last, then the sum of the values
+            series = shard[(name, labels)] = [0] * (len(buckets) + 1) + [0.0]
+        series[bisect_left(buckets, value)] += 1
+        series[-1] += value
+
+    def inc(self, name, labels, amount=1):
+        shard = self._shard()
+        shard[(name, labels)] = shard.get((name, labels), 0) + amount
+
+    def collect(self):
+        """Sum the shards into {(name, labels): value}."""
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = alive
+            totals = {}
+            self._merge(totals, self._retired)
+            for _, shard in alive:
+                self._merge(totals, shard)
+        return totals
+
+    def render(self, extra=()):
+        """Render the metrics in the Prometheus text exposition format.
+
+        extra is an iterable of (name, type, help, value) for gauges owned by
+        other components.
+        """
+        totals = self.collect()
+        lines = []
+        for name, (kind, help, buckets) in METRICS.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for (series_name, labels), value in sorted(totals.items()):
+                if series_name != name:
+                    continue
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ("+Inf",), value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {value[-1]}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        for name, kind, help, value in extra:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((current_thread(), shard))
+        return shard
+
+    @staticmethod
+    def _merge(into, shard):
+        # copy first, the owning thread may be adding series
+        for key, value in list(shard.items()):
+            if isinstance(value, list):
+                total = into.setdefault(key, [0] * len(value))
+                into[key] = [a + b for a, b in zip(total, value)]
+            else:
+                into[key] = into.get(key, 0) + value
+
+    def _before_request(self):
+        g.request_start_time = perf_counter()
+        g.template_time = 0.0
+        g.template_start_times = []
+        g.db_time = 0.0
+        g.db_query_count = 0
+
+    def _after_request(self, response):
+        start = g.get("request_start_time")
+        if start is None:
+            return response
+        duration = perf_counter() - start
+        endpoint = request.endpoint or "<unmatched>"
+        blueprint = request.blueprint or "<app>"
+        by_endpoint = (("endpoint", endpoint),)
+
+        self.inc("emb_requests_total", by_endpoint + (("status", response.status_code),))
+        self.observe("emb_request_duration_seconds", by_endpoint, duration)
+        self.observe("emb_blueprint_request_duration_seconds", (("blueprint", blueprint),), duration)
+        self.observe("emb_request_db_seconds", by_endpoint, g.get("db_time", 0.0))
+        self.inc("emb_request_db_queries_total", by_endpoint, g.get("db_query_count", 0))
+        if g.template_time:
+            self.observe("emb_request_template_seconds", by_endpoint, g.template_time)
+        if response.content_length is not None:
+            self.observe("emb_response_size_bytes", by_endpoint, response.content_length)
+        if current_app.config["EMB_DB_STATS_HEADERS"]:
+            response.headers["X-EMB-DB-Queries"] = str(g.get("db_query_count", 0))
+            response.headers["X-EMB-DB-Time"] = f"{g.get('db_time', 0.0):.6f}"
+        return response
+
+    def _before_render_template(self, app, template, context):
+        if "template_start_times" in g:
+            g.template_start_times.append(perf_counter())
+
+    def _template_rendered(self, app, template, context):
+        start_times = g.get("template_start_times")
+        if start_times:
+            start = start_times.pop()
+            # templates rendered while rendering another are already counted
+            if not start_times:
+                g.template_time += perf_counter() - start
@@ -1,12 +1,21 @@
 from datetime import datetime
 
-import bleach
+from flask import url_for
 
 from app import db
+from app.exceptions import ValidationError
+from app.sanitizer import comment_sanitizer
 
 
 class Comment(db.Model):
     __tablename__ = "comments"
+    __table_args__ = (
+        # a post's comments in order
+        db.Index("ix_comments_post_id_timestamp", "post_id", "timestamp"),
+        # the few disabled comments, for moderators
+        db.Index("ix_comments_disabled_timestamp", "timestamp",
+                 sqlite_where=db.text("disabled = 1"), postgresql_where=db.text("disabled = true")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     raw_body = db.Column(db.Text)
@@ -19,14 +28,38 @@ class Comment(db.Model):
 
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        allowed_tags = ["strong", "b", "em", "i", "ol", "ul", "li", "a", ]
-        target.body = bleach.linkify(
-            bleach.clean(
-                value,
-                tags=allowed_tags,
-                strip=True,
-            )
-        )
+        target.body = comment_sanitizer.clean(value)
+
+    @staticmethod
+    def listing_options():
+        """Loader options for comment lists (_comments.html): the authors of
+        a page are loaded by one extra query, with only the columns shown."""
+        from app.models.users_model import User
+        return (db.selectinload(Comment.author).load_only(User.username, User.profile_image),
+                db.defer(Comment.raw_body))
+
+    def to_json(self, url_for=url_for):
+        # the API collections pass url templates as url_for, see serializers
+        json_comment = {
+            "url": url_for("api_v1_bp.get_comment", id=self.id),
+            "post_url": url_for("api_v1_bp.get_post", id=self.post_id),
+            "raw_body": self.raw_body,
+            "body": self.body,
+            "timestamp": self.timestamp,
+            "author_url": url_for("api_v1_bp.get_user", id=self.author_id),
+        }
+        return json_comment
+
+    @staticmethod
+    def from_json(json_comment):
+        raw_body = json_comment.get("raw_body")
+        if raw_body is None or raw_body == "":
+            raise ValidationError("Comment does not have a raw_body.")
+
+        return Comment(raw_body=raw_body)
+
+    def __repr__(self) -> str:
+        return f"<Comment {self.id}>"
 
 
 db.event.listen(Comment.raw_body, "set", Comment.on_changed_body)
@@ -5,6 +5,10 @@ from app import db
 
 class Follow(db.Model):
     __tablename__ = "follows"
+    __table_args__ = (
+        # the primary key covers lookups by follower, this one lookups by followed user
+        db.Index("ix_follows_followed_id_follower_id", "followed_id", "follower_id"),
+    )
 
     follower_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
     followed_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
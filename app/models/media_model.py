@@ -0,0 +1,86 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db, media_store
+from app.media_store import is_media_key
+
+
+class MediaBlob(db.Model):
+    __tablename__ = "media_blobs"
+
+    key = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    variants = db.Column(db.String(128))
+    refcount = db.Column(db.Integer, default=0, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @staticmethod
+    def track(model, attribute):
+        """Keep refcounts of the blobs referenced by model.attribute.
+
+        The attribute should be mapped with active_history=True so that its old
+        value is known when it is replaced.
+        """
+        def change(connection, key, delta):
+            if is_media_key(key):
+                connection.execute(MediaBlob.__table__.update().where(MediaBlob.key == key)
+                                   .values(refcount=MediaBlob.refcount + delta))
+
+        def on_inserted(mapper, connection, target):
+            change(connection, getattr(target, attribute), 1)
+
+        def on_updated(mapper, connection, target):
+            # history is blank (None, None, None) when the attribute was not loaded
+            history = db.inspect(target).attrs[attribute].history
+            for key in history.added or ():
+                change(connection, key, 1)
+            for key in history.deleted or ():
+                change(connection, key, -1)
+
+        def on_deleted(mapper, connection, target):
+            change(connection, getattr(target, attribute), -1)
+
+        db.event.listen(model, "after_insert", on_inserted)
+        db.event.listen(model, "after_update", on_updated)
+        db.event.listen(model, "after_delete", on_deleted)
+
+    @staticmethod
+    def collect_garbage():
+        """Delete unreferenced blobs and their files, and the files that have
+        no blob, returning how many were removed.
+
+        Both must be EMB_MEDIA_GC_GRACE seconds old, so uploads have time to
+        commit the rows that reference them.
+        """
+        grace = current_app.config["EMB_MEDIA_GC_GRACE"]
+        cutoff = datetime.utcnow() - timedelta(seconds=grace)
+        unreferenced = (MediaBlob.refcount <= 0, MediaBlob.timestamp < cutoff)
+        keys = [blob.key for blob in MediaBlob.query.filter(*unreferenced)]
+        removed = []
+        if keys:
+            MediaBlob.query.filter(MediaBlob.key.in_(keys), *unreferenced).delete(synchronize_session=False)
+            # skip blobs that were reused before the delete ran
+            kept = {blob.key for blob in MediaBlob.query.filter(MediaBlob.key.in_(keys))}
+            removed = [key for key in keys if key not in kept]
+            # the files go before the commit, a put() of the same data waits
+            # for it, finds the row gone and writes the file again
+            for key in removed:
+                media_store.remove(key)
+        db.session.commit()
+
+        # files of uploads that were rolled back or interrupted
+        for shard, names in media_store.stale_files(grace):
+            keys = [f"{shard}/{name}" for name in names]
+            stored = {blob.key for blob in MediaBlob.query.filter(MediaBlob.key.in_(keys))}
+            for key in keys:
+                # a put() since the listing made the file recent again
+                if key not in stored and os.path.getmtime(media_store.path(key)) < time.time() - grace:
+                    media_store.remove(key)
+                    removed.append(key)
+        return len(removed)
+
+    def __repr__(self) -> str:
+        return f"<MediaBlob {self.key} ({self.refcount})>"
@@ -1,5 +1,6 @@
+import os
+import re
 from datetime import datetime
-import bleach
 
 
 from flask import url_for
@@ -7,39 +8,85 @@ from flask import url_for
 
 from app import db
 from app.exceptions import ValidationError
+from app.sanitizer import make_excerpt, post_sanitizer
+from app.models.media_model import MediaBlob
 # Do not remove
 from app.models.comments_model import Comment
 
 
+
+def _stored_variants(directory, stem):
+    """Post.image_variants string of the <stem>_<width>.<ext> files in directory."""
+    widths = {}
+    for name in os.listdir(directory):
+        match = re.fullmatch(re.escape(stem) + r"_(\d+)\.(\w+)", name)
+        if match:
+            widths.setdefault(match.group(2), []).append(int(match.group(1)))
+    return " ".join(ext + ":" + ",".join(str(width) for width in sorted(widths[ext]))
+                    for ext in ("jpg", "webp", "avif") if ext in widths)
+
+
+# the variants of default_post_image.jpg that ship in the static folder, see save_post_image_variants
+DEFAULT_IMAGE_VARIANTS = _stored_variants(
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "post", "post-images"), "default_post_image")
+
+
 class Post(db.Model):
     __tablename__ = "posts"
+    __table_args__ = (
+        # a user's posts newest first
+        db.Index("ix_posts_author_id_timestamp", "author_id", "timestamp"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.Unicode(128), nullable=False)
-    image = db.Column(db.String(64), default="default_post_image.jpg")
+    image = db.column_property(db.Column(db.String(64), default="default_post_image.jpg"), active_history=True)
+    image_variants = db.Column(db.String(128), default=DEFAULT_IMAGE_VARIANTS)
     raw_body = db.Column(db.UnicodeText, nullable=False)
     body = db.Column(db.UnicodeText, nullable=False)
+    # plain-text preview for post cards, so listings can defer body/raw_body
+    excerpt = db.Column(db.Unicode(160))
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
 
     author_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    comment_count = db.Column(db.Integer, default=0, nullable=False)
 
     comments = db.relationship("Comment", backref="post", lazy="dynamic")
 
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        allowed_tags = ["h1", "h2", "h3", "p", "pre", "div", "span", "big", "small", "tt", "code",
-                        "kbd", "samp", "var", "del", "ins", "cite", "q", "strong", "b", "em", "i",
-                        "u", "s", "ol", "ul", "li", "blockquote", "a", "img", "table", "caption",
-                        "thead", "tbody", "tfoot", "tr", "th", "td", "hr", ]
-        target.body = bleach.linkify(
-            bleach.clean(
-                value,
-                tags=allowed_tags,
-                strip=True,
-            )
-        )
-
-    def to_json(self):
+        target.body = post_sanitizer.clean(value)
+        target.excerpt = make_excerpt(target.body)
+
+    @staticmethod
+    def on_comment_inserted(mapper, connection, target):
+        if target.post_id is not None:
+            connection.execute(Post.__table__.update().where(Post.id == target.post_id)
+                               .values(comment_count=Post.comment_count + 1))
+
+    @staticmethod
+    def on_comment_deleted(mapper, connection, target):
+        if target.post_id is not None:
+            connection.execute(Post.__table__.update().where(Post.id == target.post_id)
+                               .values(comment_count=Post.comment_count - 1))
+
+    @staticmethod
+    def card_options(load_authors=True):
+        """Loader options for post cards (_post.html).
+
+        The full bodies are deferred and the authors of a page are loaded by
+        one extra query, with only the columns the card shows. Pass
+        load_authors=False when the author is already in the session, which
+        post.author then finds without a query.
+        """
+        from app.models.users_model import User
+        options = (db.defer(Post.body), db.defer(Post.raw_body))
+        if load_authors:
+            options += (db.selectinload(Post.author).load_only(User.username, User.profile_image),)
+        return options
+
+    def to_json(self, url_for=url_for):
+        # the API collections pass url templates as url_for, see serializers
         json_post = {
             "url": url_for("api_v1_bp.get_post", id=self.id),
             "raw_body": self.raw_body,
@@ -47,7 +94,7 @@ class Post(db.Model):
             "timestamp": self.timestamp,
             "author_url": url_for("api_v1_bp.get_user", id=self.author_id),
             "comments_url": url_for("api_v1_bp.get_post_comments", id=self.id),
-            "comment_count": self.comments.count(),
+            "comment_count": self.comment_count,
         }
         return json_post
 
@@ -68,3 +115,6 @@ class Post(db.Model):
 
 
 db.event.listen(Post.raw_body, "set", Post.on_changed_body)
+db.event.listen(Comment, "after_insert", Post.on_comment_inserted)
+MediaBlob.track(Post, "image")
+db.event.listen(Comment, "after_delete", Post.on_comment_deleted)
@@ -56,5 +56,16 @@ class Role(db.Model):
     def has_permission(self, perm):
         return self.permissions & perm == perm
 
+    @staticmethod
+    def on_updated(mapper, connection, target):
+        if db.inspect(target).attrs.permissions.history.has_changes():
+            # revokes the cached API tokens of the role's users in every worker
+            users = db.metadata.tables["users"]
+            connection.execute(users.update().where(users.c.role_id == target.id)
+                               .values(auth_version=users.c.auth_version + 1))
+
     def __repr__(self) -> str:
         return f"<Role {self.name} ({self.id})>"
+
+
+db.event.listen(Role, "after_update", Role.on_updated)
@@ -0,0 +1,102 @@
+from flask import current_app
+from sqlalchemy import literal, select
+
+from app import db
+
+from app.models.follows_model import Follow
+from app.models.posts_model import Post
+
+
+class TimelineEntry(db.Model):
+    __tablename__ = "timeline_entries"
+    __table_args__ = (
+        # timelines are read newest first, with the post id breaking ties
+        db.Index("ix_timeline_entries_user_id_timestamp_post_id", "user_id", "timestamp", "post_id"),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey("posts.id"), primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+
+    @staticmethod
+    def on_post_inserted(mapper, connection, target):
+        # Fan the new post out to the author and all followers, unless the
+        # author has too many followers. Such authors are merged at read time.
+        timeline = TimelineEntry.__table__
+        connection.execute(timeline.insert().values(
+            user_id=target.author_id,
+            post_id=target.id,
+            author_id=target.author_id,
+            timestamp=target.timestamp,
+        ))
+
+        users = db.metadata.tables["users"]
+        follower_count, fanout_on_read = connection.execute(
+            select(users.c.follower_count, users.c.fanout_on_read).where(users.c.id == target.author_id)
+        ).one()
+        if fanout_on_read:
+            return
+        if follower_count > current_app.config["EMB_TIMELINE_FANOUT_LIMIT"]:
+            connection.execute(users.update().where(users.c.id == target.author_id).values(fanout_on_read=True))
+            connection.execute(users.update().where(users.c.id.in_(
+                select(Follow.follower_id).where(Follow.followed_id == target.author_id)
+            )).values(fanout_on_read_followed_count=users.c.fanout_on_read_followed_count + 1))
+            return
+
+        connection.execute(timeline.insert().from_select(
+            ["user_id", "post_id", "author_id", "timestamp"],
+            select(
+                Follow.follower_id,
+                literal(target.id, db.Integer),
+                literal(target.author_id, db.Integer),
+                literal(target.timestamp, db.DateTime),
+            ).where(Follow.followed_id == target.author_id),
+        ))
+
+    @staticmethod
+    def on_post_deleted(mapper, connection, target):
+        # runs before the post row is deleted, the entries reference it
+        timeline = TimelineEntry.__table__
+        connection.execute(timeline.delete().where(timeline.c.post_id == target.id))
+
+    @staticmethod
+    def on_follow_inserted(mapper, connection, target):
+        users = db.metadata.tables["users"]
+        if connection.scalar(select(users.c.fanout_on_read).where(users.c.id == target.followed_id)):
+            connection.execute(users.update().where(users.c.id == target.follower_id)
+                               .values(fanout_on_read_followed_count=users.c.fanout_on_read_followed_count + 1))
+            return
+        timeline = TimelineEntry.__table__
+        connection.execute(timeline.insert().from_select(
+            ["user_id", "post_id", "author_id", "timestamp"],
+            select(
+                literal(target.follower_id, db.Integer),
+                Post.id,
+                Post.author_id,
+                Post.timestamp,
+            ).where(Post.author_id == target.followed_id),
+        ))
+
+    @staticmethod
+    def on_follow_deleted(mapper, connection, target):
+        timeline = TimelineEntry.__table__
+        connection.execute(timeline.delete().where(
+            timeline.c.user_id == target.follower_id,
+            timeline.c.author_id == target.followed_id,
+        ))
+        users = db.metadata.tables["users"]
+        followed = users.alias()
+        connection.execute(users.update().where(
+            users.c.id == target.follower_id,
+            select(followed.c.id).where(followed.c.id == target.followed_id, followed.c.fanout_on_read.is_(True)).exists(),
+        ).values(fanout_on_read_followed_count=users.c.fanout_on_read_followed_count - 1))
+
+    def __repr__(self) -> str:
+        return f"<TimelineEntry user={self.user_id} post={self.post_id}>"
+
+
+db.event.listen(Post, "after_insert", TimelineEntry.on_post_inserted)
+db.event.listen(Post, "before_delete", TimelineEntry.on_post_deleted)
+db.event.listen(Follow, "after_insert", TimelineEntry.on_follow_inserted)
+db.event.listen(Follow, "before_delete", TimelineEntry.on_follow_deleted)
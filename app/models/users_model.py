@@ -5,12 +5,12 @@ import jwt
 from flask import current_app, url_for
 from flask_login import UserMixin, AnonymousUserMixin
 
-from werkzeug.security import generate_password_hash, check_password_hash
-
-from app import db, login_manager
+from app import db, last_seen_buffer, login_manager, password_hasher
 
 from app.models.follows_model import Follow
+from app.models.media_model import MediaBlob
 from app.models.roles_model import Role, Permission
+from app.models.timeline_model import TimelineEntry
 # Do not remove (needed for relationship)
 from app.models.comments_model import Comment
 from app.models.posts_model import Post
@@ -26,13 +26,24 @@ class User(UserMixin, db.Model):
     confirmed = db.Column(db.Boolean, default=False)
     password_hash = db.Column(db.String(128))
 
-    profile_image = db.Column(db.String(64), default="default_profile_image.jpg")
+    profile_image = db.column_property(db.Column(db.String(64), default="default_profile_image.jpg"),
+                                       active_history=True)
     location = db.Column(db.String(64))
     about_me = db.Column(db.Text())
 
     member_since = db.Column(db.DateTime(), default=datetime.utcnow)
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
     premium_account = db.Column(db.Boolean, default=False, nullable=False)
+    post_count = db.Column(db.Integer, default=0, nullable=False)
+    follower_count = db.Column(db.Integer, default=0, nullable=False)
+    followed_count = db.Column(db.Integer, default=0, nullable=False)
+    # set once the user has too many followers for fan-out-on-write, cleared
+    # by `flask recount` once they are back under the limit
+    fanout_on_read = db.Column(db.Boolean, default=False, nullable=False)
+    # followed users with fanout_on_read, whose posts are merged in at read time
+    fanout_on_read_followed_count = db.Column(db.Integer, default=0, nullable=False)
+    # part of every API token, bumping it revokes the user's tokens
+    auth_version = db.Column(db.Integer, default=0, nullable=False)
 
     role_id = db.Column(db.Integer, db.ForeignKey("roles.id"))
 
@@ -68,10 +79,17 @@ class User(UserMixin, db.Model):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            # the password is the same, so bypass on_updating and keep the API tokens
+            db.session.query(User).filter_by(id=self.id) \
+                .update({User.password_hash: password_hasher.hash(password)}, synchronize_session="evaluate")
+            db.session.commit()
+        return True
 
     def generate_confirmation_token(self, expires_in=3600):
         return jwt.encode(
@@ -139,9 +157,7 @@ class User(UserMixin, db.Model):
         return self.can(Permission.ADMIN)
 
     def ping(self):
-        self.last_seen = datetime.utcnow()
-        db.session.add(self)
-        db.session.commit()
+        last_seen_buffer.ping(self)
 
     def follow(self, user):
         if not self.is_following(user):
@@ -163,34 +179,145 @@ class User(UserMixin, db.Model):
             return False
         return self.followers.filter_by(follower_id=user.id).first() is not None
 
+    def followed_timeline(self):
+        """Return the unordered query of the user's timeline posts and the
+        (timestamp, id) columns to order and page it by.
+
+        The columns come from the timeline entries, so pages are read from
+        their index. Posts of followed authors with fanout_on_read are merged
+        in, which needs a sort.
+        """
+        entries = db.select(TimelineEntry.post_id.label("id"), TimelineEntry.timestamp) \
+            .where(TimelineEntry.user_id == self.id)
+        if self.fanout_on_read_followed_count:
+            fanout_on_read_ids = db.select(Follow.followed_id).join(User, User.id == Follow.followed_id) \
+                .where(Follow.follower_id == self.id, User.fanout_on_read.is_(True))
+            entries = db.union(entries, db.select(Post.id, Post.timestamp)
+                               .where(Post.author_id.in_(fanout_on_read_ids)))
+        entries = entries.subquery()
+        return Post.query.join(entries, entries.c.id == Post.id), entries.c.timestamp, entries.c.id
+
     @property
     def followed_posts(self):
-        followed = Post.query.join(Follow, Follow.followed_id ==
-                                   Post.author_id).filter(Follow.follower_id == self.id)
-        own = Post.query.filter_by(author_id=self.id)
-        return followed.union(own).order_by(Post.timestamp.desc())
+        query, timestamp, id = self.followed_timeline()
+        return query.order_by(timestamp.desc(), id.desc())
+
+    @staticmethod
+    def on_post_inserted(mapper, connection, target):
+        connection.execute(User.__table__.update().where(User.id == target.author_id)
+                           .values(post_count=User.post_count + 1))
+
+    @staticmethod
+    def on_post_deleted(mapper, connection, target):
+        connection.execute(User.__table__.update().where(User.id == target.author_id)
+                           .values(post_count=User.post_count - 1))
+
+    @staticmethod
+    def on_follow_inserted(mapper, connection, target):
+        connection.execute(User.__table__.update().where(User.id == target.followed_id)
+                           .values(follower_count=User.follower_count + 1))
+        connection.execute(User.__table__.update().where(User.id == target.follower_id)
+                           .values(followed_count=User.followed_count + 1))
+
+    @staticmethod
+    def on_follow_deleted(mapper, connection, target):
+        connection.execute(User.__table__.update().where(User.id == target.followed_id)
+                           .values(follower_count=User.follower_count - 1))
+        connection.execute(User.__table__.update().where(User.id == target.follower_id)
+                           .values(followed_count=User.followed_count - 1))
+
+    @staticmethod
+    def recount():
+        """Recompute all denormalized counters from the source tables."""
+        db.session.query(User).update({
+            User.post_count: db.select(db.func.count(Post.id))
+            .where(Post.author_id == User.id).scalar_subquery(),
+            User.follower_count: db.select(db.func.count())
+            .where(Follow.followed_id == User.id).scalar_subquery(),
+            User.followed_count: db.select(db.func.count())
+            .where(Follow.follower_id == User.id).scalar_subquery(),
+            User.fanout_on_read_followed_count: User._fanout_on_read_followed_count(),
+        }, synchronize_session=False)
+        db.session.query(Post).update({
+            Post.comment_count: db.select(db.func.count(Comment.id))
+            .where(Comment.post_id == Post.id).scalar_subquery(),
+        }, synchronize_session=False)
+        db.session.commit()
+
+    @staticmethod
+    def _fanout_on_read_followed_count():
+        followed = db.aliased(User)
+        return db.select(db.func.count()).select_from(Follow) \
+            .join(followed, followed.id == Follow.followed_id) \
+            .where(Follow.follower_id == User.id, followed.fanout_on_read.is_(True)).scalar_subquery()
+
+    @staticmethod
+    def update_fanout_modes():
+        """Switch authors between fan-out on write and on read by their
+        follower_count, run after recount().
+
+        Authors back under EMB_TIMELINE_FANOUT_LIMIT have their posts fanned
+        out to their followers' timelines again.
+        """
+        limit = current_app.config["EMB_TIMELINE_FANOUT_LIMIT"]
+        back_under = db.select(User.id).where(User.fanout_on_read.is_(True), User.follower_count <= limit)
+        db.session.execute(TimelineEntry.__table__.insert().from_select(
+            ["user_id", "post_id", "author_id", "timestamp"],
+            db.select(Follow.follower_id, Post.id, Post.author_id, Post.timestamp)
+            .join(Follow, Follow.followed_id == Post.author_id)
+            .where(Post.author_id.in_(back_under),
+                   ~db.exists().where(TimelineEntry.user_id == Follow.follower_id,
+                                      TimelineEntry.post_id == Post.id))))
+        db.session.query(User).filter(User.fanout_on_read.is_(True), User.follower_count <= limit) \
+            .update({User.fanout_on_read: False}, synchronize_session=False)
+        db.session.query(User).filter(User.fanout_on_read.is_(False), User.follower_count > limit) \
+            .update({User.fanout_on_read: True}, synchronize_session=False)
+        db.session.query(User).update({
+            User.fanout_on_read_followed_count: User._fanout_on_read_followed_count(),
+        }, synchronize_session=False)
+        db.session.commit()
 
     def generate_auth_token(self, expires_in=3600):  # 1 hour
         return jwt.encode(
             {
                 "confirm": self.id,
                 "exp": time() + expires_in,
+                "auth_version": self.auth_version,
             },
             current_app.config["SECRET_KEY"],
             algorithm="HS256",
         )
 
     @staticmethod
-    def verify_auth_token(token):
+    def decode_auth_token(token):
         try:
-            user_id = jwt.decode(
+            data = jwt.decode(
                 token,
                 current_app.config["SECRET_KEY"],
                 algorithms=["HS256"],
-            )["confirm"]
+            )
+            return data["confirm"], data["exp"], data.get("auth_version", 0)
         except:
             return None
-        return User.query.get(user_id)
+
+    @staticmethod
+    def verify_auth_token(token):
+        data = User.decode_auth_token(token)
+        if data is None:
+            return None
+        user = User.query.get(data[0])
+        if user is None or user.auth_version != data[2]:
+            return None
+        return user
+
+    @staticmethod
+    def on_updating(mapper, connection, target):
+        state = db.inspect(target)
+        for attr in ("confirmed", "password_hash", "role_id", "role"):
+            if state.attrs[attr].history.has_changes():
+                # written with the change, so every worker sees the tokens are revoked
+                target.auth_version = User.auth_version + 1
+                return
 
     def to_json(self):
         json_user = {
@@ -200,7 +327,7 @@ class User(UserMixin, db.Model):
             "last_seen": self.last_seen,
             "posts_url": url_for("api_v1_bp.get_user_posts", id=self.id),
             "followed_posts_url": url_for("api_v1_bp.get_user_followed_posts", id=self.id),
-            "post_count": self.posts.count(),
+            "post_count": self.post_count,
         }
         return json_user
 
@@ -208,6 +335,14 @@ class User(UserMixin, db.Model):
         return f"<User {self.username} ({self.id})>"
 
 
+db.event.listen(Post, "after_insert", User.on_post_inserted)
+db.event.listen(User, "before_update", User.on_updating)
+MediaBlob.track(User, "profile_image")
+db.event.listen(Post, "after_delete", User.on_post_deleted)
+db.event.listen(Follow, "after_insert", User.on_follow_inserted)
+db.event.listen(Follow, "after_delete", User.on_follow_deleted)
+
+
 class AnonymousUser(AnonymousUserMixin):
     def can(self, permissions):
         return False
@@ -4,21 +4,27 @@ from app import db
 from app.models.comments_model import Comment
 from app.models.roles_model import Permission
 from app.moderate import moderate_bp
-from app.decorators import permission_required
+from app.decorators import permission_required, query_budget
 
 
 @moderate_bp.route("/")
 @login_required
 @permission_required(Permission.MODERATE)
+@query_budget(3)
 def moderate():
     page = request.args.get("page", 1, type=int)
-    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(
+    disabled = request.args.get("disabled", 0, type=int)
+    query = Comment.query
+    if disabled:
+        query = query.filter(Comment.disabled == db.true())
+    pagination = query.order_by(Comment.timestamp.desc()).options(*Comment.listing_options()).paginate(
         page,
         per_page=current_app.config["EMB_COMMENTS_PER_PAGE"],
         error_out=False,
     )
     comments = pagination.items
-    return render_template("moderate/moderate.html", comments=comments, pagination=pagination, page=page)
+    return render_template("moderate/moderate.html", comments=comments, pagination=pagination, page=page,
+                           disabled=disabled)
 
 
 @moderate_bp.route('/moderate/enable/<int:comment_id>/')
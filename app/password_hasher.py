@@ -0,0 +1,85 @@
+from concurrent.futures import ProcessPoolExecutor
+from threading import BoundedSemaphore, Lock
+
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from app.exceptions import HashingOverloadError
+
+
+def hash_parameters(method, salt_length):
+    """Return what a werkzeug hash method and salt length produce, comparably.
+
+    werkzeug stores pbkdf2 methods with their hash name and iteration count
+    filled in, so "pbkdf2:sha256" and "pbkdf2:sha256:260000" are the same.
+    """
+    parts = method.split(":")
+    if parts[0] == "pbkdf2":
+        hash_name = parts[1] if len(parts) > 1 else "sha256"
+        iterations = int(parts[2]) if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+        parts = ["pbkdf2", hash_name, iterations]
+    return tuple(parts), salt_length
+
+
+class PasswordHasher:
+    """Runs password hashing in a bounded process pool.
+
+    At most EMB_PASSWORD_HASH_QUEUE_DEPTH hashes may be queued or running;
+    further calls fail fast with HashingOverloadError instead of tying up the
+    request thread. With EMB_PASSWORD_HASH_WORKERS set to 0 hashing runs inline.
+    """
+
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self._executor = None
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EMB_PASSWORD_HASH_METHOD", "pbkdf2:sha256:260000")
+        app.config.setdefault("EMB_PASSWORD_SALT_LENGTH", 16)
+        app.config.setdefault("EMB_PASSWORD_HASH_WORKERS", 2)
+        app.config.setdefault("EMB_PASSWORD_HASH_QUEUE_DEPTH", 16)
+        app.extensions["password_hasher"] = self
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password,
+                         current_app.config["EMB_PASSWORD_HASH_METHOD"],
+                         current_app.config["EMB_PASSWORD_SALT_LENGTH"])
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether password_hash was made with another method, iteration count
+        or salt length than the configured ones."""
+        if password_hash.count("$") < 2:
+            return True
+        method, salt, _ = password_hash.split("$", 2)
+        return hash_parameters(method, len(salt)) != hash_parameters(
+            current_app.config["EMB_PASSWORD_HASH_METHOD"], current_app.config["EMB_PASSWORD_SALT_LENGTH"])
+
+    def _run(self, fn, *args):
+        if current_app.config["EMB_PASSWORD_HASH_WORKERS"] == 0:
+            return fn(*args)
+
+        executor, slots = self._get_pool()
+        if not slots.acquire(blocking=False):
+            raise HashingOverloadError("Too many password checks in progress.")
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda f: slots.release())
+        return future.result()
+
+    def _get_pool(self):
+        # created lazily so that pre-forking servers start the pool in each worker
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=current_app.config["EMB_PASSWORD_HASH_WORKERS"])
+                self._slots = BoundedSemaphore(current_app.config["EMB_PASSWORD_HASH_QUEUE_DEPTH"])
+            return self._executor, self._slots
@@ -3,3 +3,6 @@ from flask import Blueprint
 post_bp = Blueprint("post_bp", __name__)
 
 from . import routes
+from .image_handler import post_image_srcsets
+
+post_bp.add_app_template_global(post_image_srcsets)
@@ -1,17 +1,106 @@
+import io
 import os
 
-from PIL import Image
+from PIL import Image, ImageOps, features
 from flask import current_app
 
+from app import db, image_pipeline, media_store
+from app.media_store import image_url
+from app.models.posts_model import DEFAULT_IMAGE_VARIANTS, Post
+
+try:
+    import pillow_avif  # noqa: F401 registers the AVIF codec with PIL
+except ImportError:
+    pillow_avif = None
+
+DEFAULT_POST_IMAGE = "default_post_image.jpg"
+PROCESSING_POST_IMAGE = "processing_post_image.jpg"
+
 
 def upload_post_image(image, blog_id):
-    new_filename = image.filename
-    file_extension = new_filename.split(".")[-1]
-    new_filename = str(blog_id) + "_post_image." + str(file_extension)
+    # the post shows PROCESSING_POST_IMAGE until the pipeline has stored the image
+    file_extension = image.filename.split(".")[-1]
+    image_pipeline.submit(image, process_post_image, blog_id, file_extension)
+
+
+def process_post_image(source_path, blog_id, file_extension):
+    post = Post.query.get(blog_id)
+    if post is None:
+        return
+    try:
+        image = Image.open(source_path)
+        data = io.BytesIO()
+        image.save(data, Image.registered_extensions()["." + file_extension.lower()])
+
+        blob, created = media_store.put(data.getvalue(), file_extension)
+        if blob.variants is None:
+            blob.variants = save_post_image_variants(image, os.path.splitext(media_store.path(blob.key))[0])
+        post.image = blob.key
+        post.image_variants = blob.variants
+    except Exception:
+        post.image = DEFAULT_POST_IMAGE
+        post.image_variants = DEFAULT_IMAGE_VARIANTS
+        raise
+    finally:
+        db.session.commit()
+
+
+def variant_formats():
+    formats = [("jpg", "JPEG", {"quality": 82, "progressive": True})]
+    if features.check("webp"):
+        formats.append(("webp", "WEBP", {"quality": 80, "method": 4}))
+    # registered by pillow_avif, or by Pillow itself from 11.2
+    Image.init()
+    if "AVIF" in Image.SAVE:
+        formats.append(("avif", "AVIF", {"quality": 60}))
+    return formats
+
+
+def save_post_image_variants(image, path_stem):
+    """Save EMB_POST_IMAGE_WIDTHS-wide copies of image in every supported format.
+
+    Files are written to <path_stem>_<width>.<ext>. Returns the
+    Post.image_variants string listing the widths stored per format,
+    e.g. "jpg:320,640 webp:320,640". A format that fails to encode is
+    logged and left out.
+    """
+    image = ImageOps.exif_transpose(image)
+    configured = current_app.config["EMB_POST_IMAGE_WIDTHS"]
+    widths = [width for width in configured if width < image.width]
+    if image.width <= max(configured):
+        widths.append(image.width)
 
-    filepath = os.path.join(current_app.root_path, r"static/post/post-images", new_filename)
+    variants = []
+    for ext, pil_format, options in variant_formats():
+        try:
+            for width in widths:
+                height = round(image.height * width / image.width)
+                resized = image.resize((width, height), Image.LANCZOS)
+                if pil_format == "JPEG":
+                    resized = resized.convert("RGB")
+                resized.save(f"{path_stem}_{width}.{ext}", pil_format, **options)
+        except (OSError, ValueError, KeyError):
+            current_app.logger.warning("Could not save the %s variants of %s", ext, path_stem, exc_info=True)
+            for width in widths:
+                try:
+                    os.remove(f"{path_stem}_{width}.{ext}")
+                except FileNotFoundError:
+                    pass
+            continue
+        variants.append(ext + ":" + ",".join(str(width) for width in widths))
+    return " ".join(variants)
 
-    image = Image.open(image)
-    image.save(filepath)
 
-    return new_filename
+def post_image_srcsets(post):
+    """Map each stored format of post.image to a srcset attribute value."""
+    if not post.image_variants:
+        return {}
+    stem = post.image.rsplit(".", 1)[0]
+    srcsets = {}
+    for entry in post.image_variants.split():
+        ext, widths = entry.split(":")
+        srcsets[ext] = ", ".join(
+            image_url(f"{stem}_{width}.{ext}", "post/post-images") + f" {width}w"
+            for width in widths.split(",")
+        )
+    return srcsets
@@ -3,7 +3,7 @@ from flask_login import current_user, login_required
 
 from app.models.users_model import User
 
-from app.post.image_handler import upload_post_image
+from app.post.image_handler import PROCESSING_POST_IMAGE, upload_post_image
 
 from app.post import post_bp
 from app import db
@@ -11,6 +11,7 @@ from app.models.comments_model import Comment
 from app.models.posts_model import Post
 from app.models.roles_model import Permission
 from app.post.forms import CommentForm, PostForm
+from app.decorators import query_budget
 
 
 @post_bp.route("/create-post/", methods=["GET", "POST"])
@@ -27,13 +28,14 @@ def create_post():
             raw_body=form.raw_body.data,
             author_id=current_user.id,
         )
+        if form.image.data:
+            post.image = PROCESSING_POST_IMAGE
+            post.image_variants = None
         db.session.add(post)
         db.session.commit()
 
         if form.image.data:
-            image_filename = upload_post_image(form.image.data, post.id)
-            post.image = image_filename
-            db.session.commit()
+            upload_post_image(form.image.data, post.id)
 
         return redirect(url_for("user_bp.profile", username=current_user.username))
 
@@ -41,6 +43,7 @@ def create_post():
 
 
 @post_bp.route("/posts/")
+@query_budget(5)
 def posts():
     page = request.args.get("page", 1, type=int)
     show_followed = False
@@ -49,8 +52,8 @@ def posts():
     if show_followed:
         query = current_user.followed_posts
     else:
-        query = Post.query
-    pagination = query.order_by(Post.timestamp.desc()).paginate(
+        query = Post.query.order_by(Post.timestamp.desc())
+    pagination = query.options(*Post.card_options()).paginate(
         page,
         per_page=current_app.config["EMB_POSTS_PER_PAGE"],
         error_out=False,
@@ -77,6 +80,7 @@ def show_followed():
 
 @post_bp.route("/<string:username>/<int:post_id>/", methods=["GET", "POST"])
 @login_required
+@query_budget(6)
 def view_post(username, post_id):
     user = User.query.filter_by(username=username).first_or_404()
     post = Post.query.filter_by(id=post_id, author=user).first_or_404()
@@ -94,8 +98,8 @@ def view_post(username, post_id):
         return redirect(url_for("post_bp.view_post", username=user.username, post_id=post.id))
     page = request.args.get("page", 1, type=int)
     if page == -1:
-        page = (post.comments.count() - 1) // current_app.config["EMB_COMMENTS_PER_PAGE"] + 1
-    pagination = post.comments.order_by(Comment.timestamp.desc()).paginate(
+        page = (post.comment_count - 1) // current_app.config["EMB_COMMENTS_PER_PAGE"] + 1
+    pagination = post.comments.order_by(Comment.timestamp.desc()).options(*Comment.listing_options()).paginate(
         page,
         per_page=current_app.config["EMB_COMMENTS_PER_PAGE"],
         error_out=False
@@ -116,9 +120,12 @@ def edit_post(post_id):
         post.title = form.title.data
         post.raw_body = form.raw_body.data
         if form.image.data:
-            post.image = upload_post_image(form.image.data, post.id)
+            post.image = PROCESSING_POST_IMAGE
+            post.image_variants = None
 
         db.session.commit()
+        if form.image.data:
+            upload_post_image(form.image.data, post.id)
 
     form.title.data = post.title
     form.raw_body.data = post.raw_body
@@ -0,0 +1,319 @@
+import atexit
+import glob
+import json
+import os
+import random
+import re
+import sys
+from datetime import datetime
+from queue import Full, Queue
+from threading import Lock, Thread
+from time import monotonic, perf_counter
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN\s*\((?:\s*\?\s*,)+\s*\?\s*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+_ALIASES = re.compile(r"\b(\w+)\s+AS\s+(\w+)", re.IGNORECASE)
+_SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?$")
+
+
+def fingerprint(statement):
+    """Normalize a statement so that executions differing only in literal
+    values or IN list lengths are grouped together."""
+    statement = _LITERALS.sub("?", statement)
+    statement = _IN_LISTS.sub("IN (...)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+
+def describe_parameters(parameters, executemany=False):
+    """Describe bound values by their types only, e.g. "(str, int, NULL)", as
+    they hold emails, password hashes and tokens."""
+    if executemany:
+        return f"{len(parameters)} x {describe_parameters(parameters[0])}" if parameters else "[]"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{name}: {_type_name(value)}" for name, value in parameters.items()) + "}"
+    return "(" + ", ".join(_type_name(value) for value in parameters) + ")"
+
+
+def _type_name(value):
+    return "NULL" if value is None else type(value).__name__
+
+
+def explain(connection, statement, parameters, watched_tables):
+    """Return the plan of statement as {"plan", "full_scans"}, or None when the
+    database has no supported EXPLAIN.
+
+    full_scans lists the watched tables that the plan reads without an index.
+    The EXPLAIN runs on the raw DBAPI connection so that it is not recorded.
+    """
+    dialect = connection.dialect.name
+    cursor = connection.connection.cursor()
+    try:
+        if dialect == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            details = [row[3] for row in cursor.fetchall()]
+            # the plan names tables by their alias in the statement
+            tables = {alias: table for table, alias in _ALIASES.findall(statement)}
+            full_scans = []
+            for detail in details:
+                match = _SQLITE_SCAN.match(detail)
+                if match:
+                    table = tables.get(match.group(2) or match.group(1), match.group(1))
+                    if table in watched_tables:
+                        full_scans.append(table)
+            return {"plan": "\n".join(details), "full_scans": sorted(set(full_scans))}
+        if dialect == "postgresql":
+            # a failing EXPLAIN must not abort the caller's transaction
+            cursor.execute("SAVEPOINT emb_explain")
+            try:
+                cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+                plan = cursor.fetchone()[0]
+            except Exception:
+                cursor.execute("ROLLBACK TO SAVEPOINT emb_explain")
+                raise
+            cursor.execute("RELEASE SAVEPOINT emb_explain")
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            full_scans = []
+            nodes = [plan[0]["Plan"]]
+            while nodes:
+                node = nodes.pop()
+                if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in watched_tables:
+                    full_scans.append(node["Relation Name"])
+                nodes.extend(node.get("Plans", []))
+            return {"plan": json.dumps(plan, indent=2), "full_scans": sorted(set(full_scans))}
+        return None
+    finally:
+        cursor.close()
+
+
+def calling_context():
+    """Return "module:line (function)" of the innermost app frame outside this module."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("app.") and module != __name__:
+            return f"{module}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return "<unknown>"
+
+
+class QueryStats:
+    """Per-statement timing aggregates collected from SQLAlchemy engine events.
+
+    Every query updates the count, total and maximum duration of its
+    fingerprint, and g.db_query_count and g.db_time during a request. A
+    sample of the fingerprint, the types of its parameters and the calling
+    context is kept only for queries slower than EMB_SLOW_DB_QUERY_TIME, which
+    are also logged, and for a random EMB_QUERY_SAMPLE_RATE fraction of the
+    rest. Parameter values are kept only in debug mode with
+    EMB_QUERY_SAMPLE_PARAMETERS set. The plan of a sampled SELECT is captured
+    once per fingerprint every EMB_EXPLAIN_INTERVAL seconds, flagging full
+    scans of EMB_EXPLAIN_WATCHED_TABLES. The EXPLAIN runs in a background
+    thread on its own connection; up to EMB_EXPLAIN_QUEUE_SIZE statements
+    wait for it, more are skipped.
+    Each process writes its aggregates to EMB_QUERY_STATS_DIR every
+    EMB_QUERY_STATS_FLUSH_INTERVAL seconds and on exit for `flask query-report`,
+    unless it is None.
+    """
+
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self._fingerprints = {}
+        self._stats = {}
+        self._explained = {}
+        self._explain_queue = None
+        self._since = datetime.utcnow()
+        self._last_write = monotonic()
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EMB_SLOW_DB_QUERY_TIME", 0.5)
+        app.config.setdefault("EMB_QUERY_SAMPLE_RATE", 0.01)
+        app.config.setdefault("EMB_QUERY_SAMPLES_KEPT", 5)
+        app.config.setdefault("EMB_QUERY_SAMPLE_PARAMETERS", False)
+        app.config.setdefault("EMB_QUERY_STATS_SIZE", 1000)
+        app.config.setdefault("EMB_QUERY_STATS_DIR", os.path.join(app.instance_path, "query-stats"))
+        app.config.setdefault("EMB_QUERY_STATS_FLUSH_INTERVAL", 60)
+        app.config.setdefault("EMB_EXPLAIN_INTERVAL", 3600)
+        app.config.setdefault("EMB_EXPLAIN_WATCHED_TABLES", ["posts", "comments", "follows"])
+        app.config.setdefault("EMB_EXPLAIN_QUEUE_SIZE", 100)
+        app.extensions["query_stats"] = self
+        if not self._listening:
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            self._listening = True
+        if app.config["EMB_QUERY_STATS_DIR"] is not None:
+            atexit.register(self._write_at_exit, app)
+
+    def snapshot(self):
+        """Return {fingerprint: {"count", "total", "max", "samples", "plan"}} for this process."""
+        with self._lock:
+            return {key: dict(stats, samples=list(stats["samples"])) for key, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._explained = {}
+            self._since = datetime.utcnow()
+
+    def write(self):
+        """Save this process' aggregates to EMB_QUERY_STATS_DIR."""
+        directory = current_app.config["EMB_QUERY_STATS_DIR"]
+        if directory is None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        data = {"since": self._since.isoformat(), "queries": self.snapshot()}
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def load(directory):
+        """Merge the aggregates written by all processes into one snapshot."""
+        merged = {}
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            with open(path) as f:
+                queries = json.load(f)["queries"]
+            for key, stats in queries.items():
+                total = merged.setdefault(key, {"count": 0, "total": 0.0, "max": 0.0, "samples": []})
+                total["count"] += stats["count"]
+                total["total"] += stats["total"]
+                total["max"] = max(total["max"], stats["max"])
+                total["samples"] += stats["samples"]
+                plan = stats.get("plan")
+                if plan and plan["time"] > total.get("plan", {}).get("time", ""):
+                    total["plan"] = plan
+        return merged
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start_times = conn.info.get("query_start_time")
+        if not start_times:
+            return
+        duration = perf_counter() - start_times.pop()
+        if not has_app_context():
+            return
+        config = current_app.config
+        if has_request_context():
+            g.db_query_count = g.get("db_query_count", 0) + 1
+            g.db_time = g.get("db_time", 0.0) + duration
+
+        key = self._fingerprints.get(statement)
+        if key is None:
+            key = fingerprint(statement)
+            if len(self._fingerprints) < 4 * config["EMB_QUERY_STATS_SIZE"]:
+                self._fingerprints[statement] = key
+
+        slow = duration >= config["EMB_SLOW_DB_QUERY_TIME"]
+        sample = None
+        if slow or random.random() < config["EMB_QUERY_SAMPLE_RATE"]:
+            if config["EMB_QUERY_SAMPLE_PARAMETERS"] and current_app.debug:
+                sampled_parameters = repr(parameters)[:1000]
+            else:
+                sampled_parameters = describe_parameters(parameters, executemany)
+            sample = {
+                "statement": key,
+                "parameters": sampled_parameters,
+                "duration": duration,
+                "context": calling_context(),
+                "endpoint": request.endpoint if has_request_context() else None,
+                "slow": slow,
+                "time": datetime.utcnow().isoformat(),
+            }
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= config["EMB_QUERY_STATS_SIZE"]:
+                    key = "<other>"
+                stats = self._stats.setdefault(key, {"count": 0, "total": 0.0, "max": 0.0, "samples": []})
+            stats["count"] += 1
+            stats["total"] += duration
+            if duration > stats["max"]:
+                stats["max"] = duration
+            if sample is not None:
+                stats["samples"].append(sample)
+                # keep the slowest samples
+                if len(stats["samples"]) > config["EMB_QUERY_SAMPLES_KEPT"]:
+                    stats["samples"].remove(min(stats["samples"], key=lambda s: s["duration"]))
+            write = monotonic() - self._last_write >= config["EMB_QUERY_STATS_FLUSH_INTERVAL"]
+            if write:
+                self._last_write = monotonic()
+
+        # queued once the stats exist, the plan is stored in them
+        if sample is not None and not executemany and self._explain_due(key, statement):
+            self._queue_explain(key, statement, parameters, sample)
+        if slow:
+            current_app.logger.warning(
+                f"Slow query: {key}\nParameters: {sample['parameters']}\nDuration: {duration}s\n"
+                f"Context: {sample['context']}\n")
+        if write:
+            self.write()
+
+    def _explain_due(self, key, statement):
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            return False
+        now = monotonic()
+        with self._lock:
+            if now - self._explained.get(key, -1e9) < current_app.config["EMB_EXPLAIN_INTERVAL"]:
+                return False
+            self._explained[key] = now
+        return True
+
+    def _queue_explain(self, key, statement, parameters, sample):
+        # started lazily so that pre-forking servers start the thread in each worker
+        app = current_app._get_current_object()
+        with self._lock:
+            if self._explain_queue is None:
+                self._explain_queue = Queue(maxsize=app.config["EMB_EXPLAIN_QUEUE_SIZE"])
+                Thread(target=self._explain_worker, name="query-explain", daemon=True).start()
+        try:
+            self._explain_queue.put_nowait((app, key, statement, parameters, sample["context"], sample["time"]))
+        except Full:
+            with self._lock:
+                # try again with a later sample
+                self._explained.pop(key, None)
+
+    def _explain_worker(self):
+        from app import db
+        while True:
+            app, key, statement, parameters, context, time = self._explain_queue.get()
+            try:
+                with app.app_context():
+                    self._explain(db, app, key, statement, parameters, context, time)
+            finally:
+                self._explain_queue.task_done()
+
+    def _explain(self, db, app, key, statement, parameters, context, time):
+        try:
+            with db.engine.connect() as connection:
+                plan = explain(connection, statement, parameters, app.config["EMB_EXPLAIN_WATCHED_TABLES"])
+        except Exception as e:
+            app.logger.info(f"Could not explain query: {e}")
+            return
+        if plan is None:
+            return
+        plan["time"] = time
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is not None:
+                stats["plan"] = plan
+        if plan["full_scans"]:
+            app.logger.warning(
+                f"Full scan of {', '.join(plan['full_scans'])} in query: {key}\n"
+                f"Plan: {plan['plan']}\nContext: {context}\n")
+
+    def _write_at_exit(self, app):
+        if self._stats:
+            with app.app_context():
+                self.write()
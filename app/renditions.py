@@ -0,0 +1,100 @@
+import os
+import tempfile
+from collections import OrderedDict
+from hashlib import sha1
+from threading import Event, Lock
+
+from flask import current_app, url_for
+
+from app.media_store import is_media_key
+
+
+def rendition_url(filename, folder, size, fmt="jpg"):
+    """Url of a resized copy of an image column value, see image_url."""
+    source = filename if is_media_key(filename) else f"{folder}/{filename}"
+    return url_for("main_bp.rendition", size=size, fmt=fmt, source=source)
+
+
+class RenditionCache:
+    """Bounded on-disk cache of resized images.
+
+    Renditions live in EMB_RENDITION_CACHE_DIR and are evicted least recently
+    used first once they take more than EMB_RENDITION_CACHE_MAX_BYTES.
+    Concurrent misses for the same rendition are single-flighted, so the
+    source is decoded once per process.
+    """
+
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self._entries = None
+        self._total_bytes = 0
+        self._in_flight = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EMB_RENDITION_CACHE_DIR", os.path.join(app.instance_path, "renditions"))
+        app.config.setdefault("EMB_RENDITION_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+        app.extensions["rendition_cache"] = self
+
+    def get(self, source_path, size, fmt, render):
+        """Return the path of source_path rendered at size as fmt.
+
+        render(source_path, target_path, size, fmt) is called on a miss.
+        """
+        mtime = os.stat(source_path).st_mtime_ns
+        name = sha1(f"{source_path}|{mtime}|{size}|{fmt}".encode()).hexdigest() + "." + fmt
+        path = os.path.join(current_app.config["EMB_RENDITION_CACHE_DIR"], name)
+
+        while True:
+            with self._lock:
+                self._load_index()
+                if name in self._entries and os.path.exists(path):
+                    self._entries.move_to_end(name)
+                    return path
+                done = self._in_flight.get(name)
+                if done is None:
+                    done = self._in_flight[name] = Event()
+                    break
+            done.wait()
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            os.close(fd)
+            try:
+                render(source_path, tmp_path, size, fmt)
+                os.replace(tmp_path, path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+            with self._lock:
+                self._add(name, os.path.getsize(path))
+        finally:
+            with self._lock:
+                del self._in_flight[name]
+            done.set()
+        return path
+
+    def _load_index(self):
+        # adopt renditions left on disk by earlier runs, oldest access first
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        directory = current_app.config["EMB_RENDITION_CACHE_DIR"]
+        if os.path.isdir(directory):
+            files = [entry for entry in os.scandir(directory) if entry.is_file() and "." in entry.name]
+            for entry in sorted(files, key=lambda entry: entry.stat().st_atime):
+                self._add(entry.name, entry.stat().st_size)
+
+    def _add(self, name, size):
+        self._total_bytes += size - self._entries.pop(name, 0)
+        self._entries[name] = size
+        directory = current_app.config["EMB_RENDITION_CACHE_DIR"]
+        while self._total_bytes > current_app.config["EMB_RENDITION_CACHE_MAX_BYTES"] and len(self._entries) > 1:
+            evicted, evicted_size = self._entries.popitem(last=False)
+            self._total_bytes -= evicted_size
+            try:
+                os.remove(os.path.join(directory, evicted))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,160 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+from collections import Counter
+from datetime import datetime
+from threading import Event, Thread, get_ident
+from time import perf_counter
+from urllib.parse import parse_qs
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+PROFILE_HEADER = "HTTP_X_EMB_PROFILE"
+PROFILE_ARG = "_profile"
+
+
+class _StackSampler(Thread):
+    """Samples the stack of one thread into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="request-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfiler:
+    """Profiles single requests that carry a signed profiling token.
+
+    A token from make_token() in the X-EMB-Profile header or the _profile
+    query argument runs that request under cProfile while a sampler thread
+    records its stacks. The cProfile dump, a text report and a collapsed-stack
+    file for flamegraph tools are written to EMB_PROFILE_DIR, of which the
+    newest EMB_PROFILE_KEEP profiles are kept. The response names the profile
+    in its X-EMB-Profile header. A token is only honoured while its user is
+    an administrator.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EMB_PROFILE_DIR", os.path.join(app.instance_path, "profiles"))
+        app.config.setdefault("EMB_PROFILE_KEEP", 100)
+        app.config.setdefault("EMB_PROFILE_TOKEN_MAX_AGE", 3600)
+        app.config.setdefault("EMB_PROFILE_SAMPLE_INTERVAL", 0.001)
+        app.config.setdefault("EMB_PROFILE_REPORT_LENGTH", 60)
+        app.extensions["request_profiler"] = self
+        self.app = app
+        wsgi_app = app.wsgi_app
+        app.wsgi_app = lambda environ, start_response: self._wsgi(wsgi_app, environ, start_response)
+
+    def make_token(self, user):
+        """Return a token that enables profiling until EMB_PROFILE_TOKEN_MAX_AGE passes."""
+        return self._serializer().dumps({"user_id": user.id})
+
+    def _serializer(self):
+        return URLSafeTimedSerializer(self.app.config["SECRET_KEY"], salt="request-profile")
+
+    def _requested(self, environ):
+        token = environ.get(PROFILE_HEADER)
+        if token is None and PROFILE_ARG in environ.get("QUERY_STRING", ""):
+            token = parse_qs(environ["QUERY_STRING"]).get(PROFILE_ARG, [None])[0]
+        if not token:
+            return False
+        try:
+            data = self._serializer().loads(token, max_age=self.app.config["EMB_PROFILE_TOKEN_MAX_AGE"])
+        except BadSignature:
+            return False
+        # the token outlives its user's role, which is checked on every request
+        return self._is_administrator(data["user_id"])
+
+    def _is_administrator(self, user_id):
+        from app.models.users_model import User
+        with self.app.app_context():
+            user = User.query.get(user_id)
+            return user is not None and user.is_administrator()
+
+    def _wsgi(self, wsgi_app, environ, start_response):
+        if not self._requested(environ):
+            return wsgi_app(environ, start_response)
+
+        config = self.app.config
+        name = self._name(environ)
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured["response"] = (status, headers, exc_info)
+
+        sampler = _StackSampler(get_ident(), config["EMB_PROFILE_SAMPLE_INTERVAL"])
+        profiler = cProfile.Profile()
+        start = perf_counter()
+        sampler.start()
+        profiler.enable()
+        try:
+            # consume the body inside the profile, streamed responses included
+            iterable = wsgi_app(environ, capture_start_response)
+            try:
+                body = list(iterable)
+            finally:
+                if hasattr(iterable, "close"):
+                    iterable.close()
+        finally:
+            profiler.disable()
+            sampler.stop()
+            name = f"{name}-{(perf_counter() - start) * 1000:.0f}ms"
+            self._save(name, environ, profiler, sampler.stacks)
+
+        status, headers, exc_info = captured["response"]
+        start_response(status, headers + [("X-EMB-Profile", name)], exc_info)
+        return body
+
+    @staticmethod
+    def _name(environ):
+        path = re.sub(r"[^A-Za-z0-9]+", "_", environ.get("PATH_INFO", "")).strip("_") or "root"
+        return f"{datetime.utcnow():%Y%m%d-%H%M%S-%f}-{environ.get('REQUEST_METHOD', 'GET')}-{path[:60]}"
+
+    def _save(self, name, environ, profiler, stacks):
+        config = self.app.config
+        directory = config["EMB_PROFILE_DIR"]
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, name)
+
+        profiler.dump_stats(base + ".prof")
+        report = io.StringIO()
+        report.write(f"{environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')}?{environ.get('QUERY_STRING', '')}\n\n")
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(config["EMB_PROFILE_REPORT_LENGTH"])
+        with open(base + ".txt", "w") as f:
+            f.write(report.getvalue())
+        with open(base + ".collapsed", "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+        # names start with the timestamp, so they sort oldest first
+        profiles = sorted(entry[:-len(".prof")] for entry in os.listdir(directory) if entry.endswith(".prof"))
+        for old in profiles[:-config["EMB_PROFILE_KEEP"]]:
+            for ext in (".prof", ".txt", ".collapsed"):
+                try:
+                    os.remove(os.path.join(directory, old + ext))
+                except FileNotFoundError:
+                    pass
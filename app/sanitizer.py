@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from hashlib import sha1
+from threading import Lock, local
+
+from bleach.linkifier import Linker
+from bleach.sanitizer import Cleaner
+from markupsafe import Markup
+
+
+POST_TAGS = ["h1", "h2", "h3", "p", "pre", "div", "span", "big", "small", "tt", "code",
+             "kbd", "samp", "var", "del", "ins", "cite", "q", "strong", "b", "em", "i",
+             "u", "s", "ol", "ul", "li", "blockquote", "a", "img", "table", "caption",
+             "thead", "tbody", "tfoot", "tr", "th", "td", "hr", ]
+
+COMMENT_TAGS = ["strong", "b", "em", "i", "ol", "ul", "li", "a", ]
+
+
+class Sanitizer:
+    """Cleans and linkifies user HTML, the same as bleach.linkify(bleach.clean(...)).
+
+    The bleach Cleaner and Linker are built once per thread (they keep parser
+    state and are not thread-safe), and results are memoized by content hash in
+    a bounded LRU so that re-saving an unchanged body costs a dict lookup.
+    """
+
+    def __init__(self, tags, cache_size=1024):
+        self.tags = tags
+        self.cache_size = cache_size
+        self._local = local()
+        self._lock = Lock()
+        self._cache = OrderedDict()
+
+    def clean(self, value):
+        key = sha1(value.encode("utf-8")).digest()
+        with self._lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+                return body
+
+        body = self._sanitize(value)
+        with self._lock:
+            self._cache[key] = body
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return body
+
+    def clean_many(self, values):
+        """Sanitize a batch of bodies, e.g. for bulk imports.
+
+        Duplicates in the batch are sanitized once and results bypass the LRU
+        so that a large import does not evict the working set.
+        """
+        results = {}
+        for value in values:
+            if value not in results:
+                results[value] = self._sanitize(value)
+        return [results[value] for value in values]
+
+    def _sanitize(self, value):
+        cleaner = getattr(self._local, "cleaner", None)
+        if cleaner is None:
+            cleaner = self._local.cleaner = Cleaner(tags=self.tags, strip=True)
+            self._local.linker = Linker()
+        return self._local.linker.linkify(cleaner.clean(value))
+
+
+def make_excerpt(body, length=150, leeway=5):
+    """Plain-text excerpt of sanitized HTML, truncated like Jinja's truncate filter."""
+    text = Markup(body).striptags()
+    if len(text) <= length + leeway:
+        return text
+    return text[:length - 3].rsplit(" ", 1)[0] + "..."
+
+
+post_sanitizer = Sanitizer(POST_TAGS)
+
+comment_sanitizer = Sanitizer(COMMENT_TAGS)
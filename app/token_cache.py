@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+from flask import current_app
+
+
+class TokenCache:
+    """Bounded TTL/LRU cache of verified API tokens.
+
+    Maps a token to the detached User it authenticates (with its role loaded),
+    so repeat requests skip the JWT decode and the user and role queries.
+    Entries expire after EMB_TOKEN_CACHE_TTL seconds or with the token itself,
+    whichever is sooner. The cache is per process, so an entry that was last
+    checked more than EMB_TOKEN_CACHE_REVALIDATE seconds ago is reported as
+    stale, and callers compare the cached user's auth_version, the one its
+    tokens were issued with, to the database before using it. Any worker bumps
+    it when the user's role, confirmation or password changes, which revokes
+    the user's tokens everywhere within that interval.
+    """
+
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EMB_TOKEN_CACHE_SIZE", 1024)
+        app.config.setdefault("EMB_TOKEN_CACHE_TTL", 300)
+        app.config.setdefault("EMB_TOKEN_CACHE_REVALIDATE", 10)
+        app.extensions["token_cache"] = self
+
+    def get(self, token):
+        """Return (user, stale) for a cached token, (None, False) otherwise."""
+        now = time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None, False
+            expires_at, user_id, user, checked_at = entry
+            if expires_at <= now:
+                del self._entries[token]
+                return None, False
+            self._entries.move_to_end(token)
+            return user, now - checked_at >= current_app.config["EMB_TOKEN_CACHE_REVALIDATE"]
+
+    def checked(self, token):
+        """Record that the cached entry of token still matches the database."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                self._entries[token] = entry[:3] + (time(),)
+
+    def set(self, token, user, expires_at):
+        now = time()
+        expires_at = min(expires_at, now + current_app.config["EMB_TOKEN_CACHE_TTL"])
+        with self._lock:
+            self._entries[token] = (expires_at, user.id, user, now)
+            self._entries.move_to_end(token)
+            while len(self._entries) > current_app.config["EMB_TOKEN_CACHE_SIZE"]:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for token in [token for token, entry in self._entries.items() if entry[1] == user_id]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -4,18 +4,20 @@ from flask import current_app, flash, redirect, render_template, request, url_fo
 from flask_login import current_user, login_required
 
 from app.user.forms import ChangeProfileImageForm, EditProfileAdminForm, EditProfileForm
-from app.main.image_handler import change_profile_image
+from app.main.image_handler import DEFAULT_PROFILE_IMAGE, PROCESSING_PROFILE_IMAGE, change_profile_image
+from app.media_store import is_media_key
 from app.models.posts_model import Post
 from app.models.roles_model import Permission, Role
 
 from app.models.users_model import User
 from app.user import user_bp
 from app import db
-from app.decorators import permission_required
+from app.decorators import permission_required, query_budget
 
 
 @user_bp.route("/<string:username>/", methods=["GET", "POST"])
 @login_required
+@query_budget(6)
 def profile(username):
     user = User.query.filter_by(username=username).first_or_404()
 
@@ -23,23 +25,24 @@ def profile(username):
     if form.validate_on_submit():
         if not form.reset_profile_image.data:
             if form.new_profile_image.data:
-                username = user.username
-                image = change_profile_image(form.new_profile_image.data, username)
-                user.profile_image = image
+                user.profile_image = PROCESSING_PROFILE_IMAGE
                 db.session.commit()
-                flash("Your Profile Image has been changed successfully.", "success")
-        elif user.profile_image != "default_profile_image.jpg":
-            image_file_name = user.profile_image
-            image_file_path = os.path.join(
-                current_app.root_path, r"static/main/images/profile-images", image_file_name)
-            os.remove(image_file_path)
-            user.profile_image = "default_profile_image.jpg"
+                change_profile_image(form.new_profile_image.data, user.id)
+                flash("Your Profile Image has been uploaded and will appear shortly.", "success")
+        elif user.profile_image not in (DEFAULT_PROFILE_IMAGE, PROCESSING_PROFILE_IMAGE):
+            if not is_media_key(user.profile_image):
+                # stored images are removed by `flask media-gc` once unreferenced
+                image_file_path = os.path.join(
+                    current_app.root_path, r"static/user/profile-images", user.profile_image)
+                os.remove(image_file_path)
+            user.profile_image = DEFAULT_PROFILE_IMAGE
             db.session.commit()
             flash("Your Profile Image has been reset successfully.", "success")
         return redirect(url_for("user_bp.profile", username=user.username))
 
     page = request.args.get("page", 1, type=int)
-    pagination = user.posts.order_by(Post.timestamp.desc()).paginate(
+    # the posts' author is user, so post.author needs no query
+    pagination = user.posts.order_by(Post.timestamp.desc()).options(*Post.card_options(load_authors=False)).paginate(
         page,
         per_page=current_app.config["EMB_POSTS_PER_PAGE"],
         error_out=False,
@@ -124,6 +127,7 @@ def unfollow(username):
 
 
 @user_bp.route("/followers/<string:username>/")
+@query_budget(4)
 def followers(username):
     user = User.query.filter_by(username=username).first_or_404()
     page = request.args.get("page", 1, type=int)
@@ -138,6 +142,7 @@ def followers(username):
 
 
 @user_bp.route('/followed_by/<string:username>/')
+@query_budget(4)
 def followed_by(username):
     user = User.query.filter_by(username=username).first_or_404()
     page = request.args.get('page', 1, type=int)
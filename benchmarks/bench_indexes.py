@@ -0,0 +1,128 @@
+"""Benchmark the hot listing queries with and without the composite indexes.
+
+Seeds a large SQLite database from the app's models, then runs each query
+with the indexes added by migration 5b8e2c7d9f31 dropped and again with
+them in place, printing the query plan and the mean latency of both runs.
+
+Usage: python benchmarks/bench_indexes.py [--users N] [--posts N] [--comments N] [--follows N]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select, text
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from app import create_app, db  # noqa: E402
+from app.models.comments_model import Comment  # noqa: E402
+from app.models.follows_model import Follow  # noqa: E402
+from app.models.posts_model import Post  # noqa: E402
+from app.models.users_model import User  # noqa: E402
+
+INDEXES = {
+    "ix_posts_author_id_timestamp": "CREATE INDEX ix_posts_author_id_timestamp ON posts (author_id, timestamp)",
+    "ix_comments_post_id_timestamp": "CREATE INDEX ix_comments_post_id_timestamp ON comments (post_id, timestamp)",
+    "ix_comments_disabled_timestamp":
+        "CREATE INDEX ix_comments_disabled_timestamp ON comments (timestamp) WHERE disabled = 1",
+    "ix_follows_followed_id_follower_id":
+        "CREATE INDEX ix_follows_followed_id_follower_id ON follows (followed_id, follower_id)",
+}
+
+
+def seed(engine, users, posts, comments, follows, rng):
+    start = datetime(2020, 1, 1)
+
+    def timestamp():
+        return start + timedelta(seconds=rng.randrange(3 * 365 * 24 * 3600))
+
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [
+            {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "password_hash": "x",
+             "confirmed": True, "member_since": start, "last_seen": start}
+            for i in range(1, users + 1)])
+        connection.execute(Post.__table__.insert(), [
+            {"id": i, "title": f"Post {i}", "raw_body": "body", "body": "body", "excerpt": "body",
+             "timestamp": timestamp(), "author_id": rng.randint(1, users)}
+            for i in range(1, posts + 1)])
+        connection.execute(Comment.__table__.insert(), [
+            {"id": i, "raw_body": "comment", "body": "comment", "timestamp": timestamp(),
+             "disabled": rng.random() < 0.001, "author_id": rng.randint(1, users), "post_id": rng.randint(1, posts)}
+            for i in range(1, comments + 1)])
+        pairs = {(rng.randint(1, users), rng.randint(1, users)) for _ in range(follows)}
+        connection.execute(Follow.__table__.insert(), [
+            {"follower_id": a, "followed_id": b, "timestamp": timestamp()} for a, b in pairs if a != b])
+        connection.execute(text("ANALYZE"))
+
+
+def queries(users, posts):
+    return [
+        ("user's posts", select(Post.id, Post.title, Post.timestamp)
+         .where(Post.author_id == users // 2).order_by(Post.timestamp.desc()).limit(6)),
+        ("post's comments", select(Comment.id, Comment.timestamp)
+         .where(Comment.post_id == posts // 2).order_by(Comment.timestamp.asc()).limit(10)),
+        ("followers of a user", select(Follow.follower_id).where(Follow.followed_id == users // 2)),
+        ("followed authors' posts", select(Post.id, Post.title, Post.timestamp)
+         .join(Follow, Follow.followed_id == Post.author_id)
+         .where(Follow.follower_id == users // 3).order_by(Post.timestamp.desc()).limit(6)),
+        ("disabled comments", select(Comment.id, Comment.timestamp)
+         .where(Comment.disabled == db.true()).order_by(Comment.timestamp.desc()).limit(10)),
+    ]
+
+
+def measure(connection, statement, number):
+    def run():
+        connection.execute(statement).fetchall()
+    run()
+    return min(timeit.repeat(run, number=number, repeat=3)) / number
+
+
+def plan(connection, statement):
+    compiled = statement.compile(connection, compile_kwargs={"literal_binds": True})
+    return "; ".join(row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--posts", type=int, default=200000)
+    parser.add_argument("--comments", type=int, default=500000)
+    parser.add_argument("--follows", type=int, default=300000)
+    parser.add_argument("--number", type=int, default=20, help="iterations per measurement")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.sqlite')}")
+        app = create_app("testing")
+        with app.app_context():
+            db.metadata.create_all(engine)
+        print(f"seeding {args.users} users, {args.posts} posts, {args.comments} comments, {args.follows} follows")
+        seed(engine, args.users, args.posts, args.comments, args.follows, random.Random(args.seed))
+
+        results = {}
+        with engine.connect() as connection:
+            for state in ("without", "with"):
+                for name, ddl in INDEXES.items():
+                    connection.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+                    if state == "with":
+                        connection.exec_driver_sql(ddl)
+                connection.exec_driver_sql("ANALYZE")
+                for name, statement in queries(args.users, args.posts):
+                    results.setdefault(name, {})[state] = (measure(connection, statement, args.number),
+                                                           plan(connection, statement))
+
+        for name, runs in results.items():
+            (before, before_plan), (after, after_plan) = runs["without"], runs["with"]
+            print(f"\n{name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms ({before / after:.1f}x)")
+            print(f"  without: {before_plan}")
+            print(f"  with:    {after_plan}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark outbound mail throughput against the local SMTP stand-in.
+
+Sends a burst of messages the old way (one thread and one SMTP connection
+per message) and through the MailQueue in app/mail_queue.py, reporting the
+time until every message was accepted and how many connections were opened.
+
+Usage: python benchmarks/bench_mail_queue.py [--messages N] [--connect-latency S] [--latency S]
+"""
+import argparse
+import os
+import sys
+import time
+from threading import Thread
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from flask_mail import Message  # noqa: E402
+
+from app import create_app, mail, mail_queue  # noqa: E402
+from smtp_standin import SMTPStandIn  # noqa: E402
+
+
+def make_message(i):
+    return Message(f"[EMB] Message {i}", sender="bench@localhost", recipients=[f"user{i}@localhost"],
+                   body="Hello\n" * 20)
+
+
+def wait_for(server, count, timeout=30):
+    deadline = time.monotonic() + timeout
+    while server.messages < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def legacy(app, server, count):
+    def send_async_email(msg):
+        with app.app_context():
+            mail.send(msg)
+
+    for i in range(count):
+        Thread(target=send_async_email, args=(make_message(i),), daemon=True).start()
+    wait_for(server, count)
+
+
+def queued(app, server, count):
+    with app.app_context():
+        for i in range(count):
+            mail_queue.send(make_message(i))
+    wait_for(server, count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--connect-latency", type=float, default=0.05, help="simulated handshake cost")
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated cost per message")
+    args = parser.parse_args()
+
+    app = create_app("testing")
+    for name, run in (("thread per message", legacy), ("mail queue", queued)):
+        server = SMTPStandIn(("localhost", 0), args.connect_latency, args.latency).start()
+        app.config.update(MAIL_SERVER="localhost", MAIL_PORT=server.server_address[1], MAIL_USE_TLS=False,
+                          MAIL_USERNAME=None, MAIL_SUPPRESS_SEND=False, EMB_MAIL_WORKERS=args.workers,
+                          EMB_MAIL_QUEUE_SIZE=args.messages)
+        mail.init_app(app)
+
+        start = time.perf_counter()
+        run(app, server, args.messages)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<20} {server.messages:>6} messages  {elapsed:7.2f}s  "
+              f"{server.messages / elapsed:8.1f} msg/s  {server.connections:>5} connections")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark post/comment sanitization for typical CKEditor payload sizes.
+
+Compares the old per-call bleach.linkify(bleach.clean(...)) against the
+Sanitizer in app/sanitizer.py on a cache miss, a cache hit and in batch mode.
+
+Usage: python benchmarks/bench_sanitizer.py [--number N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import bleach
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from app.sanitizer import COMMENT_TAGS, POST_TAGS, Sanitizer  # noqa: E402
+
+
+PARAGRAPH = ("<p>Lorem <strong>ipsum</strong> dolor sit amet, <em>consectetur</em> adipiscing elit. "
+             "See https://example.com/some/path?x=1 for details.</p>\n")
+TABLE = ("<table><thead><tr><th>Name</th><th>Value</th></tr></thead><tbody>"
+         + "<tr><td>key</td><td>value</td></tr>" * 10 + "</tbody></table>\n")
+SCRIPT = "<script>alert('xss')</script><img src=x onerror=alert(1)>\n"
+
+PAYLOADS = [
+    ("comment", COMMENT_TAGS, "<p>Nice post, <b>thanks</b>! https://example.com</p>"),
+    ("short post", POST_TAGS, "<h2>Intro</h2>\n" + PARAGRAPH * 12),
+    ("long post", POST_TAGS, ("<h2>Section</h2>\n" + PARAGRAPH * 10 + TABLE + SCRIPT) * 6),
+    ("huge post", POST_TAGS, ("<h2>Section</h2>\n" + PARAGRAPH * 10 + TABLE + SCRIPT) * 30),
+]
+
+
+def legacy(value, tags):
+    return bleach.linkify(bleach.clean(value, tags=tags, strip=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=50, help="iterations per measurement")
+    args = parser.parse_args()
+
+    print(f"{'payload':<22}{'bytes':>8}{'legacy':>12}{'miss':>12}{'hit':>12}{'batch/item':>12}")
+    for name, tags, value in PAYLOADS:
+        sanitizer = Sanitizer(tags)
+        assert sanitizer.clean(value) == legacy(value, tags)
+
+        per_call = timeit.timeit(lambda: legacy(value, tags), number=args.number) / args.number
+        # distinct payloads so that every call is a cache miss
+        misses = [value + f"<!-- {i} -->" for i in range(args.number)]
+        miss_iter = iter(misses)
+        miss = timeit.timeit(lambda: sanitizer.clean(next(miss_iter)), number=args.number) / args.number
+        hit = timeit.timeit(lambda: sanitizer.clean(value), number=args.number) / args.number
+        batch = timeit.timeit(lambda: sanitizer.clean_many(misses), number=1) / args.number
+
+        print(f"{name:<22}{len(value):>8}"
+              f"{per_call * 1e6:>10.0f}us{miss * 1e6:>10.0f}us{hit * 1e6:>10.1f}us{batch * 1e6:>10.0f}us")
+
+
+if __name__ == "__main__":
+    main()
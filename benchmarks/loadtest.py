@@ -0,0 +1,419 @@
+"""Load test the main pages and API collections over HTTP.
+
+Seeds a SQLite database with `bulk_seed` (or uses --database as is), starts
+the app with the production config under gunicorn, or werkzeug's threaded
+server where gunicorn is not installed, and drives it with concurrent clients
+that each log in as a different seeded user. The results hold p50/p95/p99
+latency, throughput and the per-request query count and DB time the app
+reports in its X-EMB-DB-* headers, per endpoint and in total, as JSON.
+
+A run compared to an earlier result file with --baseline exits with status 1
+when an endpoint's p95 latency or mean query count grew by more than
+--threshold; --compare OLD NEW compares two result files without a run.
+
+Usage: python benchmarks/loadtest.py [--clients N] [--duration S] [--output FILE] [--baseline FILE]
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import math
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from base64 import b64encode
+from datetime import datetime
+from http.cookies import SimpleCookie
+from random import Random
+from threading import Thread
+from urllib.parse import urlencode
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT)
+
+CSRF_TOKEN = re.compile(r'name="csrf_token"[^>]*value="([^"]*)"')
+
+# endpoint name and its share of the requests
+ENDPOINTS = (
+    ("posts", 20),
+    ("followed", 15),
+    ("view_post", 20),
+    ("profile", 15),
+    ("api_posts", 8),
+    ("api_comments", 6),
+    ("api_user_posts", 8),
+    ("api_timeline", 8),
+)
+
+
+class Client:
+    """One logged in user on a keep-alive connection."""
+
+    def __init__(self, address, email, password, targets, rng):
+        self.address = address
+        self.email = email
+        self.password = password
+        self.targets = targets
+        self.rng = rng
+        self.cookies = {}
+        self.token = None
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None, cookies=None):
+        headers = dict(headers or {})
+        cookies = dict(self.cookies, **(cookies or {}))
+        if cookies:
+            headers["Cookie"] = "; ".join(f"{name}={value}" for name, value in cookies.items())
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(*self.address, timeout=60)
+            try:
+                self.connection.request(method, path, body, headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # the server may have closed an idle keep-alive connection
+                self.connection.close()
+                self.connection = None
+                if attempt == 2:
+                    raise
+        for header in response.headers.get_all("Set-Cookie") or ():
+            for name, morsel in SimpleCookie(header).items():
+                if morsel.value and morsel["max-age"] != "0":
+                    self.cookies[name] = morsel.value
+                else:
+                    self.cookies.pop(name, None)
+        return response, data
+
+    def login(self):
+        _, page = self.request("GET", "/auth/login/")
+        match = CSRF_TOKEN.search(page.decode())
+        form = {"email": self.email, "password": self.password, "submit": "Log In"}
+        if match:
+            form["csrf_token"] = match.group(1)
+        response, _ = self.request("POST", "/auth/login/", urlencode(form))
+        if response.status != 302 or "/auth/login/" in response.getheader("Location", ""):
+            raise RuntimeError(f"Could not log in as {self.email}")
+        credentials = b64encode(f"{self.email}:{self.password}".encode()).decode()
+        response, data = self.request("POST", "/api/v1/tokens/", headers={"Authorization": f"Basic {credentials}"})
+        if response.status != 200:
+            raise RuntimeError(f"Could not get an API token for {self.email}: {response.status}")
+        self.token = json.loads(data)["token"]
+
+    def page(self):
+        # most readers stay on the first pages
+        return min(int(self.rng.expovariate(0.7)) + 1, 20)
+
+    def call(self, name):
+        """Request one page of the endpoint name, return the response."""
+        choose = self.rng.choice
+        cookies = None
+        if name == "posts":
+            path, cookies = f"/post/posts/?page={self.page()}", {"show_followed": ""}
+        elif name == "followed":
+            path, cookies = f"/post/posts/?page={self.page()}", {"show_followed": "1"}
+        elif name == "view_post":
+            username, post_id = choose(self.targets["posts"])
+            path = f"/post/{username}/{post_id}/"
+        elif name == "profile":
+            path = f"/user/{choose(self.targets['profiles'])[1]}/"
+        elif name == "api_posts":
+            path = f"/api/v1/posts/?page={self.page()}"
+        elif name == "api_comments":
+            path = f"/api/v1/comments/?page={self.page()}"
+        elif name == "api_user_posts":
+            path = f"/api/v1/users/{choose(self.targets['profiles'])[0]}/posts/"
+        else:
+            path = f"/api/v1/users/{self.targets['user_id']}/timeline/?page={self.page()}"
+        headers = {}
+        if name.startswith("api_"):
+            credentials = b64encode(f"{self.token}:".encode()).decode()
+            headers = {"Authorization": f"Basic {credentials}", "Accept": "application/json"}
+        response, _ = self.request("GET", path, headers=headers, cookies=cookies)
+        return response
+
+
+def run_client(client, deadline, measure_from, records, errors):
+    names = [name for name, _ in ENDPOINTS]
+    weights = [weight for _, weight in ENDPOINTS]
+    try:
+        client.login()
+    except Exception as e:
+        errors.append(str(e))
+        return
+    while True:
+        name = client.rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        if start >= deadline:
+            break
+        try:
+            response = client.call(name)
+            status = response.status
+            queries = int(response.getheader("X-EMB-DB-Queries", -1))
+            db_time = float(response.getheader("X-EMB-DB-Time", -1))
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+            status, queries, db_time = None, -1, -1.0
+        end = time.perf_counter()
+        if start >= measure_from:
+            records.append((name, status, end - start, queries, db_time))
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of sorted values."""
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def summarize(records, elapsed):
+    grouped = {name: [] for name, _ in ENDPOINTS}
+    for record in records:
+        grouped[record[0]].append(record)
+    grouped["total"] = records
+    results = {}
+    for name, group in grouped.items():
+        latencies = sorted(latency for _, status, latency, _, _ in group if status is not None and status < 400)
+        queries = [q for _, _, _, q, _ in group if q >= 0]
+        db_times = [t for _, _, _, _, t in group if t >= 0]
+        results[name] = {
+            "requests": len(group),
+            "errors": len(group) - len(latencies),
+            "throughput": len(latencies) / elapsed,
+            "mean_ms": 1000 * sum(latencies) / len(latencies) if latencies else None,
+            "p50_ms": 1000 * percentile(latencies, 50) if latencies else None,
+            "p95_ms": 1000 * percentile(latencies, 95) if latencies else None,
+            "p99_ms": 1000 * percentile(latencies, 99) if latencies else None,
+            "max_ms": 1000 * latencies[-1] if latencies else None,
+            "queries_mean": sum(queries) / len(queries) if queries else None,
+            "queries_max": max(queries) if queries else None,
+            "db_ms_mean": 1000 * sum(db_times) / len(db_times) if db_times else None,
+        }
+    return results
+
+
+def print_results(results):
+    print(f"{'endpoint':<16} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'queries':>8} {'db ms':>7}")
+    for name, stats in results["endpoints"].items():
+        def fmt(key, width, digits=1):
+            value = stats[key]
+            return f"{'-':>{width}}" if value is None else f"{value:>{width}.{digits}f}"
+        print(f"{name:<16} {stats['requests']:>8} {stats['errors']:>6} {fmt('throughput', 8)} {fmt('p50_ms', 8)} "
+              f"{fmt('p95_ms', 8)} {fmt('p99_ms', 8)} {fmt('queries_mean', 8)} {fmt('db_ms_mean', 7, 2)}")
+
+
+def compare(baseline, results, threshold):
+    """Print the changes from baseline, return the regressed endpoints."""
+    regressions = []
+    print(f"\n{'endpoint':<16} {'p95 ms':>19} {'queries':>15} {'req/s':>19}")
+    for name, stats in results["endpoints"].items():
+        old = baseline["endpoints"].get(name)
+        if old is None:
+            continue
+        changes = []
+        for key, width in (("p95_ms", 19), ("queries_mean", 15), ("throughput", 19)):
+            if old[key] is None or stats[key] is None:
+                changes.append(f"{'-':>{width}}")
+                continue
+            changes.append(f"{f'{old[key]:.1f} -> {stats[key]:.1f}':>{width}}")
+            if key != "throughput" and stats[key] > old[key] * (1 + threshold) and stats[key] - old[key] > 0.5:
+                regressions.append(f"{name} {key}")
+        print(f"{name:<16} " + " ".join(changes))
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return regressions
+
+
+def seed_database(app, args):
+    from app import db
+    from app.fake import bulk_seed
+    from app.models.roles_model import Role
+
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        print(f"seeding {args.users} users, {args.posts} posts, {args.comments} comments")
+        bulk_seed(users=args.users, posts=args.posts, comments=args.comments, follows=args.follows,
+                  seed=args.seed, password=args.password, progress=lambda message: print(f"  {message}"))
+        db.session.remove()
+        db.engine.dispose()
+
+
+def pick_targets(app, args):
+    """Choose the users that log in and the profiles and posts they visit."""
+    from app import db
+    from app.models.posts_model import Post
+    from app.models.users_model import User
+
+    rng = Random(args.seed)
+    with app.app_context():
+        readers = db.session.query(User.id, User.email).filter(User.confirmed.is_(True), User.followed_count > 0) \
+            .order_by(User.id).all()
+        if len(readers) < args.clients:
+            raise SystemExit(f"{len(readers)} confirmed users follow someone, {args.clients} clients need as many")
+        # popular profiles get most visits, so both them and a random spread are visited
+        popular = db.session.query(User.id, User.username).order_by(User.follower_count.desc()).limit(50).all()
+        user_count = db.session.query(db.func.max(User.id)).scalar()
+        spread = db.session.query(User.id, User.username) \
+            .filter(User.id.in_(rng.sample(range(1, user_count + 1), min(user_count, 500)))).all()
+        post_count = db.session.query(db.func.max(Post.id)).scalar() or 0
+        posts = db.session.query(User.username, Post.id).join(Post.author) \
+            .filter(Post.id.in_(rng.sample(range(1, post_count + 1), min(post_count, 500)))).all()
+        db.session.remove()
+        db.engine.dispose()
+    return rng.sample(readers, args.clients), [tuple(row) for row in popular + spread], [tuple(row) for row in posts]
+
+
+def free_port(host):
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, env, log):
+    host = "127.0.0.1"
+    port = args.port or free_port(host)
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "emb:app", "--bind", f"{host}:{port}",
+                   "--workers", str(args.workers), "--threads", str(args.threads)]
+    else:
+        command = [sys.executable, os.path.abspath(__file__), "--serve", f"{host}:{port}"]
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f"The server exited with status {server.returncode}:\n{log.read()[-2000:]}")
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=5)
+            connection.request("GET", "/auth/login/")
+            if connection.getresponse().status == 200:
+                connection.close()
+                return server, (host, port)
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    log.seek(0)
+    raise RuntimeError(f"The server did not answer within 60 seconds:\n{log.read()[-2000:]}")
+
+
+def serve(address):
+    from werkzeug.serving import make_server
+
+    from emb import app
+    host, port = address.rsplit(":", 1)
+    make_server(host, int(port), app, threaded=True).serve_forever()
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16, help="concurrent logged in clients")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of unmeasured requests first")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--comments", type=int, default=60000)
+    parser.add_argument("--follows", type=int, default=20, help="mean number of users each user follows")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--password", default="password", help="password of the seeded users")
+    parser.add_argument("--database", help="URL of an already seeded database to use instead of seeding one")
+    parser.add_argument("--server", choices=["gunicorn", "werkzeug"],
+                        default="gunicorn" if importlib.util.find_spec("gunicorn") else "werkzeug")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--port", type=int, default=0, help="server port, a free one by default")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare the results with this earlier result file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative growth that counts as a regression")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.environ.setdefault("SECRET_KEY", "loadtest")
+    if args.serve:
+        return serve(args.serve)
+    if args.compare:
+        old, new = (load(path) for path in args.compare)
+        return 1 if compare(old, new, args.threshold) else 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database or f"sqlite:///{os.path.join(directory, 'loadtest.sqlite')}"
+        # config.py reads these on import, in this process and in the server's
+        os.environ.update(FLASK_CONFIG="production", DATABASE_URL=database_url, EMB_DB_STATS_HEADERS="1")
+        from app import create_app
+        app = create_app("production")
+        if not args.database:
+            seed_database(app, args)
+        readers, profiles, posts = pick_targets(app, args)
+
+        with open(os.path.join(directory, "server.log"), "w+") as log:
+            server, address = start_server(args, dict(os.environ), log)
+            try:
+                records, errors = [], []
+                measure_from = time.perf_counter() + args.warmup
+                deadline = measure_from + args.duration
+                threads = []
+                for i, (user_id, email) in enumerate(readers):
+                    targets = {"user_id": user_id, "profiles": profiles, "posts": posts}
+                    client = Client(address, email, args.password, targets, Random(args.seed * 1000 + i))
+                    threads.append(Thread(target=run_client, args=(client, deadline, measure_from, records, errors)))
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - measure_from
+            finally:
+                server.terminate()
+                server.wait(30)
+            if errors:
+                log.seek(0)
+                print(f"{len(errors)} errors, first: {errors[0]}\nserver log tail:\n{log.read()[-2000:]}")
+
+    results = {
+        "meta": {
+            "time": datetime.utcnow().isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "server": args.server,
+            "workers": args.workers if args.server == "gunicorn" else 1,
+            "threads": args.threads if args.server == "gunicorn" else None,
+            "clients": args.clients,
+            "duration": args.duration,
+            "dataset": "external" if args.database else {
+                "users": args.users, "posts": args.posts, "comments": args.comments,
+                "follows": args.follows, "seed": args.seed,
+            },
+        },
+        "endpoints": summarize(records, elapsed),
+    }
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline and compare(load(args.baseline), results, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""Microbenchmarks of the model-layer code that runs on every request.
+
+Times body sanitization on the Post/Comment raw_body events, to_json(),
+User.followed_posts for readers following 10 to 1000 users, User.can(),
+API token encoding and verification, and the image handlers, against an
+in-memory SQLite database. Every benchmark is timed in --repeat samples of
+an auto-calibrated number of loops.
+
+--save writes the samples as a JSON baseline. --baseline compares a run with
+such a file: a benchmark regressed when a one-sided Mann-Whitney U test finds
+it slower at --alpha and its median grew by more than --min-change. Any
+regression makes the script exit with status 1.
+
+Usage: python benchmarks/microbench.py [-k PATTERN] [--save FILE] [--baseline FILE]
+"""
+import argparse
+import fnmatch
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+from random import Random
+
+from PIL import Image
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from app import create_app, db  # noqa: E402
+from app.main.image_handler import render_rendition  # noqa: E402
+from app.models.comments_model import Comment  # noqa: E402
+from app.models.follows_model import Follow  # noqa: E402
+from app.models.posts_model import Post  # noqa: E402
+from app.models.roles_model import Permission, Role  # noqa: E402
+from app.models.timeline_model import TimelineEntry  # noqa: E402
+from app.models.users_model import User  # noqa: E402
+from app.post.image_handler import post_image_srcsets, save_post_image_variants  # noqa: E402
+
+PARAGRAPH = ("<p>Lorem <strong>ipsum</strong> dolor sit amet, <em>consectetur</em> adipiscing elit. "
+             "See https://example.com/some/path?x=1 for details.</p>\n")
+POST_BODY = "<h2>Intro</h2>\n" + PARAGRAPH * 12 + "<script>alert('xss')</script>\n"
+COMMENT_BODY = "<p>Nice post, <b>thanks</b>! https://example.com</p>"
+FOLLOW_GRAPH_SIZES = (10, 100, 1000)
+AUTHORS = 2000
+POSTS_PER_AUTHOR = 5
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a setup function that returns the callable to time."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def unique(body):
+    """Return a body the sanitizer's cache has not seen."""
+    counter = 0
+
+    def next_body():
+        nonlocal counter
+        counter += 1
+        return f"{body}<p>{counter}</p>"
+    return next_body
+
+
+@benchmark("post.on_changed_body")
+def post_on_changed_body(data):
+    post, body = Post(), unique(POST_BODY)
+
+    def run():
+        post.raw_body = body()
+    return run
+
+
+@benchmark("post.on_changed_body.cached")
+def post_on_changed_body_cached(data):
+    post = Post()
+
+    def run():
+        post.raw_body = POST_BODY
+    return run
+
+
+@benchmark("comment.on_changed_body")
+def comment_on_changed_body(data):
+    comment, body = Comment(), unique(COMMENT_BODY)
+
+    def run():
+        comment.raw_body = body()
+    return run
+
+
+@benchmark("post.to_json")
+def post_to_json(data):
+    return data["post"].to_json
+
+
+@benchmark("user.to_json")
+def user_to_json(data):
+    return data["readers"][FOLLOW_GRAPH_SIZES[0]].to_json
+
+
+def followed_posts(reader):
+    def setup(data):
+        user = data["readers"][reader]
+        return lambda: user.followed_posts.limit(6).all()
+    return setup
+
+
+for size in FOLLOW_GRAPH_SIZES:
+    benchmark(f"user.followed_posts.{size}")(followed_posts(size))
+benchmark(f"user.followed_posts.{FOLLOW_GRAPH_SIZES[-1]}.fanout_on_read")(followed_posts("mixed"))
+
+
+@benchmark("user.can")
+def user_can(data):
+    user = data["readers"][FOLLOW_GRAPH_SIZES[0]]
+    return lambda: user.can(Permission.MODERATE)
+
+
+@benchmark("user.generate_auth_token")
+def generate_auth_token(data):
+    return data["readers"][FOLLOW_GRAPH_SIZES[0]].generate_auth_token
+
+
+@benchmark("user.verify_auth_token")
+def verify_auth_token(data):
+    token = data["readers"][FOLLOW_GRAPH_SIZES[0]].generate_auth_token()
+    return lambda: User.verify_auth_token(token)
+
+
+@benchmark("image.save_post_image_variants")
+def image_save_post_image_variants(data):
+    image = Image.open(data["jpeg"])
+    image.load()
+    stem = os.path.join(data["directory"], "variant")
+    return lambda: save_post_image_variants(image, stem)
+
+
+@benchmark("image.render_rendition")
+def image_render_rendition(data):
+    target = os.path.join(data["directory"], "rendition.jpg")
+    return lambda: render_rendition(data["jpeg"], target, (192, 192), "jpg")
+
+
+@benchmark("image.post_image_srcsets")
+def image_post_image_srcsets(data):
+    post = data["post"]
+    return lambda: post_image_srcsets(post)
+
+
+def seed(rng):
+    """Insert authors with posts and one reader per follow graph size.
+
+    The readers' timelines are filled the way fan-out on write leaves them.
+    The mixed reader also follows authors that are merged in at read time.
+    """
+    start = datetime(2022, 1, 1)
+    Role.insert_roles()
+    role_id = Role.query.filter_by(default=True).first().id
+    readers = {size: AUTHORS + i + 1 for i, size in enumerate(FOLLOW_GRAPH_SIZES)}
+    mixed_reader = AUTHORS + len(readers) + 1
+    db.session.execute(User.__table__.insert(), [
+        {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "password_hash": "x",
+         "confirmed": True, "role_id": role_id, "fanout_on_read": i <= 5}
+        for i in range(1, mixed_reader + 1)])
+    db.session.execute(Post.__table__.insert(), [
+        {"id": i, "title": f"Post {i}", "raw_body": POST_BODY, "body": POST_BODY, "excerpt": "Intro",
+         "timestamp": start + timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+         "author_id": (i - 1) % AUTHORS + 1}
+        for i in range(1, AUTHORS * POSTS_PER_AUTHOR + 1)])
+    follows = [(reader, author) for size, reader in readers.items()
+               for author in rng.sample(range(6, AUTHORS + 1), size)]
+    follows += [(mixed_reader, author) for author in range(1, 6)]
+    follows += [(mixed_reader, author) for author in rng.sample(range(6, AUTHORS + 1), FOLLOW_GRAPH_SIZES[-1] - 5)]
+    db.session.execute(Follow.__table__.insert(), [
+        {"follower_id": follower, "followed_id": followed, "timestamp": start} for follower, followed in follows])
+    db.session.execute(TimelineEntry.__table__.insert().from_select(
+        ["user_id", "post_id", "author_id", "timestamp"],
+        db.select(Follow.follower_id, Post.id, Post.author_id, Post.timestamp)
+        .join(Follow, Follow.followed_id == Post.author_id)
+        .join(User, User.id == Post.author_id)
+        .where(User.fanout_on_read.is_(False))))
+    db.session.commit()
+    User.recount()
+    readers["mixed"] = mixed_reader
+    return {
+        "readers": {size: User.query.get(reader) for size, reader in readers.items()},
+        "post": Post.query.get(1),
+    }
+
+
+def measure(fn, repeat):
+    """Return the per-call times of repeat samples and the loops per sample."""
+    timer = timeit.Timer(fn)
+    loops, _ = timer.autorange()
+    return [total / loops for total in timer.repeat(repeat=repeat, number=loops)], loops
+
+
+def mann_whitney_slower(old, new):
+    """One-sided p-value of new being slower than old (normal approximation, tie corrected)."""
+    combined = sorted([(value, 0) for value in old] + [(value, 1) for value in new])
+    ranks = [0.0] * len(combined)
+    ties = 0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        ties += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    n1, n2 = len(old), len(new)
+    u = sum(rank for rank, (_, sample) in zip(ranks, combined) if sample == 1) - n2 * (n2 + 1) / 2
+    n = n1 + n2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = (u - n1 * n2 / 2) / sigma
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def summary(samples):
+    quartiles = statistics.quantiles(samples, n=4)
+    return {"median": statistics.median(samples), "iqr": quartiles[2] - quartiles[0],
+            "min": min(samples), "mean": statistics.fmean(samples)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="pattern", default="*", help="run the benchmarks matching this glob")
+    parser.add_argument("--repeat", type=int, default=15, help="samples per benchmark")
+    parser.add_argument("--save", help="write the results as a JSON baseline to this file")
+    parser.add_argument("--baseline", help="compare with the results in this file")
+    parser.add_argument("--alpha", type=float, default=0.01, help="significance level of a regression")
+    parser.add_argument("--min-change", type=float, default=0.05,
+                        help="smallest relative growth of the median reported as a regression")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["benchmarks"]
+
+    app = create_app("testing")
+    results = {}
+    regressions = []
+    with tempfile.TemporaryDirectory() as directory, app.test_request_context():
+        app.config.update(EMB_MEDIA_ROOT=os.path.join(directory, "media"))
+        db.create_all()
+        data = seed(Random(args.seed))
+        data["directory"] = directory
+        data["jpeg"] = os.path.join(directory, "source.jpg")
+        Image.radial_gradient("L").resize((1600, 1200)).convert("RGB").save(data["jpeg"], "JPEG", quality=90)
+
+        print(f"{'benchmark':<46} {'median':>10} {'iqr':>10} {'loops':>7}  {'change':>8} {'p':>8}")
+        for name, setup in BENCHMARKS.items():
+            if not fnmatch.fnmatch(name, args.pattern):
+                continue
+            samples, loops = measure(setup(data), args.repeat)
+            results[name] = dict(summary(samples), loops=loops, samples=samples)
+            line = f"{name:<46} {format_time(results[name]['median']):>10} " \
+                   f"{format_time(results[name]['iqr']):>10} {loops:>7}"
+            old = baseline.get(name)
+            if old is not None:
+                change = results[name]["median"] / old["median"] - 1
+                p = mann_whitney_slower(old["samples"], samples)
+                line += f"  {change:>+8.1%} {p:>8.4f}"
+                if p < args.alpha and change > args.min_change:
+                    regressions.append(name)
+                    line += "  REGRESSION"
+            print(line)
+        db.session.remove()
+        db.drop_all()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "meta": {"time": datetime.utcnow().isoformat(), "revision": git_revision(),
+                         "python": platform.python_version(), "machine": platform.machine(),
+                         "repeat": args.repeat},
+                "benchmarks": results,
+            }, f, indent=2)
+    if regressions:
+        print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
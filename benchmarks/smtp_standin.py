@@ -0,0 +1,92 @@
+"""Local SMTP stand-in that accepts and discards mail.
+
+Speaks just enough SMTP for flask_mail (no TLS or AUTH) and counts the
+connections and messages it receives. --connect-latency and --latency add
+artificial delays to the greeting and to each accepted message so a remote
+server's round trips can be approximated offline.
+
+Usage: python benchmarks/smtp_standin.py [--port 8025] [--latency SECONDS]
+Point the app at it with MAIL_SERVER=localhost MAIL_PORT=8025 MAIL_USE_TLS=false.
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, connect_latency=0.0, latency=0.0):
+        super().__init__(address, _SMTPHandler)
+        self.connect_latency = connect_latency
+        self.latency = latency
+        self.connections = 0
+        self.messages = 0
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def start(self):
+        """Serve from a daemon thread and return the server."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        server.count("connections")
+        time.sleep(server.connect_latency)
+        self.reply("220 localhost SMTP stand-in")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().split(" ", 1)[0].upper()
+            if command == "EHLO":
+                self.reply("250-localhost")
+                self.reply("250 8BITMIME")
+            elif command in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                time.sleep(server.latency)
+                server.count("messages")
+                self.reply("250 OK queued")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--connect-latency", type=float, default=0.0, help="delay before the greeting")
+    parser.add_argument("--latency", type=float, default=0.0, help="delay per accepted message")
+    args = parser.parse_args()
+
+    server = SMTPStandIn((args.host, args.port), args.connect_latency, args.latency)
+    print(f"SMTP stand-in listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"{server.messages} messages over {server.connections} connections")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,17 +13,55 @@ class Config:
     EMB_MAIL_SUBJECT_PREFIX = '[EMB]'
     EMB_MAIL_SENDER = os.environ.get("EMB_MAIL_SENDER")
     EMB_ADMIN_EMAIL = os.environ.get('EMB_ADMIN_EMAIL')
+    # outgoing mail is queued and sent by this many threads over reused SMTP connections
+    EMB_MAIL_WORKERS = int(os.environ.get("EMB_MAIL_WORKERS", "2"))
+    EMB_MAIL_QUEUE_SIZE = int(os.environ.get("EMB_MAIL_QUEUE_SIZE", "1000"))
+    # repeats of an error mailed to EMB_ADMIN_EMAIL are sent as one digest per window
+    EMB_ERROR_MAIL_DIGEST_WINDOW = int(os.environ.get("EMB_ERROR_MAIL_DIGEST_WINDOW", "300"))
+    EMB_ERROR_MAIL_QUEUE_SIZE = 1000
 
     SSL_REDIRECT = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_RECORD_QUERIES = True
+    SQLALCHEMY_RECORD_QUERIES = False
+    # queries slower than this are logged, see `flask query-report`
     EMB_SLOW_DB_QUERY_TIME = 0.5
+    EMB_QUERY_SAMPLE_RATE = float(os.environ.get("EMB_QUERY_SAMPLE_RATE", "0.01"))
+    # keep the bound values of sampled queries, honoured in debug mode only
+    EMB_QUERY_SAMPLE_PARAMETERS = os.environ.get("EMB_QUERY_SAMPLE_PARAMETERS", "").lower() in ["true", "on", "1"]
+    # report each request's query count and DB time in response headers, for load tests
+    EMB_DB_STATS_HEADERS = os.environ.get("EMB_DB_STATS_HEADERS", "").lower() in ["true", "on", "1"]
+    # /metrics answers requests with this bearer token or from these addresses or networks
+    EMB_METRICS_TOKEN = os.environ.get("EMB_METRICS_TOKEN")
+    EMB_METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get("EMB_METRICS_ALLOWED_IPS", "").split(",") if ip.strip()]
+    # views going over their @query_budget raise instead of logging a warning
+    EMB_QUERY_BUDGET_RAISE = False
+    # last_seen may lag this many seconds behind; pings are written in bulk
+    EMB_LAST_SEEN_PRECISION = int(os.environ.get("EMB_LAST_SEEN_PRECISION", "60"))
+    EMB_LAST_SEEN_BUFFER_SIZE = 500
+    # verified API tokens are trusted for this many seconds without a DB lookup
+    EMB_TOKEN_CACHE_TTL = int(os.environ.get("EMB_TOKEN_CACHE_TTL", "300"))
+    EMB_TOKEN_CACHE_SIZE = 1024
+    # cached tokens are checked for revocation in another worker this often
+    EMB_TOKEN_CACHE_REVALIDATE = int(os.environ.get("EMB_TOKEN_CACHE_REVALIDATE", "10"))
+    # changing the method rehashes passwords on the next successful login
+    EMB_PASSWORD_HASH_METHOD = os.environ.get("EMB_PASSWORD_HASH_METHOD", "pbkdf2:sha256:260000")
+    EMB_PASSWORD_SALT_LENGTH = 16
+    EMB_PASSWORD_HASH_WORKERS = int(os.environ.get("EMB_PASSWORD_HASH_WORKERS", "2"))
+    EMB_PASSWORD_HASH_QUEUE_DEPTH = int(os.environ.get("EMB_PASSWORD_HASH_QUEUE_DEPTH", "16"))
+    # background threads resizing uploaded images, 0 processes them in the request
+    EMB_IMAGE_WORKERS = int(os.environ.get("EMB_IMAGE_WORKERS", "2"))
+    EMB_POST_IMAGE_WIDTHS = [320, 640, 960, 1280]
+    # whitelisted <width>x<height> sizes for /media/renditions/
+    EMB_RENDITION_SIZES = ["96x96", "192x192", "512x512"]
+    EMB_RENDITION_CACHE_MAX_BYTES = int(os.environ.get("EMB_RENDITION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
 
     LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT')
 
     EMB_POSTS_PER_PAGE = 6
     EMB_FOLLOWERS_PER_PAGE = 6
     EMB_COMMENTS_PER_PAGE = 10
+    # authors with more followers are merged into timelines at read time
+    EMB_TIMELINE_FANOUT_LIMIT = int(os.environ.get("EMB_TIMELINE_FANOUT_LIMIT", "1000"))
 
     @staticmethod
     def init_app(app):
@@ -41,6 +79,14 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite://'
     WTF_CSRF_ENABLED = False
+    EMB_QUERY_BUDGET_RAISE = True
+    EMB_LAST_SEEN_PRECISION = 0
+    EMB_PASSWORD_HASH_WORKERS = 0
+    EMB_IMAGE_WORKERS = 0
+    EMB_MAIL_WORKERS = 0
+    EMB_QUERY_SAMPLE_RATE = 0
+    # test runs and benchmarks leave no stats files behind
+    EMB_QUERY_STATS_DIR = None
 
 
 class ProductionConfig(Config):
@@ -51,16 +97,17 @@ class ProductionConfig(Config):
     def init_app(cls, app):
         Config.init_app(app)
 
-        # email errors to the administrators
+        # email errors to the administrators from a background thread,
+        # repeats of the same error are batched into digests
         import logging
-        from logging.handlers import SMTPHandler
+        from app.error_mail import ErrorMailHandler, install_error_mail
         credentials = None
         secure = None
         if getattr(cls, 'MAIL_USERNAME', None) is not None:
             credentials = (cls.MAIL_USERNAME, cls.MAIL_PASSWORD)
             if getattr(cls, 'MAIL_USE_TLS', None):
                 secure = ()
-        mail_handler = SMTPHandler(
+        mail_handler = ErrorMailHandler(
             mailhost=(cls.MAIL_SERVER, cls.MAIL_PORT),
             fromaddr=cls.EMB_MAIL_SENDER,
             toaddrs=[cls.EMB_ADMIN_EMAIL],
@@ -68,7 +115,7 @@ class ProductionConfig(Config):
             credentials=credentials,
             secure=secure)
         mail_handler.setLevel(logging.ERROR)
-        app.logger.addHandler(mail_handler)
+        install_error_mail(app, mail_handler, cls.EMB_ERROR_MAIL_DIGEST_WINDOW, cls.EMB_ERROR_MAIL_QUEUE_SIZE)
 
 
 class HerokuConfig(ProductionConfig):
@@ -8,6 +8,7 @@ from app.models.follows_model import Follow
 from app.models.users_model import User
 from app.models.posts_model import Post
 from app.models.comments_model import Comment
+from app.models.timeline_model import TimelineEntry
 
 
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
@@ -27,4 +28,5 @@ def inject_permissions():
 
 @app.shell_context_processor
 def make_shell_context():
-    return dict(db=db, User=User, Follow=Follow, Role=Role, Permission=Permission, Post=Post, Comment=Comment)
+    return dict(db=db, User=User, Follow=Follow, Role=Role, Permission=Permission, Post=Post, Comment=Comment,
+                TimelineEntry=TimelineEntry)
@@ -0,0 +1,50 @@
+"""Add Timeline Entries
+
+Revision ID: 3c1f9a7d2b54
+Revises: ae2bc00867e3
+Create Date: 2026-10-18 09:12:41.503218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f9a7d2b54'
+down_revision = 'ae2bc00867e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('timeline_entries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+    op.create_index('ix_timeline_entries_user_id_timestamp', 'timeline_entries', ['user_id', 'timestamp'], unique=False)
+    op.add_column('users', sa.Column('fanout_on_read', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+    # backfill the timelines from the existing posts and follows
+    op.execute(
+        'INSERT INTO timeline_entries (user_id, post_id, author_id, timestamp) '
+        'SELECT author_id, id, author_id, timestamp FROM posts'
+    )
+    op.execute(
+        'INSERT INTO timeline_entries (user_id, post_id, author_id, timestamp) '
+        'SELECT follows.follower_id, posts.id, posts.author_id, posts.timestamp '
+        'FROM follows JOIN posts ON follows.followed_id = posts.author_id '
+        'WHERE follows.follower_id != posts.author_id'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('fanout_on_read')
+    op.drop_index('ix_timeline_entries_user_id_timestamp', table_name='timeline_entries')
+    op.drop_table('timeline_entries')
@@ -0,0 +1,43 @@
+"""Add Counter Columns
+
+Revision ID: 8d2e61b0f4a7
+Revises: 3c1f9a7d2b54
+Create Date: 2026-10-18 10:03:17.286492
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e61b0f4a7'
+down_revision = '3c1f9a7d2b54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('post_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('follower_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('followed_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute(
+        'UPDATE posts SET comment_count = '
+        '(SELECT count(*) FROM comments WHERE comments.post_id = posts.id)'
+    )
+    op.execute(
+        'UPDATE users SET '
+        'post_count = (SELECT count(*) FROM posts WHERE posts.author_id = users.id), '
+        'follower_count = (SELECT count(*) FROM follows WHERE follows.followed_id = users.id), '
+        'followed_count = (SELECT count(*) FROM follows WHERE follows.follower_id = users.id)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('followed_count')
+        batch_op.drop_column('follower_count')
+        batch_op.drop_column('post_count')
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('comment_count')
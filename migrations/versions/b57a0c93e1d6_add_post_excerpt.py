@@ -0,0 +1,41 @@
+"""Add Post Excerpt
+
+Revision ID: b57a0c93e1d6
+Revises: 8d2e61b0f4a7
+Create Date: 2026-10-18 11:26:54.918305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from markupsafe import Markup
+
+
+# revision identifiers, used by Alembic.
+revision = 'b57a0c93e1d6'
+down_revision = '8d2e61b0f4a7'
+branch_labels = None
+depends_on = None
+
+
+def make_excerpt(body, length=150, leeway=5):
+    # frozen copy of app.sanitizer.make_excerpt
+    text = Markup(body).striptags()
+    if len(text) <= length + leeway:
+        return text
+    return text[:length - 3].rsplit(" ", 1)[0] + "..."
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('excerpt', sa.Unicode(length=160), nullable=True))
+
+    posts = sa.table('posts', sa.column('id', sa.Integer), sa.column('body', sa.UnicodeText),
+                     sa.column('excerpt', sa.Unicode))
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(posts.c.id, posts.c.body)).fetchall()
+    for id, body in rows:
+        connection.execute(posts.update().where(posts.c.id == id).values(excerpt=make_excerpt(body)))
+
+
+def downgrade():
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('excerpt')
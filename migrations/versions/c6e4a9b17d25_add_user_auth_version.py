@@ -0,0 +1,25 @@
+"""Add User Auth Version
+
+Revision ID: c6e4a9b17d25
+Revises: 5b8e2c7d9f31
+Create Date: 2026-10-19 10:21:47.630914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6e4a9b17d25'
+down_revision = '5b8e2c7d9f31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('auth_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('auth_version')
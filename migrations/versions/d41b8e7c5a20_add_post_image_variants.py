@@ -0,0 +1,30 @@
+"""Add Post Image Variants
+
+Revision ID: d41b8e7c5a20
+Revises: b57a0c93e1d6
+Create Date: 2026-10-18 12:40:08.115673
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41b8e7c5a20'
+down_revision = 'b57a0c93e1d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('image_variants', sa.String(length=128), nullable=True))
+    op.execute(
+        "UPDATE posts SET image_variants = "
+        "'jpg:320,640,960,1280 webp:320,640,960,1280 avif:320,640,960,1280' "
+        "WHERE image = 'default_post_image.jpg' OR image IS NULL"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('image_variants')
@@ -0,0 +1,35 @@
+"""Timeline Read Path
+
+Revision ID: e5a7c1d93b68
+Revises: c6e4a9b17d25
+Create Date: 2026-10-20 09:12:05.418263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c1d93b68'
+down_revision = 'c6e4a9b17d25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('fanout_on_read_followed_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        'UPDATE users SET fanout_on_read_followed_count = ('
+        'SELECT count(*) FROM follows JOIN users AS followed ON followed.id = follows.followed_id '
+        'WHERE follows.follower_id = users.id AND followed.fanout_on_read)'
+    )
+    op.create_index('ix_timeline_entries_user_id_timestamp_post_id', 'timeline_entries',
+                    ['user_id', 'timestamp', 'post_id'], unique=False)
+    op.drop_index('ix_timeline_entries_user_id_timestamp', table_name='timeline_entries')
+
+
+def downgrade():
+    op.create_index('ix_timeline_entries_user_id_timestamp', 'timeline_entries', ['user_id', 'timestamp'], unique=False)
+    op.drop_index('ix_timeline_entries_user_id_timestamp_post_id', table_name='timeline_entries')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('fanout_on_read_followed_count')
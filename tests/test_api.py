@@ -1,12 +1,17 @@
 import unittest
 import json
 import re
+import time
+from unittest import mock
 from base64 import b64encode
+from datetime import datetime, timedelta
 from app import create_app, db
 from app.models.comments_model import Comment
 from app.models.posts_model import Post
 from app.models.roles_model import Role
 from app.models.users_model import User
+from app.api_v1.auth import verify_token
+from app.api_v1.serializers import comments_to_json, posts_to_json, url_template
 
 
 class APITestCase(unittest.TestCase):
@@ -265,3 +270,211 @@ class APITestCase(unittest.TestCase):
         json_response = json.loads(response.get_data(as_text=True))
         self.assertIsNotNone(json_response.get('comments'))
         self.assertEqual(json_response.get('count', 0), 2)
+
+    def add_posts(self, count):
+        r = Role.query.filter_by(name='User').first()
+        u = User(email='john@example.com', password='cat', confirmed=True,
+                 role=r)
+        start = datetime(2022, 1, 1)
+        posts = [Post(title=f'Post {i}', raw_body='body', author=u,
+                      timestamp=start + timedelta(hours=i))
+                 for i in range(count)]
+        db.session.add_all([u] + posts)
+        db.session.commit()
+        return [post.id for post in posts]
+
+    def get_json(self, url):
+        response = self.client.get(
+            url, headers=self.get_api_headers('john@example.com', 'cat'))
+        return response.status_code, json.loads(response.get_data(as_text=True))
+
+    def test_posts_cursor(self):
+        self.app.config['EMB_POSTS_PER_PAGE'] = 3
+        ids = self.add_posts(7)[::-1]
+
+        # walk forward to the last page
+        pages = []
+        url = '/api/v1/posts/?cursor='
+        while url:
+            status, json_response = self.get_json(url)
+            self.assertEqual(status, 200)
+            self.assertNotIn('count', json_response)
+            pages.append([int(post['url'].split('/')[-2])
+                          for post in json_response['posts']])
+            url = json_response['next']
+            last = json_response
+        self.assertEqual(pages, [ids[0:3], ids[3:6], ids[6:7]])
+        self.assertIsNone(last['next'])
+
+        # and back to the first one
+        status, json_response = self.get_json(last['prev'])
+        self.assertEqual(status, 200)
+        self.assertEqual([int(post['url'].split('/')[-2])
+                          for post in json_response['posts']], ids[3:6])
+        status, json_response = self.get_json(json_response['prev'])
+        self.assertEqual([int(post['url'].split('/')[-2])
+                          for post in json_response['posts']], ids[0:3])
+        self.assertIsNone(json_response['prev'])
+
+    def test_invalid_cursor(self):
+        self.add_posts(4)
+        self.app.config['EMB_POSTS_PER_PAGE'] = 3
+        status, json_response = self.get_json('/api/v1/posts/?cursor=')
+        cursor = json_response['next'].split('cursor=')[1]
+        tampered = ('A' if cursor[0] != 'A' else 'B') + cursor[1:]
+        for bad in ('not-a-cursor', tampered, cursor[:-4]):
+            status, json_response = self.get_json(
+                f'/api/v1/posts/?cursor={bad}')
+            self.assertEqual(status, 400, bad)
+            self.assertEqual(json_response['error'], 'bad request')
+
+    def test_collection_query_count(self):
+        # a page costs the same number of statements whatever its size
+        self.app.config['EMB_DB_STATS_HEADERS'] = True
+        # compare the counts themselves, not the views' budgets
+        self.app.config['EMB_QUERY_BUDGET_RAISE'] = False
+        r = Role.query.filter_by(name='User').first()
+        u = User(email='john@example.com', password='cat', confirmed=True,
+                 role=r)
+        # every row by a different author, so lazy loads would show
+        authors = [User(email=f'author{i}@example.com', password_hash='x')
+                   for i in range(12)]
+        start = datetime(2022, 1, 1)
+        posts = [Post(title=f'Post {i}', raw_body='body', author=author,
+                      timestamp=start + timedelta(hours=i))
+                 for i, author in enumerate(authors)]
+        post = posts[-1]
+        posts += [Post(title=f'Own post {i}', raw_body='body', author=u,
+                       timestamp=start - timedelta(hours=i))
+                  for i in range(12)]
+        db.session.add_all([u] + posts + [
+            Comment(raw_body=f'Comment {i}', author=author, post=post)
+            for i, author in enumerate(authors)])
+        db.session.commit()
+        for author in authors:
+            u.follow(author)
+        db.session.commit()
+        urls = ['/api/v1/posts/', '/api/v1/posts/?cursor=',
+                f'/api/v1/users/{u.id}/posts/',
+                f'/api/v1/users/{u.id}/timeline/',
+                '/api/v1/comments/', '/api/v1/comments/?cursor=',
+                f'/api/v1/posts/{post.id}/comments/']
+        counts = {}
+        for per_page in (3, 6):
+            self.app.config['EMB_POSTS_PER_PAGE'] = per_page
+            self.app.config['EMB_COMMENTS_PER_PAGE'] = per_page
+            counts[per_page] = []
+            for url in urls:
+                # the requests share the test's session, start each one
+                # without the rows earlier requests loaded
+                db.session.remove()
+                response = self.client.get(
+                    url,
+                    headers=self.get_api_headers('john@example.com', 'cat'))
+                self.assertEqual(response.status_code, 200, url)
+                items = json.loads(response.get_data(as_text=True))
+                self.assertEqual(
+                    len(items.get('posts', items.get('comments'))), per_page)
+                counts[per_page].append(
+                    int(response.headers['X-EMB-DB-Queries']))
+        self.assertEqual(counts[3], counts[6])
+
+    def test_serializers(self):
+        u = User(email='john@example.com', password_hash='x')
+        post = Post(title='Post', raw_body='body', author=u)
+        comment = Comment(raw_body='comment', author=u, post=post)
+        db.session.add_all([u, post, comment])
+        db.session.commit()
+        # the second mount point contains the placeholder id's digits, so
+        # the urls are built by url_for instead of templates
+        for script_root in ('/emb', '/2147483647'):
+            with self.app.test_request_context('/', base_url=f'http://localhost{script_root}/'):
+                self.assertEqual(posts_to_json([post]), [post.to_json()])
+                self.assertEqual(comments_to_json([comment]), [comment.to_json()])
+                self.assertEqual(posts_to_json([post])[0]['url'], f'{script_root}/api/v1/posts/{post.id}/')
+                template = url_template('api_v1_bp.get_post')
+                if script_root == '/emb':
+                    self.assertEqual(template, '/emb/api/v1/posts/{id}/')
+                else:
+                    self.assertIsNone(template)
+
+    def test_cached_token_queries(self):
+        r = Role.query.filter_by(name='User').first()
+        u = User(email='john@example.com', password='cat', confirmed=True,
+                 role=r)
+        db.session.add(u)
+        db.session.commit()
+        token = u.generate_auth_token()
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        db.event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            # every call starts with a new session, like a request
+            with self.app.test_request_context():
+                db.session.remove()
+                self.assertEqual(verify_token(token).id, u.id)
+                self.assertTrue(statements)
+                # a cached token costs no query until it is due a check
+                db.session.remove()
+                statements.clear()
+                self.assertEqual(verify_token(token).id, u.id)
+                self.assertEqual(statements, [])
+
+                db.session.remove()
+                u = User.query.filter_by(email='john@example.com').first()
+                u.password = 'dog'
+                db.session.commit()
+                db.session.remove()
+                statements.clear()
+                later = time.time() + self.app.config['EMB_TOKEN_CACHE_REVALIDATE']
+                with mock.patch('app.token_cache.time', return_value=later):
+                    self.assertIsNone(verify_token(token))
+                self.assertEqual(len(statements), 1)
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', count)
+
+    def test_token_revocation(self):
+        r = Role.query.filter_by(name='User').first()
+        u = User(email='john@example.com', password='cat', confirmed=True,
+                 role=r)
+        db.session.add(u)
+        db.session.commit()
+
+        def get_token():
+            response = self.client.post(
+                '/api/v1/tokens/',
+                headers=self.get_api_headers('john@example.com', 'cat'))
+            return json.loads(response.get_data(as_text=True))['token']
+
+        def get_posts(token):
+            return self.client.get(
+                '/api/v1/posts/',
+                headers=self.get_api_headers(token, '')).status_code
+
+        # the changes below leave this process' token cache alone, like a
+        # change made by another worker, the token's cached copy must not
+        # outlive them once it is revalidated
+        self.app.config['EMB_TOKEN_CACHE_REVALIDATE'] = 0
+        for change in ('password', 'role', 'permissions'):
+            token = get_token()
+            self.assertEqual(get_posts(token), 200)
+            self.assertEqual(get_posts(token), 200)
+            # the requests share the test's session
+            db.session.remove()
+            u = User.query.filter_by(email='john@example.com').first()
+            if change == 'password':
+                u.password = 'dog'
+                db.session.commit()
+                u.password = 'cat'
+            elif change == 'role':
+                u.role = Role.query.filter_by(name='Moderator').first()
+            else:
+                u.role.reset_permissions()
+                db.session.commit()
+                Role.insert_roles()
+            db.session.commit()
+            self.assertEqual(get_posts(token), 401, change)
+            self.assertEqual(get_posts(get_token()), 200, change)
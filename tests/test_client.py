@@ -1,5 +1,6 @@
 import re
 import unittest
+from werkzeug.security import generate_password_hash
 from app import create_app, db
 from app.models.users_model import User
 from app.models.roles_model import Role
@@ -57,3 +58,34 @@ class FlaskClientTestCase(unittest.TestCase):
         response = self.client.get('/auth/logout', follow_redirects=True)
         self.assertEqual(response.status_code, 200)
         self.assertTrue(b'You have been logged out' in response.data)
+
+    def test_login_rehashes_password(self):
+        # a hash made before the iteration count and salt length were raised
+        user = User(email='john@emb.dev', username='john', confirmed=True,
+                    password_hash=generate_password_hash(
+                        'cat', 'pbkdf2:sha256:1000', 8))
+        db.session.add(user)
+        db.session.commit()
+        auth_version = user.auth_version
+
+        response = self.client.post('/auth/login/', data={
+            'email': 'john@emb.dev',
+            'password': 'cat'
+        })
+        self.assertEqual(response.status_code, 302)
+        db.session.remove()
+        user = User.query.filter_by(email='john@emb.dev').first()
+        method, salt, _ = user.password_hash.split('$')
+        self.assertEqual(method, self.app.config['EMB_PASSWORD_HASH_METHOD'])
+        self.assertEqual(len(salt), self.app.config['EMB_PASSWORD_SALT_LENGTH'])
+        self.assertTrue(user.verify_password('cat'))
+        # the password did not change, the user's API tokens stay valid
+        self.assertEqual(user.auth_version, auth_version)
+
+        # only the salt length is older
+        user.password_hash = generate_password_hash(
+            'cat', self.app.config['EMB_PASSWORD_HASH_METHOD'], 8)
+        db.session.commit()
+        self.assertTrue(user.verify_password('cat'))
+        self.assertEqual(len(user.password_hash.split('$')[1]),
+                         self.app.config['EMB_PASSWORD_SALT_LENGTH'])
@@ -0,0 +1,106 @@
+import logging
+import sys
+import threading
+import time
+import unittest
+from queue import Queue
+from unittest import mock
+
+from app import create_app
+from app.error_mail import DigestHandler, DroppingQueueHandler, fingerprint, install_error_mail
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.subject = 'Application Error'
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def make_record(msg='Failed', lineno=1, exc=None):
+    record = logging.makeLogRecord({'name': 'app', 'levelno': logging.ERROR, 'levelname': 'ERROR',
+                                    'msg': msg, 'lineno': lineno})
+    if exc is not None:
+        try:
+            raise exc
+        except type(exc):
+            record.exc_info = sys.exc_info()
+    return record
+
+
+class ErrorMailTestCase(unittest.TestCase):
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint(make_record('Failed %s', 1)), fingerprint(make_record('Failed %s', 1)))
+        self.assertNotEqual(fingerprint(make_record('Failed %s', 1)), fingerprint(make_record('Failed %s', 2)))
+        # the message of an exception does not split its fault
+        self.assertEqual(fingerprint(make_record('/a', exc=ValueError('a'))),
+                         fingerprint(make_record('/b', exc=ValueError('b'))))
+        self.assertNotEqual(fingerprint(make_record(exc=ValueError())), fingerprint(make_record(exc=KeyError())))
+
+    def test_digest(self):
+        target = RecordingHandler()
+        handler = DigestHandler(target, 60, target.subject)
+        for _ in range(3):
+            handler.handle(make_record('Failed'))
+        handler.handle(make_record('Other failure', 2))
+        self.assertEqual([record.msg for record in target.records], ['Failed', 'Other failure'])
+        self.assertIsNotNone(handler._timer)
+
+        handler.flush()
+        self.assertIsNone(handler._timer)
+        digest = target.records[-1]
+        self.assertEqual(digest.mail_subject, 'Application Error digest (2 errors)')
+        self.assertTrue(digest.msg.startswith('2 repeated errors in the last 60 seconds.'))
+        self.assertIn('2 x ERROR in app', digest.msg)
+
+        # nothing to report, no mail
+        handler.flush()
+        self.assertEqual(len(target.records), 3)
+
+    def test_flush_on_interval(self):
+        target = RecordingHandler()
+        handler = DigestHandler(target, 0.05, target.subject)
+        handler.handle(make_record())
+        handler.handle(make_record())
+        deadline = time.monotonic() + 5
+        while len(target.records) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(target.records[-1].mail_subject, 'Application Error digest (1 errors)')
+        # the window has closed, the fault is mailed right away again
+        handler.handle(make_record())
+        self.assertEqual(len(target.records), 3)
+        handler.close()
+
+    def test_dropped_when_full(self):
+        listener = mock.Mock()
+        queue_handler = DroppingQueueHandler(Queue(1), listener)
+        for _ in range(3):
+            queue_handler.handle(make_record())
+        listener.start.assert_called_once_with()
+        self.assertEqual((queue_handler.queue.qsize(), queue_handler.dropped), (1, 2))
+
+        target = RecordingHandler()
+        handler = DigestHandler(target, 60, target.subject, dropped=lambda: queue_handler.dropped)
+        handler.flush()
+        self.assertIn('2 more errors were dropped', target.records[0].msg)
+        # each drop is reported once
+        handler.flush()
+        self.assertEqual(len(target.records), 1)
+
+    def test_install_under_testing(self):
+        app = create_app('testing')
+        self.assertFalse(any(isinstance(handler, DroppingQueueHandler) for handler in app.logger.handlers))
+
+        threads = threading.active_count()
+        with mock.patch('atexit.register'):
+            listener = install_error_mail(app, RecordingHandler(), 60, 10)
+        try:
+            # the listener thread is started by the first error
+            self.assertIsNone(listener._thread)
+            self.assertEqual(threading.active_count(), threads)
+        finally:
+            app.logger.handlers = [handler for handler in app.logger.handlers
+                                   if not isinstance(handler, DroppingQueueHandler)]
@@ -0,0 +1,66 @@
+import unittest
+
+from app import create_app, db
+from app.fake import SEED_EMAIL_DOMAIN, bulk_seed
+from app.models.comments_model import Comment
+from app.models.follows_model import Follow
+from app.models.posts_model import Post
+from app.models.roles_model import Role
+from app.models.timeline_model import TimelineEntry
+from app.models.users_model import User
+
+
+class BulkSeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        # low enough for the most followed authors to be fanned out on read
+        self.app.config['EMB_TIMELINE_FANOUT_LIMIT'] = 5
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def seed(self, seed=1):
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        Role.insert_roles()
+        bulk_seed(users=40, posts=200, comments=300, follows=6, seed=seed, progress=lambda message: None)
+
+    def rows(self):
+        """The seeded rows, without the salted password hashes."""
+        rows = {}
+        for model in (User, Follow, Post, Comment, TimelineEntry):
+            table = model.__table__
+            columns = [column for column in table.columns if column.name != 'password_hash']
+            rows[table.name] = db.session.execute(
+                db.select(*columns).order_by(*table.primary_key.columns)).all()
+        return rows
+
+    def test_deterministic(self):
+        self.seed()
+        rows = self.rows()
+        self.assertEqual(len(rows['users']), 40)
+        self.assertTrue(all(user.email.endswith('@' + SEED_EMAIL_DOMAIN) for user in rows['users']))
+        self.seed()
+        self.assertEqual(self.rows(), rows)
+        self.seed(seed=2)
+        self.assertNotEqual(self.rows()['posts'], rows['posts'])
+
+    def test_counters_and_timelines(self):
+        self.seed()
+        self.assertTrue(User.query.filter_by(fanout_on_read=True).count())
+        rows = self.rows()
+        User.recount()
+        User.update_fanout_modes()
+        self.assertEqual(self.rows(), rows)
+
+        for user in User.query:
+            authors = [user.id] + [follow.followed_id for follow in user.followed]
+            expected = Post.query.filter(Post.author_id.in_(authors)) \
+                .order_by(Post.timestamp.desc(), Post.id.desc())
+            self.assertEqual([post.id for post in user.followed_posts],
+                             [post.id for post in expected], user)
@@ -0,0 +1,72 @@
+import io
+import os
+import tempfile
+import time
+import unittest
+
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from app import create_app, db
+from app.main.image_handler import DEFAULT_PROFILE_IMAGE, PROCESSING_PROFILE_IMAGE, change_profile_image
+from app.media_store import is_media_key
+from app.models.users_model import User
+
+
+class ImagePipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app('testing')
+        # the workers need their own connections to the database
+        self.app.config.update(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory.name, 'test.sqlite'),
+            EMB_IMAGE_WORKERS=2,
+            EMB_IMAGE_UPLOAD_DIR=os.path.join(self.directory.name, 'pending-images'),
+            EMB_MEDIA_ROOT=os.path.join(self.directory.name, 'media'),
+        )
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        user = User(email='john@example.com', password_hash='x', profile_image=PROCESSING_PROFILE_IMAGE)
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        self.request_context = self.app.test_request_context()
+        self.request_context.push()
+
+    def tearDown(self):
+        self.request_context.pop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def upload(self, data):
+        return FileStorage(io.BytesIO(data), filename='upload.png')
+
+    def wait_for_profile_image(self):
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            db.session.remove()
+            profile_image = User.query.get(self.user_id).profile_image
+            if profile_image != PROCESSING_PROFILE_IMAGE:
+                return profile_image
+            time.sleep(0.05)
+        self.fail('the profile image was not processed')
+
+    def test_processed_in_background(self):
+        data = io.BytesIO()
+        Image.new('RGB', (800, 600), 'teal').save(data, 'PNG')
+        change_profile_image(self.upload(data.getvalue()), self.user_id)
+        profile_image = self.wait_for_profile_image()
+        self.assertTrue(is_media_key(profile_image))
+        with Image.open(os.path.join(self.app.config['EMB_MEDIA_ROOT'], profile_image)) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (400, 400)))
+        # the raw upload is removed once processed
+        self.assertEqual(os.listdir(self.app.config['EMB_IMAGE_UPLOAD_DIR']), [])
+
+    def test_failed_processing(self):
+        with self.assertLogs(self.app.logger, 'ERROR'):
+            change_profile_image(self.upload(b'not an image'), self.user_id)
+            self.assertEqual(self.wait_for_profile_image(), DEFAULT_PROFILE_IMAGE)
+        self.assertEqual(os.listdir(self.app.config['EMB_IMAGE_UPLOAD_DIR']), [])
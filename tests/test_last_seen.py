@@ -0,0 +1,69 @@
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from app import create_app, db, last_seen_buffer
+from app.models.users_model import User
+
+
+class LastSeenBufferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['EMB_LAST_SEEN_PRECISION'] = 60
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(email='john@example.com', password_hash='x', last_seen=datetime(2022, 1, 1))
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        last_seen_buffer.flush()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def stored_last_seen(self):
+        db.session.commit()
+        return db.session.execute(db.select(User.last_seen).where(User.id == self.user.id)).scalar()
+
+    def test_ping_is_buffered(self):
+        self.user.ping()
+        self.assertGreater(self.user.last_seen, datetime(2022, 1, 1))
+        self.assertEqual(self.stored_last_seen(), datetime(2022, 1, 1))
+        last_seen_buffer.flush()
+        self.assertEqual(self.stored_last_seen(), self.user.last_seen)
+
+    def test_idle_flush(self):
+        # no later ping or exit is needed to write the buffered one
+        self.app.config['EMB_LAST_SEEN_PRECISION'] = 0.2
+        self.user.ping()
+        seen = self.user.last_seen
+        deadline = time.monotonic() + 5
+        while self.stored_last_seen() != seen and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.stored_last_seen(), seen)
+
+    def test_failed_flush_is_retried(self):
+        self.user.ping()
+        seen = self.user.last_seen
+        with mock.patch.object(db.engine, 'begin', side_effect=RuntimeError('database is down')), \
+                self.assertLogs(self.app.logger, 'ERROR'):
+            last_seen_buffer.flush()
+        self.assertEqual(self.stored_last_seen(), datetime(2022, 1, 1))
+        last_seen_buffer.flush()
+        self.assertEqual(self.stored_last_seen(), seen)
+
+    def test_apps_keep_their_own_batch(self):
+        with mock.patch('atexit.register') as register:
+            other = create_app('testing')
+        # one exit hook flushes the batches of all apps
+        self.assertNotIn(last_seen_buffer, [call.args[0].__self__ for call in register.call_args_list])
+        other.config['EMB_LAST_SEEN_PRECISION'] = 60
+        self.user.ping()
+        with other.app_context():
+            last_seen_buffer.flush()
+        self.assertEqual(self.stored_last_seen(), datetime(2022, 1, 1))
+        last_seen_buffer._flush_at_exit()
+        self.assertEqual(self.stored_last_seen(), self.user.last_seen)
@@ -0,0 +1,96 @@
+import smtplib
+import time
+import unittest
+from contextlib import contextmanager
+from threading import Event
+from unittest import mock
+
+from flask_mail import Message
+
+from app import create_app, mail
+from app.mail_queue import MailQueue
+
+
+class FakeConnection:
+    """Stands in for an SMTP connection, sending blocks until released."""
+
+    def __init__(self, fail=0):
+        self.released = Event()
+        self.fail = fail
+        self.sent = []
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    def send(self, message):
+        self.released.wait(10)
+        if self.fail:
+            self.fail -= 1
+            raise smtplib.SMTPServerDisconnected('connection lost')
+        self.sent.append(message.subject)
+
+
+class MailQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(EMB_MAIL_WORKERS=1, EMB_MAIL_QUEUE_SIZE=2, EMB_MAIL_RETRY_BACKOFF=0.01)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.mail_queue = MailQueue(self.app)
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def message(self, i):
+        return Message(f'Message {i}', sender='emb@example.com', recipients=['john@example.com'])
+
+    def test_overflow(self):
+        connection = FakeConnection()
+        with mock.patch.object(mail, 'connect', connection.connect):
+            self.assertTrue(self.mail_queue.send(self.message(0)))
+            # wait until the worker is stuck sending the first message
+            deadline = time.monotonic() + 5
+            while self.mail_queue._queue.qsize() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(self.mail_queue.send(self.message(1)))
+            self.assertTrue(self.mail_queue.send(self.message(2)))
+
+            # a full queue drops the message without waiting for room
+            start = time.monotonic()
+            with self.assertLogs(self.app.logger, 'ERROR'):
+                self.assertFalse(self.mail_queue.send(self.message(3)))
+            self.assertLess(time.monotonic() - start, 0.1)
+            stats = self.mail_queue.stats()
+            self.assertEqual((stats['dropped'], stats['depth'], stats['capacity']), (1, 2, 2))
+
+            connection.released.set()
+            self.assertTrue(self.mail_queue.join(5))
+        self.assertEqual(connection.sent, ['Message 0', 'Message 1', 'Message 2'])
+        self.assertEqual(self.mail_queue.stats()['sent'], 3)
+
+    def test_retry(self):
+        connection = FakeConnection(fail=2)
+        connection.released.set()
+        with mock.patch.object(mail, 'connect', connection.connect), \
+                self.assertLogs(self.app.logger, 'WARNING'):
+            self.mail_queue.send(self.message(0))
+            deadline = time.monotonic() + 5
+            while not connection.sent and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(connection.sent, ['Message 0'])
+        stats = self.mail_queue.stats()
+        self.assertEqual((stats['sent'], stats['retried'], stats['failed']), (1, 2, 0))
+
+    def test_join_waits_for_retries(self):
+        self.app.config['EMB_MAIL_RETRY_BACKOFF'] = 0.2
+        connection = FakeConnection(fail=1)
+        connection.released.set()
+        with mock.patch.object(mail, 'connect', connection.connect), \
+                self.assertLogs(self.app.logger, 'WARNING'):
+            self.mail_queue.send(self.message(0))
+            self.assertFalse(self.mail_queue.join(0.1))
+            self.assertEqual(self.mail_queue.depth, 1)
+            self.assertTrue(self.mail_queue.join(5))
+        self.assertEqual(connection.sent, ['Message 0'])
+        self.assertEqual(self.mail_queue.depth, 0)
@@ -0,0 +1,131 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app, db, media_store
+from app.models.media_model import MediaBlob
+from app.models.users_model import User
+
+
+class MediaStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app('testing')
+        self.app.config.update(EMB_MEDIA_ROOT=self.directory.name, EMB_MEDIA_GC_GRACE=60)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def put(self, data):
+        blob, created = media_store.put(data, 'jpg')
+        db.session.commit()
+        return blob.key, created
+
+    def refcount(self, key):
+        db.session.remove()
+        return MediaBlob.query.get(key).refcount
+
+    def age(self, key):
+        """Make the blob and its files older than the grace period."""
+        past = datetime.utcnow() - timedelta(hours=1)
+        MediaBlob.query.filter_by(key=key).update({MediaBlob.timestamp: past})
+        db.session.commit()
+        stem, ext = os.path.splitext(media_store.path(key))
+        for name in os.listdir(os.path.dirname(stem)):
+            os.utime(os.path.join(os.path.dirname(stem), name), (time.time() - 3600,) * 2)
+
+    def test_deduplicated(self):
+        key, created = self.put(b'image')
+        self.assertTrue(created)
+        self.assertEqual(self.put(b'image'), (key, False))
+        self.assertEqual(MediaBlob.query.count(), 1)
+        self.assertEqual(os.listdir(os.path.dirname(media_store.path(key))), [os.path.basename(key)])
+        self.assertNotEqual(self.put(b'other image')[0], key)
+
+    def test_refcount(self):
+        key, _ = self.put(b'image')
+        other, _ = self.put(b'other image')
+        user = User(email='john@example.com', password_hash='x', profile_image=key)
+        db.session.add_all([user, User(email='susan@example.com', password_hash='x', profile_image=key)])
+        db.session.commit()
+        self.assertEqual(self.refcount(key), 2)
+
+        user = User.query.filter_by(email='john@example.com').first()
+        user.profile_image = other
+        db.session.commit()
+        self.assertEqual((self.refcount(key), self.refcount(other)), (1, 1))
+
+        db.session.delete(User.query.filter_by(email='susan@example.com').first())
+        db.session.commit()
+        self.assertEqual((self.refcount(key), self.refcount(other)), (0, 1))
+
+    def test_collect_garbage(self):
+        key, _ = self.put(b'image')
+        other, _ = self.put(b'other image')
+        db.session.add(User(email='john@example.com', password_hash='x', profile_image=other))
+        db.session.commit()
+        stem, ext = os.path.splitext(media_store.path(key))
+        open(stem + '_320' + ext, 'wb').close()
+        self.age(key)
+        self.age(other)
+
+        self.assertEqual(MediaBlob.collect_garbage(), 1)
+        self.assertIsNone(MediaBlob.query.get(key))
+        self.assertFalse(os.path.exists(media_store.path(key)))
+        self.assertFalse(os.path.exists(stem + '_320' + ext))
+        self.assertTrue(os.path.exists(media_store.path(other)))
+        self.assertEqual(self.refcount(other), 1)
+
+    def test_grace_period(self):
+        # an upload whose referencing row is not committed yet
+        key, _ = self.put(b'image')
+        self.assertEqual(MediaBlob.collect_garbage(), 0)
+        self.assertTrue(os.path.exists(media_store.path(key)))
+
+        # reusing an unreferenced blob restarts its grace period
+        self.age(key)
+        self.assertEqual(self.put(b'image'), (key, False))
+        self.assertEqual(MediaBlob.collect_garbage(), 0)
+        self.assertTrue(os.path.exists(media_store.path(key)))
+
+    def test_reused_after_collected(self):
+        blob, _ = media_store.put(b'image', 'jpg')
+        key = blob.key
+        db.session.commit()
+        self.age(key)
+        self.assertEqual(MediaBlob.collect_garbage(), 1)
+        # the blob is stored again rather than returned without its file
+        self.assertEqual(self.put(b'image'), (key, True))
+        self.assertTrue(os.path.exists(media_store.path(key)))
+
+    def test_rolled_back_upload(self):
+        blob, _ = media_store.put(b'image', 'jpg')
+        key = blob.key
+        db.session.rollback()
+        self.assertIsNone(MediaBlob.query.get(key))
+        tmp_path = os.path.join(os.path.dirname(media_store.path(key)), '.upload-interrupted')
+        open(tmp_path, 'wb').close()
+
+        # young files may belong to an upload that is still in progress
+        self.assertEqual(MediaBlob.collect_garbage(), 0)
+        self.assertTrue(os.path.exists(media_store.path(key)))
+        # a put of the same data stores the row for the file left behind
+        self.assertEqual(self.put(b'image'), (key, True))
+        self.age(key)
+        self.assertEqual(MediaBlob.collect_garbage(), 1)
+        self.assertFalse(os.path.exists(tmp_path))
+
+        blob, _ = media_store.put(b'other image', 'jpg')
+        key = blob.key
+        db.session.rollback()
+        self.age(key)
+        self.assertEqual(MediaBlob.collect_garbage(), 1)
+        self.assertFalse(os.path.exists(media_store.path(key)))
@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime
+from ipaddress import ip_network
+
+from flask import Flask
+
+from app import create_app, db
+from app.metrics import RequestMetrics
+from app.models.roles_model import Permission, Role
+from app.models.users_model import User
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(EMB_METRICS_TOKEN='scrape-token', EMB_METRICS_ALLOWED_IPS=[ip_network('10.0.0.0/8')])
+        # the error pages need what the blueprint's context processor provides
+        self.app.context_processor(lambda: {'utcnow': datetime.utcnow(), 'Permission': Permission})
+        self.client = self.app.test_client()
+
+    def scrape(self, headers=None, address='192.168.1.1'):
+        return self.client.get('/metrics', headers=headers, environ_base={'REMOTE_ADDR': address})
+
+    def test_bearer_token(self):
+        response = self.scrape({'Authorization': 'Bearer scrape-token'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'emb_mail_queue_depth', response.data)
+        self.assertEqual(self.scrape({'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.scrape().status_code, 403)
+
+    def test_allowed_ips(self):
+        self.assertEqual(self.scrape(address='10.1.2.3').status_code, 200)
+        self.assertEqual(self.scrape(address='11.1.2.3').status_code, 403)
+        self.assertEqual(self.scrape(address='::1').status_code, 403)
+
+    def test_allowed_ips_parsed_once(self):
+        app = Flask(__name__)
+        app.config['EMB_METRICS_ALLOWED_IPS'] = ['10.0.0.0/8', '::1']
+        RequestMetrics(app)
+        self.assertEqual(app.config['EMB_METRICS_ALLOWED_IPS'], [ip_network('10.0.0.0/8'), ip_network('::1')])
+
+        app = Flask(__name__)
+        app.config['EMB_METRICS_ALLOWED_IPS'] = ['10.0.0.0/8', '10.0.0.1/8']
+        with self.assertRaisesRegex(ValueError, "'10.0.0.1/8'"):
+            RequestMetrics(app)
+
+    def test_closed_by_default(self):
+        self.app.config.update(EMB_METRICS_TOKEN=None, EMB_METRICS_ALLOWED_IPS=[])
+        self.assertEqual(self.scrape({'Authorization': 'Bearer '}).status_code, 403)
+        self.assertEqual(self.scrape(address='127.0.0.1').status_code, 403)
+
+    def test_administrator(self):
+        self.app.config.update(EMB_METRICS_TOKEN=None, EMB_METRICS_ALLOWED_IPS=[])
+        with self.app.app_context():
+            db.create_all()
+            Role.insert_roles()
+            db.session.add_all([
+                User(email='john@emb.dev', username='john', password='cat', confirmed=True,
+                     role=Role.query.filter_by(name='Administrator').first()),
+                User(email='susan@emb.dev', username='susan', password='dog', confirmed=True),
+            ])
+            db.session.commit()
+            try:
+                self.client.post('/auth/login/', data={'email': 'susan@emb.dev', 'password': 'dog'})
+                self.assertEqual(self.scrape().status_code, 403)
+                self.client.get('/auth/logout/')
+                self.client.post('/auth/login/', data={'email': 'john@emb.dev', 'password': 'cat'})
+                self.assertEqual(self.scrape().status_code, 200)
+            finally:
+                db.session.remove()
+                db.drop_all()
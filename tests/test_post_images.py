@@ -0,0 +1,69 @@
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+from flask import render_template_string
+
+from app import create_app
+from app.models.posts_model import DEFAULT_IMAGE_VARIANTS, Post
+from app.post import image_handler
+from app.post.image_handler import post_image_srcsets, save_post_image_variants
+
+
+class PostImageVariantsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app('testing')
+        self.app.config['EMB_POST_IMAGE_WIDTHS'] = [320, 640]
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.stem = os.path.join(self.directory.name, 'image')
+
+    def tearDown(self):
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def test_widths(self):
+        variants = save_post_image_variants(Image.new('RGB', (800, 600), 'teal'), self.stem)
+        self.assertTrue(variants.startswith('jpg:320,640'))
+        with Image.open(self.stem + '_320.jpg') as image:
+            self.assertEqual(image.size, (320, 240))
+        # images no wider than the largest width keep their own width too
+        variants = save_post_image_variants(Image.new('RGB', (500, 100), 'teal'), self.stem)
+        self.assertTrue(variants.startswith('jpg:320,500'))
+
+    def test_lists_written_files(self):
+        formats = image_handler.variant_formats() + [('xyz', 'NO-SUCH-FORMAT', {})]
+        with mock.patch.object(image_handler, 'variant_formats', return_value=formats), \
+                self.assertLogs(self.app.logger, 'WARNING'):
+            variants = save_post_image_variants(Image.new('RGB', (800, 600), 'teal'), self.stem)
+        written = sorted(os.listdir(self.directory.name))
+        listed = sorted(f'image_{width}.{ext}' for entry in variants.split()
+                        for ext, widths in [entry.split(':')] for width in widths.split(','))
+        self.assertEqual(written, listed)
+        self.assertNotIn('xyz', variants)
+
+    def test_default_variants_exist(self):
+        static = os.path.join(self.app.static_folder, 'post', 'post-images')
+        for entry in DEFAULT_IMAGE_VARIANTS.split():
+            ext, widths = entry.split(':')
+            for width in widths.split(','):
+                self.assertTrue(os.path.isfile(os.path.join(static, f'default_post_image_{width}.{ext}')))
+
+    def test_srcsets_and_macro(self):
+        post = Post(image='0123abcd.jpg', image_variants='jpg:320,640 webp:320')
+        with self.app.test_request_context():
+            srcsets = post_image_srcsets(post)
+            self.assertEqual(set(srcsets), {'jpg', 'webp'})
+            self.assertRegex(srcsets['jpg'], r'^\S+0123abcd_320\.jpg 320w, \S+0123abcd_640\.jpg 640w$')
+            html = render_template_string(
+                '{% import "_macros.html" as macros %}{{ macros.post_image(post, "50vw", "card", "") }}',
+                post=post)
+        self.assertIn('type="image/webp"', html)
+        self.assertNotIn('image/avif', html)
+        self.assertEqual(len(re.findall(r'srcset=', html)), 2)
+        # posts without variants render a plain image
+        self.assertEqual(post_image_srcsets(Post(image='0123abcd.jpg', image_variants=None)), {})
@@ -0,0 +1,110 @@
+import unittest
+from base64 import b64encode
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.decorators import query_budget
+from app.exceptions import QueryBudgetExceeded
+from app.models.comments_model import Comment
+from app.models.posts_model import Post
+from app.models.roles_model import Permission, Role
+from app.models.users_model import User
+
+
+class QueryBudgetTestCase(unittest.TestCase):
+    """Requests full pages of every budgeted view.
+
+    The pages are filled with posts and comments by different authors, the
+    worst case for lazy loading, and there is enough data for pages twice the
+    default size. EMB_QUERY_BUDGET_RAISE is set in testing, so a view going
+    over its budget fails the request with QueryBudgetExceeded.
+    """
+
+    def setUp(self):
+        self.app = create_app('testing')
+        # registered by emb.py, which the tests do not import
+        self.app.context_processor(lambda: {'utcnow': datetime.utcnow(), 'Permission': Permission})
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client(use_cookies=True)
+
+        per_page = 2 * self.app.config['EMB_POSTS_PER_PAGE']
+        comments_per_page = 2 * self.app.config['EMB_COMMENTS_PER_PAGE']
+        # the login form's Email() validator rejects reserved domains such as example.com
+        self.reader = User(email='reader@emb.dev', username='reader', password='cat', confirmed=True,
+                           role=Role.query.filter_by(name='Moderator').first())
+        authors = [User(email=f'author{i}@example.com', username=f'author{i}', password_hash='x', confirmed=True)
+                   for i in range(per_page + comments_per_page)]
+        # merged into the reader's timeline at read time
+        authors[-1].fanout_on_read = True
+        db.session.add_all([self.reader] + authors)
+        db.session.commit()
+        start = datetime(2022, 1, 1)
+        for i, author in enumerate(authors):
+            self.reader.follow(author)
+            author.follow(self.reader)
+            db.session.add(Post(title=f'Post {i}', raw_body='<p>body</p>', author=author,
+                                timestamp=start + timedelta(hours=i)))
+        db.session.commit()
+        self.post = Post.query.order_by(Post.timestamp.desc()).first()
+        for i, author in enumerate(authors[:comments_per_page]):
+            db.session.add(Comment(raw_body='comment', author=author, post=self.post,
+                                   timestamp=start + timedelta(minutes=i)))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_api_headers(self):
+        credentials = b64encode(b'reader@emb.dev:cat').decode('utf-8')
+        return {'Authorization': 'Basic ' + credentials, 'Accept': 'application/json'}
+
+    def assertWithinBudget(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200, url)
+        endpoint = self.app.url_map.bind('localhost').match(url.split('?')[0])[0]
+        self.assertTrue(hasattr(self.app.view_functions[endpoint], 'query_budget'), f'{endpoint} has no budget')
+        return response
+
+    def test_html_views(self):
+        response = self.client.post('/auth/login/', data={'email': 'reader@emb.dev', 'password': 'cat'})
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinBudget('/post/posts/')
+        self.client.set_cookie('localhost', 'show_followed', '1')
+        self.assertWithinBudget('/post/posts/')
+        self.assertWithinBudget(f'/post/{self.post.author.username}/{self.post.id}/')
+        self.assertWithinBudget('/user/author0/')
+        self.assertWithinBudget('/user/followers/reader/')
+        self.assertWithinBudget('/user/followed_by/reader/')
+        self.assertWithinBudget('/moderate/')
+
+    def test_html_views_with_larger_pages(self):
+        # eager loading keeps the query count independent of the page size
+        for name in ('EMB_POSTS_PER_PAGE', 'EMB_COMMENTS_PER_PAGE', 'EMB_FOLLOWERS_PER_PAGE'):
+            self.app.config[name] *= 2
+        self.test_html_views()
+
+    def test_api_views(self):
+        headers = self.get_api_headers()
+        author = self.post.author
+        for url in ('/api/v1/posts/', f'/api/v1/posts/{self.post.id}/', '/api/v1/comments/',
+                    f'/api/v1/comments/{self.post.comments.first().id}', f'/api/v1/posts/{self.post.id}/comments/',
+                    f'/api/v1/users/{author.id}/', f'/api/v1/users/{author.id}/posts/',
+                    f'/api/v1/users/{self.reader.id}/timeline/'):
+            self.assertWithinBudget(url, headers=headers)
+
+    def test_over_budget(self):
+        @self.app.route('/over-budget/')
+        @query_budget(1)
+        def over_budget():
+            return str(len(User.query.all()) + len(Post.query.all()))
+
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/over-budget/')
+        self.app.config['EMB_QUERY_BUDGET_RAISE'] = False
+        with self.assertLogs(self.app.logger, 'WARNING'):
+            self.assertEqual(self.client.get('/over-budget/').status_code, 200)
@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from app import create_app, db, query_stats
+from app.models.users_model import User
+from app.query_stats import describe_parameters
+
+
+class QueryStatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app('testing')
+        # the plans are captured from another thread, which needs its own connection
+        self.app.config.update(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory.name, 'test.sqlite'),
+            EMB_QUERY_STATS_DIR=os.path.join(self.directory.name, 'query-stats'),
+            EMB_QUERY_SAMPLE_RATE=1,
+        )
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(User(email='john@example.com', password_hash='secret-hash'))
+        db.session.commit()
+        query_stats.reset()
+
+    def tearDown(self):
+        if query_stats._explain_queue is not None:
+            query_stats._explain_queue.join()
+        query_stats.reset()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def sampled_user_query(self):
+        with self.app.test_request_context():
+            User.query.filter_by(email='john@example.com', confirmed=False).first()
+            db.session.remove()
+        query_stats._explain_queue.join()
+        return next(stats for key, stats in query_stats.snapshot().items() if 'FROM users' in key)
+
+    def test_describe_parameters(self):
+        self.assertEqual(describe_parameters(('john@example.com', 1, None)), '(str, int, NULL)')
+        self.assertEqual(describe_parameters({'email': 'john@example.com', 'seen': datetime(2022, 1, 1)}),
+                         '{email: str, seen: datetime}')
+        self.assertEqual(describe_parameters([(1, 'a'), (2, 'b')], executemany=True), '2 x (int, str)')
+
+    def test_samples_hold_no_values(self):
+        stats = self.sampled_user_query()
+        sample = stats['samples'][-1]
+        self.assertEqual(sample['parameters'], '(str, int, int)')
+        # the plan was captured by the explain thread
+        self.assertIn('users', stats['plan']['plan'])
+        query_stats.write()
+        path = os.path.join(self.app.config['EMB_QUERY_STATS_DIR'], f'{os.getpid()}.json')
+        with open(path) as f:
+            written = f.read()
+        self.assertNotIn('john@example.com', written)
+        self.assertIn(stats['samples'][-1]['statement'], json.loads(written)['queries'])
+
+    def test_slow_query_log(self):
+        self.app.config['EMB_SLOW_DB_QUERY_TIME'] = 0
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            self.sampled_user_query()
+        output = '\n'.join(logs.output)
+        self.assertIn('Slow query: SELECT', output)
+        self.assertNotIn('john@example.com', output)
+
+    def test_parameters_in_debug_mode(self):
+        # the flag alone is not enough outside debug mode
+        self.app.config['EMB_QUERY_SAMPLE_PARAMETERS'] = True
+        self.assertEqual(self.sampled_user_query()['samples'][-1]['parameters'], '(str, int, int)')
+        self.app.debug = True
+        query_stats.reset()
+        self.assertIn('john@example.com', self.sampled_user_query()['samples'][-1]['parameters'])
+
+    def test_no_files_without_directory(self):
+        self.app.config.update(EMB_QUERY_STATS_DIR=None, EMB_QUERY_STATS_FLUSH_INTERVAL=0)
+        self.sampled_user_query()
+        query_stats._write_at_exit(self.app)
+        self.assertEqual(os.listdir(self.directory.name), ['test.sqlite'])
+        # the testing config records nothing either
+        self.assertIsNone(create_app('testing').config['EMB_QUERY_STATS_DIR'])
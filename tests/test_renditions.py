@@ -0,0 +1,52 @@
+import io
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from PIL import Image
+
+from app import create_app
+from app.models.roles_model import Permission
+
+
+class RenditionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app('testing')
+        # registered by emb.py, which the tests do not import
+        self.app.context_processor(lambda: {'utcnow': datetime.utcnow(), 'Permission': Permission})
+        self.app.config.update(
+            EMB_MEDIA_ROOT=os.path.join(self.directory.name, 'media'),
+            EMB_RENDITION_CACHE_DIR=os.path.join(self.directory.name, 'renditions'),
+        )
+        os.makedirs(self.app.config['EMB_MEDIA_ROOT'])
+        self.client = self.app.test_client()
+        data = io.BytesIO()
+        Image.new('RGB', (640, 480), 'teal').save(data, 'JPEG')
+        self.jpeg = data.getvalue()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def add_source(self, name, data):
+        with open(os.path.join(self.app.config['EMB_MEDIA_ROOT'], name), 'wb') as f:
+            f.write(data)
+
+    def test_rendition(self):
+        self.add_source('source.jpg', self.jpeg)
+        response = self.client.get('/media/renditions/96x96.jpg/source.jpg')
+        self.assertEqual(response.status_code, 200)
+        with Image.open(io.BytesIO(response.data)) as image:
+            self.assertEqual(image.size, (96, 96))
+        self.assertEqual(self.client.get('/media/renditions/97x97.jpg/source.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/renditions/96x96.jpg/missing.jpg').status_code, 404)
+
+    def test_unreadable_source(self):
+        self.add_source('text.jpg', b'not an image')
+        self.add_source('truncated.jpg', self.jpeg[:len(self.jpeg) // 2])
+        for name in ('text.jpg', 'truncated.jpg'):
+            with self.assertLogs(self.app.logger, 'WARNING'):
+                response = self.client.get(f'/media/renditions/96x96.jpg/{name}')
+            self.assertEqual(response.status_code, 415, name)
+        self.assertEqual(os.listdir(self.app.config['EMB_RENDITION_CACHE_DIR']), [])
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from app import create_app, db, request_profiler
+from app.models.roles_model import Permission, Role
+from app.models.users_model import User
+
+
+class RequestProfilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.profile_dir = os.path.join(self.directory.name, 'profiles')
+        self.app = create_app('testing')
+        self.app.config['EMB_PROFILE_DIR'] = self.profile_dir
+        self.app.context_processor(lambda: {'utcnow': datetime.utcnow(), 'Permission': Permission})
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        user = User(email='john@emb.dev', username='john', password='cat', confirmed=True,
+                    role=Role.query.filter_by(name='Administrator').first())
+        db.session.add(user)
+        db.session.commit()
+        self.token = request_profiler.make_token(user)
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def profiled(self):
+        return self.client.get('/', headers={'X-EMB-Profile': self.token})
+
+    def test_profile_written(self):
+        # created by the first profile, not by create_app
+        self.assertFalse(os.path.exists(self.profile_dir))
+        response = self.profiled()
+        self.assertEqual(response.status_code, 200)
+        name = response.headers['X-EMB-Profile']
+        self.assertEqual(sorted(os.listdir(self.profile_dir)),
+                         [name + '.collapsed', name + '.prof', name + '.txt'])
+
+    def test_token_of_demoted_user(self):
+        user = User.query.filter_by(email='john@emb.dev').first()
+        user.role = Role.query.filter_by(name='User').first()
+        db.session.commit()
+        response = self.profiled()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-EMB-Profile', response.headers)
+        self.assertFalse(os.path.exists(self.profile_dir))
+
+    def test_admin_without_profiles(self):
+        self.client.post('/auth/login/', data={'email': 'john@emb.dev', 'password': 'cat'})
+        response = self.client.get('/admin/profiles/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(os.path.exists(self.profile_dir))
@@ -0,0 +1,76 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import bleach
+from jinja2 import Environment
+
+from app.sanitizer import COMMENT_TAGS, POST_TAGS, Sanitizer, make_excerpt
+
+BODIES = [
+    '',
+    'plain text',
+    '<p>Lorem <strong>ipsum</strong> <em>dolor</em></p>',
+    '<h2>Title</h2><script>alert("xss")</script><p onclick="x()">text</p>',
+    '<img src="x.jpg" onerror="alert(1)"><table><tr><td>cell</td></tr></table>',
+    'see https://example.com/some/path?x=1&y=2 and www.example.org',
+    '<a href="https://example.com">a link</a> <a href="javascript:alert(1)">bad</a>',
+    '<p>unclosed <b>bold <i>italic</p>',
+    '<div><iframe src="https://example.com"></iframe>&lt;escaped&gt; &amp; ünïcode</div>',
+]
+
+
+def reference(value, tags):
+    return bleach.linkify(bleach.clean(value, tags=tags, strip=True))
+
+
+class SanitizerTestCase(unittest.TestCase):
+    def test_same_output_as_bleach(self):
+        for tags in (POST_TAGS, COMMENT_TAGS):
+            sanitizer = Sanitizer(tags)
+            for body in BODIES:
+                expected = reference(body, tags)
+                self.assertEqual(sanitizer.clean(body), expected, body)
+                # and again from the cache
+                self.assertEqual(sanitizer.clean(body), expected, body)
+            self.assertEqual(sanitizer.clean_many(BODIES + BODIES),
+                             [reference(body, tags) for body in BODIES + BODIES])
+
+    def test_cache_is_bounded(self):
+        sanitizer = Sanitizer(POST_TAGS, cache_size=3)
+        for body in BODIES:
+            sanitizer.clean(body)
+        self.assertEqual(len(sanitizer._cache), 3)
+        sanitizer.clean_many([f'<p>{i}</p>' for i in range(10)])
+        self.assertEqual(len(sanitizer._cache), 3)
+
+    def test_threads(self):
+        sanitizer = Sanitizer(POST_TAGS, cache_size=4)
+        bodies = [f'{body} {i}' for i in range(20) for body in BODIES]
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(sanitizer.clean, bodies))
+        self.assertEqual(results, [reference(body, POST_TAGS) for body in bodies])
+
+
+class ExcerptTestCase(unittest.TestCase):
+    def test_short_body(self):
+        self.assertEqual(make_excerpt(''), '')
+        self.assertEqual(make_excerpt('<p>A short post.</p>'), 'A short post.')
+        # within the leeway nothing is cut
+        self.assertEqual(make_excerpt('word ' * 31), ('word ' * 31).strip())
+
+    def test_tags_and_entities(self):
+        self.assertEqual(make_excerpt('<h2>Title</h2>\n<p>Fish &amp; <strong>chips</strong> &lt;3</p>'),
+                         'Title Fish & chips <3')
+
+    def test_truncated_at_word_boundary(self):
+        body = '<p>' + ' '.join(f'word{i}' for i in range(100)) + '</p>'
+        excerpt = make_excerpt(body)
+        self.assertTrue(excerpt.endswith('...'))
+        self.assertLessEqual(len(excerpt), 150)
+        words = excerpt[:-3].split(' ')
+        self.assertEqual(words, [f'word{i}' for i in range(len(words))])
+
+    def test_same_as_template_filters(self):
+        template = Environment().from_string('{{ body|striptags|truncate(150) }}')
+        for body in BODIES + ['<p>' + 'lorem ipsum dolor ' * 20 + '</p>', 'x' * 200]:
+            self.assertEqual(make_excerpt(body), template.render(body=body), body)
@@ -0,0 +1,132 @@
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.models.posts_model import Post
+from app.models.roles_model import Role
+from app.models.timeline_model import TimelineEntry
+from app.models.users_model import User
+
+
+class TimelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        # SQLite only enforces foreign keys when asked to, Postgres always does
+        db.session.execute('PRAGMA foreign_keys=ON')
+        Role.insert_roles()
+        self.reader = User(email='reader@example.com', username='reader', password_hash='x')
+        self.author = User(email='author@example.com', username='author', password_hash='x')
+        db.session.add_all([self.reader, self.author])
+        db.session.commit()
+        self.start = datetime(2022, 1, 1)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_post(self, author, hours=0):
+        post = Post(title='Post', raw_body='body', author=author, timestamp=self.start + timedelta(hours=hours))
+        db.session.add(post)
+        db.session.commit()
+        return post
+
+    def timeline(self, user):
+        return [row.post_id for row in TimelineEntry.query.filter_by(user_id=user.id)
+                .order_by(TimelineEntry.timestamp.desc())]
+
+    def test_insert_post(self):
+        self.reader.follow(self.author)
+        db.session.commit()
+        post = self.add_post(self.author)
+        self.assertEqual(self.timeline(self.reader), [post.id])
+        self.assertEqual(self.timeline(self.author), [post.id])
+        self.assertEqual(self.reader.followed_posts.all(), [post])
+
+    def test_delete_post(self):
+        self.reader.follow(self.author)
+        db.session.commit()
+        post = self.add_post(self.author)
+        db.session.delete(post)
+        db.session.commit()
+        self.assertEqual(TimelineEntry.query.count(), 0)
+        self.assertEqual(self.reader.followed_posts.all(), [])
+
+    def test_follow(self):
+        older = self.add_post(self.author, 0)
+        newer = self.add_post(self.author, 1)
+        self.assertEqual(self.timeline(self.reader), [])
+        self.reader.follow(self.author)
+        db.session.commit()
+        self.assertEqual(self.timeline(self.reader), [newer.id, older.id])
+        self.assertEqual(self.reader.followed_posts.all(), [newer, older])
+
+    def test_unfollow(self):
+        own = self.add_post(self.reader, 0)
+        self.reader.follow(self.author)
+        db.session.commit()
+        self.add_post(self.author, 1)
+        self.reader.unfollow(self.author)
+        db.session.commit()
+        self.assertEqual(self.timeline(self.reader), [own.id])
+        self.assertEqual(self.reader.followed_posts.all(), [own])
+
+    def test_fanout_on_read(self):
+        self.app.config['EMB_TIMELINE_FANOUT_LIMIT'] = 0
+        own = self.add_post(self.reader, 0)
+        self.reader.follow(self.author)
+        db.session.commit()
+        # the first post over the limit switches the author to fan-out on read
+        first = self.add_post(self.author, 1)
+        self.assertTrue(self.author.fanout_on_read)
+        self.assertEqual(self.reader.fanout_on_read_followed_count, 1)
+        second = self.add_post(self.author, 2)
+        self.assertNotIn(second.id, self.timeline(self.reader))
+        self.assertEqual(self.reader.followed_posts.all(), [second, first, own])
+
+        db.session.delete(first)
+        db.session.commit()
+        self.assertEqual(self.reader.followed_posts.all(), [second, own])
+        self.reader.unfollow(self.author)
+        db.session.commit()
+        self.assertEqual(self.reader.fanout_on_read_followed_count, 0)
+        self.assertEqual(self.reader.followed_posts.all(), [own])
+
+    def test_read_path(self):
+        # only readers following a fan-out on read author look up such authors
+        self.reader.follow(self.author)
+        db.session.commit()
+        self.assertNotIn('follows', str(self.reader.followed_posts.statement))
+        self.author.fanout_on_read = True
+        other = User(email='other@example.com', username='other', password_hash='x')
+        db.session.add(other)
+        other.follow(self.author)
+        db.session.commit()
+        self.assertEqual(other.fanout_on_read_followed_count, 1)
+        self.assertIn('follows', str(other.followed_posts.statement))
+
+    def test_update_fanout_modes(self):
+        self.app.config['EMB_TIMELINE_FANOUT_LIMIT'] = 0
+        self.reader.follow(self.author)
+        db.session.commit()
+        first = self.add_post(self.author, 1)
+        second = self.add_post(self.author, 2)
+        self.assertEqual(self.timeline(self.reader), [])
+
+        # back under the limit, the author's posts are fanned out on write again
+        self.app.config['EMB_TIMELINE_FANOUT_LIMIT'] = 1
+        User.update_fanout_modes()
+        self.assertFalse(self.author.fanout_on_read)
+        self.assertEqual(self.reader.fanout_on_read_followed_count, 0)
+        self.assertEqual(self.timeline(self.reader), [second.id, first.id])
+        third = self.add_post(self.author, 3)
+        self.assertEqual(self.reader.followed_posts.all(), [third, second, first])
+
+        self.app.config['EMB_TIMELINE_FANOUT_LIMIT'] = 0
+        User.update_fanout_modes()
+        self.assertTrue(self.author.fanout_on_read)
+        self.assertEqual(self.reader.fanout_on_read_followed_count, 1)
+        self.assertEqual(self.reader.followed_posts.all(), [third, second, first])
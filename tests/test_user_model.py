@@ -1,8 +1,10 @@
 from datetime import datetime
 import unittest
 import time
-from app import create_app, db
+from app import create_app, db, password_hasher
+from app.models.comments_model import Comment
 from app.models.follows_model import Follow
+from app.models.posts_model import Post
 from app.models.roles_model import Permission, Role
 from app.models.users_model import AnonymousUser, User
 
@@ -38,6 +40,15 @@ class UserModelTestCase(unittest.TestCase):
         u2 = User(password='cat')
         self.assertTrue(u.password_hash != u2.password_hash)
 
+    def test_needs_rehash(self):
+        u = User(password='cat')
+        self.assertFalse(password_hasher.needs_rehash(u.password_hash))
+        # werkzeug fills in the default iteration count
+        self.app.config['EMB_PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256'
+        self.assertFalse(password_hasher.needs_rehash(u.password_hash))
+        self.app.config['EMB_PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:600000'
+        self.assertTrue(password_hasher.needs_rehash(u.password_hash))
+
     def test_valid_confirmation_token(self):
         u = User(password='cat')
         db.session.add(u)
@@ -195,6 +206,54 @@ class UserModelTestCase(unittest.TestCase):
         db.session.commit()
         self.assertTrue(Follow.query.count() == 1)
 
+    def test_counters(self):
+        u1 = User(email='john@example.com', password_hash='x')
+        u2 = User(email='susan@example.com', password_hash='x')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        post = Post(title='Post', raw_body='body', author=u1)
+        db.session.add(post)
+        db.session.add(Post(title='Other', raw_body='body', author=u1))
+        u2.follow(u1)
+        db.session.commit()
+        comment = Comment(raw_body='comment', author=u2, post=post)
+        db.session.add(comment)
+        db.session.commit()
+        self.assertEqual((u1.post_count, u1.follower_count, u1.followed_count), (2, 1, 0))
+        self.assertEqual((u2.post_count, u2.follower_count, u2.followed_count), (0, 0, 1))
+        self.assertEqual(post.comment_count, 1)
+
+        db.session.delete(comment)
+        u2.unfollow(u1)
+        db.session.commit()
+        db.session.delete(post)
+        db.session.commit()
+        self.assertEqual((u1.post_count, u1.follower_count), (1, 0))
+        self.assertEqual(u2.followed_count, 0)
+
+        # follows removed without unfollow() are counted too
+        u3 = User(email='david@example.com', password_hash='x')
+        db.session.add(u3)
+        u2.follow(u1)
+        u3.follow(u1)
+        u1.follow(u3)
+        db.session.commit()
+        self.assertEqual((u1.follower_count, u1.followed_count, u3.follower_count), (2, 1, 1))
+        db.session.delete(Follow.query.filter_by(follower=u2, followed=u1).first())
+        db.session.commit()
+        self.assertEqual((u1.follower_count, u2.followed_count), (1, 0))
+        # the follows of a deleted user are deleted with it
+        db.session.delete(u3)
+        db.session.commit()
+        self.assertEqual((u1.follower_count, u1.followed_count), (0, 0))
+
+        # recount rebuilds counters that drifted from the source tables
+        User.query.update({User.post_count: 7, User.follower_count: 7})
+        db.session.commit()
+        User.recount()
+        self.assertEqual((u1.post_count, u1.follower_count), (1, 0))
+        self.assertEqual((u2.post_count, u2.follower_count), (0, 0))
+
     def test_to_json(self):
         u = User(email='john@example.com', password='cat')
         db.session.add(u)